@@ -1,15 +1,47 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
+import asyncio
+import concurrent.futures
 import os
-from perplexity_analyzer import ProductAnalyzer
+import threading
+from async_analyzer import AsyncProductAnalyzer
+import metrics
 
 app = Flask(__name__, static_folder='public')
 CORS(app)
 
+# Tiempo máximo de una petición completa, como ANALYSIS_TIMEOUT_MS en server.js
+ANALYSIS_TIMEOUT = float(os.getenv('ANALYSIS_TIMEOUT', 90))
+
+# Bucle de eventos propio en un hilo aparte: todas las peticiones comparten
+# el mismo analizador asíncrono y, con él, las conexiones abiertas con la API
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name='analyzer-loop', daemon=True).start()
+_analyzer = None
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = AsyncProductAnalyzer()
+    return _analyzer
+
+def run_async(coro, timeout=ANALYSIS_TIMEOUT):
+    """Ejecuta la corrutina en el bucle compartido; si se agota el tiempo la cancela"""
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
 @app.route('/')
 def serve_index():
     return send_from_directory(app.static_folder, 'index.html')
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/<path:path>')
 def serve_static(path):
     return send_from_directory(app.static_folder, path)
@@ -17,10 +49,12 @@ def serve_static(path):
 @app.route('/api/compare', methods=['POST'])
 def compare():
     try:
-        data = request.get_json()
-        analyzer = ProductAnalyzer()
-        result = analyzer.compare_products(data['urls'])
+        with metrics.span('http_request', route='/api/compare'):
+            data = request.get_json()
+            result = run_async(get_analyzer().analyze_products(data['urls']))
         return jsonify(result)
+    except concurrent.futures.TimeoutError:
+        return jsonify({'error': 'El análisis ha tardado demasiado'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
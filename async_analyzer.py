@@ -0,0 +1,302 @@
+import asyncio
+import os
+import threading
+from config import perplexity_settings
+from llm_cache import get_cache
+from url_fingerprint import fingerprint_url, describe
+from single_flight import AsyncSingleFlight
+from product_key import canonicalize_url, product_key, comparison_key, PRODUCT_ANALYSIS
+from metrics import span, record_usage, CACHE_LOOKUPS
+from llm_scheduler import get_scheduler, estimate_tokens
+from product_record import ProductRecord, compact_products, is_valid_record, price_history_of
+from perplexity_analyzer import (
+    MODEL,
+    PRODUCT_CACHE_TTL,
+    STRUCTURED_ANALYSIS,
+    search_messages,
+    record_messages,
+    comparison_messages,
+    recommendation_messages,
+    fetch_product_image
+)
+
+# Tiempo máximo (segundos) de cada llamada si no se indica otro
+SEARCH_TIMEOUT = float(os.getenv('ANALYZER_PRODUCT_TIMEOUT', 60))
+COMPARE_TIMEOUT = float(os.getenv('ANALYZER_COMPARE_TIMEOUT', 90))
+
+# Conexiones con la API que se mantienen abiertas entre peticiones
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 20))
+
+_client = None
+_client_lock = threading.Lock()
+
+# Llamadas idénticas en curso; como el cliente, pertenece al bucle de eventos del proceso
+_flights = AsyncSingleFlight()
+
+
+def get_async_client():
+    """Cliente AsyncOpenAI único del proceso.
+
+    Todos los AsyncProductAnalyzer lo comparten, así que las conexiones
+    keep-alive con la API se reutilizan entre peticiones en lugar de abrir
+    un pool nuevo cada vez. httpx ata esas conexiones al bucle de eventos
+    donde se usan: todas las llamadas deben hacerse desde el mismo bucle
+    (ver app.py).
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            _client = AsyncOpenAI(
+                **perplexity_settings(),
+                timeout=COMPARE_TIMEOUT,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    keepalive_expiry=120
+                ))
+            )
+        return _client
+
+
+class AsyncProductAnalyzer:
+    """Versión asíncrona de ProductAnalyzer.
+
+    Permite atender muchas búsquedas, comparativas y recomendaciones a la
+    vez desde un solo bucle de eventos. Cada método acepta `timeout` en
+    segundos; si se agota, o si se cancela la tarea que espera, se abandona
+    la llamada al modelo (salvo que otra petición idéntica siga esperándola).
+    """
+
+    def __init__(self):
+        self.settings = perplexity_settings()
+        if not self.settings['api_key']:
+            raise ValueError("No se encontró PERPLEXITY_API_KEY en las variables de entorno")
+
+        self._fetch_client = None
+        self.cache = get_cache()
+
+    @property
+    def client(self):
+        return get_async_client()
+
+    @property
+    def fetch_client(self):
+        """Cliente HTTP compartido para las páginas; importa requests en el primer uso"""
+        if self._fetch_client is None:
+            from http_client import get_fetch_client
+            self._fetch_client = get_fetch_client()
+        return self._fetch_client
+
+    async def _complete(self, messages, max_tokens, temperature=0.3, accept=None):
+        """Llama al modelo reutilizando respuestas idénticas ya obtenidas o en
+        curso; con `accept`, solo se guardan las respuestas que lo cumplen"""
+        cache_key = self.cache.make_key(MODEL, temperature, messages)
+        cached = self.cache.get(cache_key)
+        CACHE_LOOKUPS.inc(cache='llm', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            return cached
+
+        return await _flights.do(cache_key, self._request_completion, cache_key, messages, max_tokens, temperature,
+                                 accept)
+
+    async def _request_completion(self, cache_key, messages, max_tokens, temperature, accept=None):
+        async def create():
+            response = await self.client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            record_usage(response.usage, MODEL)
+            return response.choices[0].message.content
+
+        content = await get_scheduler().acall(create, estimate_tokens(messages), max_tokens)
+        if content and (accept is None or accept(content)):
+            self.cache.set(cache_key, content)
+        return content
+
+    def extract_product_info_from_url(self, url):
+        """Extrae información del producto desde la URL"""
+        with span('url_parse'):
+            return describe(fingerprint_url(url))
+
+    async def search_product_info(self, product_description, timeout=SEARCH_TIMEOUT, price_history=None):
+        """Busca información detallada del producto"""
+        try:
+            with span('llm_search'):
+                return await asyncio.wait_for(
+                    self._complete(search_messages(product_description, price_history), max_tokens=1000),
+                    timeout
+                )
+        except asyncio.TimeoutError:
+            print(f"Tiempo agotado buscando: {product_description}")
+            return None
+        except Exception as e:
+            print(f"Error en búsqueda: {str(e)}")
+            return None
+
+    async def search_product_record(self, product_description, timeout=SEARCH_TIMEOUT, price_history=None):
+        """Análisis estructurado del producto (ProductRecord) o None"""
+        try:
+            with span('llm_search', format='json'):
+                content = await asyncio.wait_for(
+                    self._complete(record_messages(product_description, price_history), max_tokens=700, temperature=0.2,
+                                   accept=is_valid_record),
+                    timeout
+                )
+            return ProductRecord.from_llm(content)
+        except asyncio.TimeoutError:
+            print(f"Tiempo agotado buscando: {product_description}")
+            return None
+        except Exception as e:
+            print(f"Error en búsqueda estructurada: {str(e)}")
+            return None
+
+    async def analyze_product(self, product_description, timeout=SEARCH_TIMEOUT, price_history=None):
+        """Como ProductAnalyzer.analyze_product"""
+        if STRUCTURED_ANALYSIS:
+            record = await self.search_product_record(product_description, timeout, price_history)
+            if record:
+                return {"details": record.to_markdown(), "record": record.to_dict()}
+        details = await self.search_product_info(product_description, timeout, price_history)
+        return {"details": details, "record": None} if details else None
+
+    async def try_get_product_image(self, url, timeout=SEARCH_TIMEOUT):
+        """Intenta obtener la imagen del producto.
+
+        La descarga usa requests en un hilo aparte; si se agota el tiempo se
+        deja de esperar, aunque el hilo termine la petición por su cuenta.
+        """
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(fetch_product_image, self.fetch_client, url),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"Tiempo agotado obteniendo imagen: {url}")
+            return None
+
+    async def compare_products(self, products_info, timeout=COMPARE_TIMEOUT):
+        """Compara productos con enfoque en uso real y formato mejorado"""
+        try:
+            with span('llm_compare'):
+                return await asyncio.wait_for(
+                    self._complete(comparison_messages(products_info), max_tokens=2000),
+                    timeout
+                )
+        except asyncio.TimeoutError:
+            print("Tiempo agotado en comparación")
+            return None
+        except Exception as e:
+            print(f"Error en comparación: {str(e)}")
+            return None
+
+    async def get_recommendations(self, product_type, min_budget, max_budget, main_use, specific_needs,
+                                  timeout=COMPARE_TIMEOUT):
+        try:
+            messages = recommendation_messages(product_type, min_budget, max_budget, main_use, specific_needs)
+            with span('llm_recommend'):
+                analysis = await asyncio.wait_for(self._complete(messages, max_tokens=800), timeout)
+
+            return {
+                "success": True,
+                "analysis": analysis
+            }
+
+        except Exception as e:
+            print(f"Error en recomendación: {str(e) or type(e).__name__}")
+            return {
+                "success": False,
+                "error": "No se pudo generar la recomendación. Por favor, intenta de nuevo."
+            }
+
+    async def gather_products_info(self, urls, timeout=SEARCH_TIMEOUT):
+        """Como gather_products_info de perplexity_analyzer, con una tarea
+        por búsqueda e imagen en lugar de un pool de hilos"""
+        stages = []
+        seen = set()
+        for url in urls:
+            key = product_key(url)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            price_history = price_history_of(key)
+            cached = self.cache.get_json(f"{PRODUCT_ANALYSIS}:{key}")
+            CACHE_LOOKUPS.inc(cache='product', result='hit' if cached else 'miss')
+            if cached:
+                stages.append((url, key, cached, price_history, None, None))
+                continue
+
+            url = canonicalize_url(url)
+            product_description = self.extract_product_info_from_url(url)
+            if product_description:
+                stages.append((
+                    url,
+                    key,
+                    None,
+                    price_history,
+                    asyncio.ensure_future(self.analyze_product(product_description, timeout, price_history)),
+                    asyncio.ensure_future(_flights.do(('image', key), self.try_get_product_image, url, timeout))
+                ))
+
+        # Si se cancela la espera, gather cancela también las tareas pendientes
+        await asyncio.gather(*[task for *_, details_task, image_task in stages if details_task
+                               for task in (details_task, image_task)])
+
+        products_info = []
+        for url, key, cached, price_history, details_task, image_task in stages:
+            if cached:
+                products_info.append({"key": key, **cached, "price_history": price_history})
+                continue
+            analysis = details_task.result()
+            image_url = image_task.result()
+            if analysis:
+                product = {
+                    **analysis,
+                    "image": image_url,
+                    "specs": fingerprint_url(url)
+                }
+                if image_url:
+                    self.cache.set_json(f"{PRODUCT_ANALYSIS}:{key}", product, ttl=PRODUCT_CACHE_TTL)
+                products_info.append({"key": key, **product, "price_history": price_history})
+        return products_info
+
+    async def compare_cached(self, products_info, timeout=COMPARE_TIMEOUT):
+        """Compara los productos reutilizando la comparativa del mismo conjunto en cualquier orden"""
+        key = comparison_key([p["key"] for p in products_info])
+        comparison = self.cache.get(key)
+        CACHE_LOOKUPS.inc(cache='comparison', result='hit' if comparison is not None else 'miss')
+        if comparison is not None:
+            return comparison
+
+        comparison = await self.compare_products(compact_products(products_info), timeout)
+        if comparison:
+            self.cache.set(key, comparison)
+        return comparison
+
+    async def analyze_products(self, urls, timeout=SEARCH_TIMEOUT):
+        """Mismo resultado que analyze_products de perplexity_analyzer"""
+        products_info = await self.gather_products_info(urls, timeout)
+
+        if len(products_info) > 1:
+            return {
+                "success": True,
+                "type": "comparison",
+                "analysis": await self.compare_cached(products_info),
+                "products": products_info
+            }
+        if len(products_info) == 1:
+            return {
+                "success": True,
+                "type": "single_product",
+                "analysis": products_info[0]["details"],
+                "image": products_info[0]["image"]
+            }
+        return {
+            "success": False,
+            "error": "No se pudo obtener información de los productos"
+        }
@@ -0,0 +1,119 @@
+"""Proceso de análisis persistente para server.js.
+
+Se arranca una vez, importa el analizador y crea el cliente de Perplexity
+(warm_up, para que la primera petición no pague los imports perezosos),
+y después atiende trabajos por stdin/stdout con un JSON por línea (NDJSON):
+
+    entrada: {"id": 1, "mode": "compare", "params": {"urls": [...], "user_context": "..."}}
+             {"id": 2, "mode": "recommend", "params": {"product_type": "...", ...}, "stream": true}
+             {"id": 3, "mode": "batch", "params": {"jobs": [{"urls": [...], "user_context": "..."}, ...],
+                                                   "concurrency": 4}}
+    salida:  {"type": "ready", "pid": 1234}
+             {"id": 2, "type": "delta", "text": "..."}     (solo con "stream": true)
+             {"id": 3, "type": "item", "index": 0, "result": {...}}   (cada comparativa de un lote)
+             {"id": 1, "type": "result", "result": {...}, "metrics": {...}}
+             {"id": 2, "type": "error", "error": "...", "metrics": {...}}
+
+`metrics` lleva las etapas medidas durante el trabajo y los contadores que
+ha incrementado (ver metrics.collect), para que server.js los sume a los
+suyos en /metrics.
+
+Todo lo que el analizador imprime con print() se desvía a stderr para que
+stdout quede reservado al protocolo.
+"""
+import json
+import os
+import sys
+import threading
+
+# Los lotes envían resultados desde varios hilos: una línea cada vez
+_send_lock = threading.Lock()
+
+
+def open_protocol_channel():
+    """Reserva el stdout real para el protocolo y redirige el resto a stderr"""
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8', buffering=1)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return channel
+
+
+def send(channel, message, encoded_result=None):
+    """Escribe un mensaje; `encoded_result` es el resultado ya serializado"""
+    line = json.dumps(message, ensure_ascii=False)
+    if encoded_result is not None:
+        line = line[:-1] + ', "result": ' + encoded_result + '}'
+    with _send_lock:
+        channel.write(line + "\n")
+        channel.flush()
+
+
+def handle_job(analyzer, mode, params, on_delta=None, on_item=None):
+    """Ejecuta un trabajo y devuelve el resultado serializable"""
+    if mode == 'compare':
+        return analyzer.analyze_products(
+            params.get('urls') or [],
+            params.get('user_context'),
+            on_delta
+        )
+    if mode == 'recommend':
+        return analyzer.get_recommendations(
+            params.get('product_type'),
+            params.get('min_budget'),
+            params.get('max_budget'),
+            params.get('main_use'),
+            params.get('specific_needs'),
+            on_delta
+        )
+    if mode == 'batch':
+        kwargs = {'concurrency': int(params['concurrency'])} if params.get('concurrency') else {}
+        return analyzer.analyze_batch(params.get('jobs') or [], on_item=on_item, **kwargs)
+    raise ValueError(f"Modo desconocido: {mode}")
+
+
+def main():
+    channel = open_protocol_channel()
+    sys.stdin.reconfigure(encoding='utf-8')
+
+    from perplexity_analyzer import ProductAnalyzer
+    from metrics import collect, span
+    analyzer = ProductAnalyzer()
+    analyzer.warm_up()
+
+    send(channel, {"type": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            message = json.loads(line)
+        except ValueError:
+            print(f"Mensaje no válido: {line[:200]}", file=sys.stderr)
+            continue
+
+        job_id = message.get('id')
+        on_delta = None
+        if message.get('stream'):
+            def on_delta(text, job_id=job_id):
+                send(channel, {"id": job_id, "type": "delta", "text": text})
+
+        def on_item(index, result, job_id=job_id):
+            send(channel, {"id": job_id, "type": "item", "index": index, "result": result})
+
+        mode = message.get('mode')
+        with collect() as collected:
+            try:
+                with span('job', mode=mode):
+                    result = handle_job(analyzer, mode, message.get('params') or {}, on_delta, on_item)
+                with span('json_framing'):
+                    encoded = json.dumps(result, ensure_ascii=False)
+            except Exception as e:
+                send(channel, {"id": job_id, "type": "error", "error": str(e), "metrics": collected})
+                continue
+        send(channel, {"id": job_id, "type": "result", "metrics": collected}, encoded)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,98 +1,169 @@
-from openai import OpenAI
-import re
 import json
 import sys
-import io
 import os
-from urllib.parse import urlparse, unquote
-from dotenv import load_dotenv
 from pathlib import Path
-import argparse
-import time
 
-# Configuración para caracteres especiales
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+# Arranque rápido: aquí solo se importa lo que necesitan todos los modos.
+# openai (con pydantic, httpx...) se carga al crear el cliente y lo
+# específico de comparar URLs, al comparar.
 
-# Configuración de rutas y variables de entorno
+# Los módulos compartidos (caché, etc.) viven en la raíz del proyecto
 ROOT_DIR = Path(__file__).parent.parent.parent
-load_dotenv(ROOT_DIR / '.env')
+sys.path.insert(0, str(ROOT_DIR))
+from config import load_env, perplexity_settings
+from llm_cache import get_cache
+from single_flight import flights
+from metrics import span, record_usage, CACHE_LOOKUPS
+from llm_scheduler import get_scheduler, estimate_tokens, priority
+
+load_env()
+
+MODEL = "llama-3.1-sonar-large-128k-online"
+
+# Vigencia del análisis de cada producto, reutilizado entre comparativas
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', 24 * 3600))
+
+# Hilos de analyze_batch; el límite de llamadas de lotes en vuelo de todo el
+# servidor lo aplica llm_scheduler con el mismo BATCH_LLM_CONCURRENCY
+BATCH_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', 4))
 
 class ProductAnalyzer:
     def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv('PERPLEXITY_API_KEY'),
-            base_url="https://api.perplexity.ai"
+        self._client = None
+        self.cache = get_cache()
+
+    @property
+    def client(self):
+        """Cliente de Perplexity, creado (e importado openai) en el primer uso"""
+        if self._client is None:
+            from openai import OpenAI
+            # Los reintentos los gestiona el planificador (llm_scheduler)
+            self._client = OpenAI(**perplexity_settings(), max_retries=0)
+        return self._client
+
+    def warm_up(self):
+        """Carga por adelantado todo lo perezoso (cliente, módulos de comparación
+        e histórico de precios).
+
+        Para procesos que atienden muchas peticiones, como analyzer_worker.py:
+        así la primera petición no paga los imports.
+        """
+        import product_key
+        try:
+            from price_history import get_price_history
+            get_price_history().load()
+        except Exception as e:
+            print(f"Histórico de precios no disponible: {str(e)}")
+        return self.client
+
+    def _complete(self, messages, max_tokens, temperature=0.3, on_delta=None):
+        """Llama al modelo reutilizando respuestas idénticas ya obtenidas.
+
+        Si se pasa `on_delta`, la respuesta se pide en streaming y se llama
+        con cada fragmento de texto según llega; el valor devuelto sigue
+        siendo el texto completo.
+        """
+        cache_key = self.cache.make_key(MODEL, temperature, messages)
+        cached = self.cache.get(cache_key)
+        CACHE_LOOKUPS.inc(cache='llm', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            print("Utilizando resultado en caché.")
+            if on_delta:
+                on_delta(cached)
+            return cached
+
+        # Si otro hilo ya está pidiendo exactamente lo mismo, esperamos a su
+        # respuesta; en ese caso el texto llega entero en un solo fragmento.
+        requested = []
+
+        def request():
+            requested.append(True)
+            return self._request_completion(cache_key, messages, max_tokens, temperature, on_delta)
+
+        content = flights.do(cache_key, request)
+        if on_delta and not requested and content:
+            on_delta(content)
+        return content
+
+    def _request_completion(self, cache_key, messages, max_tokens, temperature, on_delta):
+        # El planificador decide cuándo sale la llamada y reintenta los 429 y
+        # 5xx (llegan al crearla, antes de emitir ningún fragmento)
+        content = get_scheduler().call(
+            lambda: self._create_completion(messages, max_tokens, temperature, on_delta),
+            estimate_tokens(messages),
+            max_tokens
         )
-        self.cache = {}
+        if content:
+            self.cache.set(cache_key, content)
+        return content
+
+    def _create_completion(self, messages, max_tokens, temperature, on_delta):
+        response = self.client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=bool(on_delta)
+        )
+
+        if not on_delta:
+            record_usage(response.usage, MODEL)
+            return response.choices[0].message.content
+
+        parts = []
+        usage = None
+        for chunk in response:
+            # El consumo de tokens (acumulado) viaja en los fragmentos del stream
+            usage = getattr(chunk, 'usage', None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        record_usage(usage, MODEL)
+        return ''.join(parts)
 
     def extract_product_info_from_url(self, url):
         """Extrae información relevante de la URL del producto"""
+        from url_fingerprint import fingerprint_url, describe
         try:
-            # Decodificar URL
-            decoded_url = unquote(url)
-            parsed_url = urlparse(decoded_url)
-            
-            # Extraer nombre del producto de la URL
-            path_parts = parsed_url.path.split('/')
-            product_name = next((part for part in reversed(path_parts) if part), '')
-            
-            # Limpiar el nombre
-            product_name = product_name.replace('-', ' ').replace('_', ' ')
-            product_name = re.sub(r'\.html$', '', product_name)
-            
-            # Extraer palabras clave
-            keywords = re.findall(r'\b\w+\b', product_name.lower())
+            with span('url_parse'):
+                description = describe(fingerprint_url(url))
             
             print(f"Extrayendo información de URL: {url}")
-            print(f"Información extraída: {' '.join(keywords)}")
+            print(f"Información extraída: {description}")
             
-            return ' '.join(keywords)
+            return description
 
         except Exception as e:
             print(f"Error extrayendo información: {str(e)}")
             return None
 
-    def get_recommendations(self, product_type, min_budget, max_budget, main_use, specific_needs):
+    def get_recommendations(self, product_type, min_budget, max_budget, main_use, specific_needs,
+                            on_delta=None):
         try:
-            # Agregar caché básico
-            cache_key = f"{product_type}_{min_budget}_{max_budget}_{main_use}_{specific_needs}"
-            if cache_key in self.cache:
-                print("Utilizando resultado en caché.")
-                return self.cache[cache_key]
-            
-            # Iniciar el tiempo de procesamiento
-            start_time = time.time()
-
-            response = self.client.chat.completions.create(
-                model="llama-3.1-sonar-large-128k-online",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Eres un asesor experto que combina conocimiento profundo con capacidad de explicar de forma simple. Evita tecnicismos innecesarios y céntrate en el valor real para el usuario. Sé honesto sobre ventajas y desventajas."""
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Recomienda un producto de tipo {product_type} con un presupuesto entre {min_budget} y {max_budget}. El producto se usará principalmente para {main_use}. Necesidades específicas: {specific_needs}."
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=800,
-                stream=False
-            )
-
-            # Medir el tiempo de procesamiento
-            processing_time = time.time() - start_time
-            print(f"Tiempo de procesamiento: {processing_time:.2f} segundos")
+            with span('llm_recommend'):
+                analysis = self._complete(
+                    [
+                        {
+                            "role": "system",
+                            "content": """Eres un asesor experto que combina conocimiento profundo con capacidad de explicar de forma simple. Evita tecnicismos innecesarios y céntrate en el valor real para el usuario. Sé honesto sobre ventajas y desventajas."""
+                        },
+                        {
+                            "role": "user",
+                            "content": f"Recomienda un producto de tipo {product_type} con un presupuesto entre {min_budget} y {max_budget}. El producto se usará principalmente para {main_use}. Necesidades específicas: {specific_needs}."
+                        }
+                    ],
+                    max_tokens=800,
+                    on_delta=on_delta
+                )
 
-            result = {
+            return {
                 "success": True,
-                "analysis": response.choices[0].message.content
+                "analysis": analysis
             }
 
-            # Almacenar en caché
-            self.cache[cache_key] = result
-            return result
-
         except Exception as e:
             print(f"Error en recomendación: {str(e)}")
             return {
@@ -100,20 +171,32 @@ class ProductAnalyzer:
                 "error": "No se pudo generar la recomendación. Por favor, intenta de nuevo."
             }
 
-    def compare_products(self, products_info, user_context=None):
+    def compare_products(self, products_info, user_context=None, on_delta=None):
+        """Compara los productos de get_product_info.
+
+        El prompt lleva la versión compacta de cada registro (ver
+        product_record) y la comparativa rápida, un apartado por producto
+        con el nombre de su registro.
+        """
+        from product_record import compact_products, record_of
         try:
             context_part = f"\nTeniendo en cuenta que el usuario busca: {user_context}" if user_context else ""
-            
-            products = products_info.split("\n\n")
-            product1 = products[0] if len(products) > 0 else "Primer producto"
-            product2 = products[1] if len(products) > 1 else "Segundo producto"
-            
+
+            names = []
+            for index, product in enumerate(products_info, 1):
+                record = record_of(product)
+                names.append(record.name if record else f"P{index}")
+            quick_comparison = "\n\n".join(
+                f"**{name}:**\n- Puntos fuertes: [listado]\n- Ideal para: [casos de uso]\n- Precio/calidad: [valoración]"
+                for name in names
+            )
+
             prompt = f"""
 Eres un asesor experto que sabe explicar de forma clara y accesible, usando un lenguaje que cualquier persona pueda entender. Tu objetivo es ayudar a tomar la mejor decisión basada en necesidades reales, siendo honesto sobre ventajas y desventajas.
 
-Analiza estos productos:{context_part}
+Analiza estos productos (P1, P2...: nombre | precio, ideal: usuario ideal, +: puntos fuertes, -: limitaciones, specs: especificaciones):{context_part}
 
-{products_info}
+{compact_products(products_info)}
 
 Proporciona un análisis con el siguiente formato usando Markdown:
 
@@ -127,38 +210,30 @@ Proporciona un análisis con el siguiente formato usando Markdown:
 
 ### 📊 COMPARATIVA RÁPIDA
 
-**{product1}:**
-- Puntos fuertes: [listado]
-- Ideal para: [casos de uso]
-- Precio/calidad: [valoración]
-
-**{product2}:**
-- Puntos fuertes: [listado]
-- Ideal para: [casos de uso]
-- Precio/calidad: [valoración]
+{quick_comparison}
 
 ### ✨ DIFERENCIAS CLAVE
 - [3-4 diferencias importantes]"""
 
-            response = self.client.chat.completions.create(
-                model="llama-3.1-sonar-large-128k-online",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Eres un asesor experto que combina conocimiento profundo con capacidad de explicar de forma simple. Evita tecnicismos innecesarios y céntrate en el valor real para el usuario. Sé honesto sobre ventajas y desventajas."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
+            with span('llm_compare'):
+                analysis = self._complete(
+                    [
+                        {
+                            "role": "system",
+                            "content": """Eres un asesor experto que combina conocimiento profundo con capacidad de explicar de forma simple. Evita tecnicismos innecesarios y céntrate en el valor real para el usuario. Sé honesto sobre ventajas y desventajas."""
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    max_tokens=2000,
+                    on_delta=on_delta
+                )
 
             return {
                 "success": True,
-                "analysis": response.choices[0].message.content
+                "analysis": analysis
             }
 
         except Exception as e:
@@ -168,61 +243,170 @@ Proporciona un análisis con el siguiente formato usando Markdown:
                 "error": "No se pudo generar la recomendación. Por favor, intenta de nuevo."
             }
 
-    def analyze_products(self, urls):
+    def get_product_info(self, url):
+        """Información de un producto, compartida entre todas las comparativas que lo incluyan.
+
+        Las estadísticas de los precios registrados (price_history) se
+        consultan cada vez en lugar de guardarse con el producto.
+        """
+        from product_key import canonicalize_url, product_key, PRODUCT_INFO
+        from product_record import ProductRecord, price_history_of
+        from url_fingerprint import fingerprint_url
+        key = product_key(url)
+        price_history = price_history_of(key)
+        cached = self.cache.get_json(f"{PRODUCT_INFO}:{key}")
+        CACHE_LOOKUPS.inc(cache='product', result='hit' if cached else 'miss')
+        if cached:
+            return {"key": key, **cached, "price_history": price_history}
+
+        url = canonicalize_url(url)
+        details = self.extract_product_info_from_url(url)
+        if not details:
+            return None
+
+        specs = fingerprint_url(url)
+        product = {
+            "details": details,
+            "record": ProductRecord.from_fingerprint(specs, name=details).to_dict(),
+            "image": None,
+            "specs": specs
+        }
+        self.cache.set_json(f"{PRODUCT_INFO}:{key}", product, ttl=PRODUCT_CACHE_TTL)
+        return {"key": key, **product, "price_history": price_history}
+
+    def compare_cached(self, products_info, user_context=None, on_delta=None):
+        """compare_products con caché por conjunto de productos, sin importar el orden"""
+        from product_key import comparison_key, COMPARISON_INFO
+        key = comparison_key([p["key"] for p in products_info], user_context, COMPARISON_INFO)
+        analysis = self.cache.get(key)
+        CACHE_LOOKUPS.inc(cache='comparison', result='hit' if analysis is not None else 'miss')
+        if analysis is not None:
+            print("Comparativa en caché.")
+            if on_delta:
+                on_delta(analysis)
+            return {"success": True, "analysis": analysis}
+
+        comparison = self.compare_products(products_info, user_context, on_delta)
+        if comparison["success"] and comparison["analysis"]:
+            self.cache.set(key, comparison["analysis"])
+        return comparison
+
+    def analyze_products(self, urls, user_context=None, on_delta=None):
         """Función principal para analizar productos"""
         try:
             products_info = []
+            seen = set()
             
             for url in urls:
-                product_description = self.extract_product_info_from_url(url)
-                if product_description:
-                    # Enriquecer la información con el análisis de IA
-                    details = product_description
-                    
-                    if details:
-                        products_info.append({
-                            "details": details,
-                        })
+                # Las variantes de un mismo enlace cuentan como un solo producto
+                product = self.get_product_info(url)
+                if product and product["key"] not in seen:
+                    seen.add(product["key"])
+                    products_info.append(product)
             
-            result = None
-            if len(products_info) > 1:
-                comparison = self.compare_products("\n\n".join([p["details"] for p in products_info]))
-                result = {
-                    "success": True,
-                    "type": "comparison",
-                    "analysis": comparison,
-                    "products": products_info
-                }
-            elif len(products_info) == 1:
-                result = {
-                    "success": True,
-                    "type": "single_product",
-                    "analysis": products_info[0]["details"],
-                }
-            else:
-                result = {
-                    "success": False,
-                    "error": "No se pudo obtener información de los productos"
-                }
-
-            print("\nRESULT_JSON_START")
-            print(json.dumps(result, ensure_ascii=False))
-            print("RESULT_JSON_END")
-            return result
+            return self.analysis_result(products_info, user_context, on_delta)
 
         except Exception as e:
-            error_result = {
+            return {
                 "success": False,
                 "error": str(e)
             }
-            print("\nRESULT_JSON_START")
-            print(json.dumps(error_result, ensure_ascii=False))
-            print("RESULT_JSON_END")
-            return error_result
+
+    def analysis_result(self, products_info, user_context=None, on_delta=None):
+        """Resultado de analyze_products a partir de los productos ya analizados"""
+        if len(products_info) > 1:
+            comparison = self.compare_cached(products_info, user_context, on_delta)
+            if not comparison["success"]:
+                return comparison
+            return {
+                "success": True,
+                "type": "comparison",
+                "analysis": comparison["analysis"],
+                "products": products_info
+            }
+        elif len(products_info) == 1:
+            return {
+                "success": True,
+                "type": "single_product",
+                "analysis": products_info[0]["details"],
+            }
+        else:
+            return {
+                "success": False,
+                "error": "No se pudo obtener información de los productos"
+            }
+
+    def analyze_batch(self, jobs, concurrency=BATCH_CONCURRENCY, on_item=None):
+        """Muchas comparativas de una vez (lotes de /api/compare/batch).
+
+        Cada producto distinto se analiza una sola vez para todo el lote,
+        aunque aparezca en varias comparativas, y las comparativas se
+        ejecutan en `concurrency` hilos. Las llamadas al modelo de todos los
+        lotes del servidor las acota el planificador compartido
+        (BATCH_LLM_CONCURRENCY en llm_scheduler). `on_item(index, result)` se llama al terminar cada una;
+        sin él, los resultados se devuelven todos juntos al final.
+        """
+        import contextvars
+        from concurrent.futures import ThreadPoolExecutor
+        from product_key import product_key
+
+        job_keys = []
+        urls_by_key = {}
+        for job in jobs:
+            keys = []
+            for url in job.get('urls') or []:
+                key = product_key(url)
+                if key not in keys:
+                    keys.append(key)
+                urls_by_key.setdefault(key, url)
+            job_keys.append(keys)
+
+        # Las comparativas del lote ceden el turno a las peticiones interactivas
+        with priority('batch'), ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            # Los hilos no heredan el recolector de métricas del trabajo: se
+            # lanza cada tarea en una copia del contexto actual
+            def submit(fn, *args):
+                return executor.submit(contextvars.copy_context().run, fn, *args)
+
+            product_futures = {key: submit(self.get_product_info, url) for key, url in urls_by_key.items()}
+
+            def run(index, job, keys):
+                try:
+                    products_info = [product_futures[key].result() for key in keys]
+                    result = self.analysis_result(
+                        [product for product in products_info if product],
+                        job.get('user_context')
+                    )
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+                if on_item:
+                    on_item(index, result)
+                return result
+
+            futures = [submit(run, index, job, keys) for index, (job, keys) in enumerate(zip(jobs, job_keys))]
+            results = [future.result() for future in futures]
+
+        summary = {
+            "success": True,
+            "total": len(results),
+            "failed": sum(1 for result in results if not result.get("success")),
+            "products": len(urls_by_key)
+        }
+        if not on_item:
+            summary["results"] = results
+        return summary
+
+
+def print_result(result):
+    """Imprime el resultado entre los marcadores que espera server.js"""
+    print("\nRESULT_JSON_START")
+    print(json.dumps(result, ensure_ascii=False))
+    print("RESULT_JSON_END")
 
 
 def parse_args():
     """Procesa los argumentos de línea de comandos"""
+    import argparse
     parser = argparse.ArgumentParser(description='Analizar y recomendar productos')
     parser.add_argument('--mode', choices=['compare', 'recommend'], default='compare',
                        help='Modo de operación: comparar o recomendar')
@@ -236,30 +420,25 @@ def parse_args():
 
 
 if __name__ == "__main__":
+    # Configuración para caracteres especiales
+    sys.stdout.reconfigure(encoding='utf-8')
+
     args = parse_args()
     analyzer = ProductAnalyzer()
     
     if args.mode == 'recommend':
         try:
-            recommendations = analyzer.get_recommendations(
+            print_result(analyzer.get_recommendations(
                 args.type,
                 args.min_budget,
                 args.max_budget,
                 args.use,
                 args.needs
-            )
-            
-            print("\nRESULT_JSON_START")
-            print(json.dumps(recommendations, ensure_ascii=False))
-            print("RESULT_JSON_END")
-            
+            ))
         except Exception as e:
-            error_result = {
+            print_result({
                 "success": False,
                 "error": str(e)
-            }
-            print("\nRESULT_JSON_START")
-            print(json.dumps(error_result, ensure_ascii=False))
-            print("RESULT_JSON_END")
+            })
     else:
-        analyzer.analyze_products(args.urls)
+        print_result(analyzer.analyze_products(args.urls))
@@ -0,0 +1,102 @@
+const { randomUUID } = require('crypto');
+const { timeStage } = require('./metrics');
+
+// Lotes de comparativas (POST /api/compare/batch). Cada lote se envía como
+// un solo trabajo `batch` a un pool de procesos Python propio, que analiza
+// cada producto distinto una vez para todo el lote y reparte las
+// comparativas entre `concurrency` hilos (ver analyze_batch en
+// backend/scrapers/perplexity_analyzer.py). Las llamadas al modelo de esos
+// hilos pasan por llm_scheduler, compartido con los workers interactivos:
+// BATCH_LLM_CONCURRENCY es el máximo de llamadas de lotes en vuelo en todo
+// el servidor, dentro de LLM_CONCURRENCY, y las interactivas pasan delante.
+// Los resultados se guardan según llegan y se conservan `ttlMs` después de
+// terminar el lote.
+class BatchStore {
+    constructor({ pool, concurrency = 4, timeoutMs = 30 * 60 * 1000, ttlMs = 60 * 60 * 1000 }) {
+        this.pool = pool;
+        this.concurrency = concurrency;
+        this.timeoutMs = timeoutMs;
+        this.ttlMs = ttlMs;
+        this.batches = new Map();
+    }
+
+    create(jobs) {
+        const batch = {
+            id: randomUUID(),
+            status: 'running',
+            createdAt: new Date().toISOString(),
+            finishedAt: null,
+            error: null,
+            products: null,
+            jobs: jobs.map((job, index) => ({
+                index,
+                urls: job.urls,
+                userContext: job.userContext || null,
+                status: 'pending',
+                result: null
+            }))
+        };
+        this.batches.set(batch.id, batch);
+        this.run(batch);
+        return batch;
+    }
+
+    get(id) {
+        return this.batches.get(id) || null;
+    }
+
+    async run(batch) {
+        const finishJob = (job, result) => {
+            job.result = result;
+            job.status = result && result.success ? 'done' : 'failed';
+        };
+
+        try {
+            const summary = await timeStage('analysis', { mode: 'batch' }, () => this.pool.run('batch', {
+                jobs: batch.jobs.map(job => ({ urls: job.urls, user_context: job.userContext })),
+                concurrency: this.concurrency
+            }, {
+                timeoutMs: this.timeoutMs,
+                onItem: (index, result) => {
+                    if (batch.jobs[index]) finishJob(batch.jobs[index], result);
+                }
+            }));
+            batch.products = summary.products;
+            batch.status = 'done';
+        } catch (error) {
+            batch.status = 'failed';
+            batch.error = error.message;
+            for (const job of batch.jobs) {
+                if (job.status === 'pending') finishJob(job, { success: false, error: error.message });
+            }
+        }
+
+        batch.finishedAt = new Date().toISOString();
+        setTimeout(() => this.batches.delete(batch.id), this.ttlMs).unref();
+    }
+}
+
+const countJobs = batch => {
+    const counts = { total: batch.jobs.length, pending: 0, done: 0, failed: 0 };
+    for (const job of batch.jobs) counts[job.status]++;
+    return counts;
+};
+
+// Vista pública de un lote; sin `includeResults` solo el estado de cada trabajo
+const describeBatch = (batch, { includeResults = true } = {}) => ({
+    id: batch.id,
+    status: batch.status,
+    createdAt: batch.createdAt,
+    finishedAt: batch.finishedAt,
+    error: batch.error,
+    products: batch.products,
+    counts: countJobs(batch),
+    jobs: batch.jobs.map(job => ({
+        index: job.index,
+        status: job.status,
+        urls: job.urls,
+        ...(includeResults ? { result: job.result } : {})
+    }))
+});
+
+module.exports = { BatchStore, describeBatch };
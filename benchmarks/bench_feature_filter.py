@@ -0,0 +1,125 @@
+"""Precisión y velocidad de feature_filter sobre miles de textos de la página.
+
+    python benchmarks/bench_feature_filter.py [--nodes 5000] [--runs 5]
+
+Para cada categoría se genera una página sintética con `--nodes` textos
+mezclados como los de un DOM real: especificaciones de la categoría, de
+otras categorías (productos relacionados), navegación, pie, envíos y
+párrafos largos. Se compara con el filtro anterior (forma del texto y
+palabras de navegación, las primeras 10 que pasan) en velocidad y en
+cuántas de las características elegidas son especificaciones de la
+categoría.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+from feature_filter import FeatureFilter, LEXICONS, MAX_FEATURES
+
+# Lo que había antes, para comparar
+LEGACY_NOISE_WORDS = ['cookie', 'menú', 'inicio', 'carrito', 'cuenta', 'login', 'regístrate', 'perfil']
+
+
+def legacy_select(texts, k=MAX_FEATURES):
+    features = []
+    for text in texts:
+        if (
+            len(text) > 10
+            and (':' in text or text.startswith('-') or text.startswith('•'))
+            and not any(word in text.lower() for word in LEGACY_NOISE_WORDS)
+            and text not in features
+        ):
+            features.append(text)
+    return features[:k]
+
+
+NOISE = [
+    'Mi cuenta', 'Carrito (0)', 'Inicio > Electrónica > {term}', 'Envío gratis: pedidos desde 50 €',
+    'Devoluciones: 30 días gratis', 'Atención al cliente: 900 000 000', 'Política de privacidad',
+    '- Financiación: hasta 24 meses sin intereses', 'Valoraciones: 4,5 de 5 (120 opiniones)',
+    'Síguenos en redes sociales', '• Recogida en tienda: disponible en 2 horas', 'Newsletter: suscríbete',
+    'Aviso: los precios incluyen IVA', 'Ver más productos de {term} ({n})', 'Oferta {n}: {term} a mitad de precio',
+    'Este producto ha sido diseñado para ofrecerte la mejor experiencia: calidad, diseño y tecnología '
+    'en un solo dispositivo pensado para el día a día de toda la familia y mucho más allá.'
+]
+
+VALUES = ['Sí', 'No', '55 pulgadas', '120 Hz', '8 GB', '1 TB', '9 kg', '1400 rpm', '350 litros', '42 dB', 'A',
+          'Negro', '4000 mAh', '1 ms', '600 nits', 'Incluido', 'Wi-Fi 6', '3 x HDMI 2.1']
+
+
+def spec_line(term, rng):
+    prefix = rng.choice(['', '', '- ', '• '])
+    return f"{prefix}{term.capitalize()}: {rng.choice(VALUES)}"
+
+
+def related_line(term, rng):
+    # Fichas de productos relacionados: casi todas distintas
+    return f"{spec_line(term, rng)} (ref. {rng.randrange(100000)})"
+
+
+def build_page(category, nodes, rng):
+    """(textos, especificaciones de la categoría); la mayoría de los textos
+    son distintos, como en una página real, para no medir solo la caché"""
+    own = [spec_line(term, rng) for term in LEXICONS[category]]
+    others = [
+        term for other, terms in LEXICONS.items() if other != category
+        for term in terms if term not in LEXICONS[category]
+    ]
+    texts = []
+    while len(texts) < nodes:
+        roll = rng.random()
+        if roll < 0.55:
+            texts.append(rng.choice(NOISE).format(term=rng.choice(LEXICONS[category]), n=rng.randrange(1000)))
+        elif roll < 0.85:
+            texts.append(related_line(rng.choice(others), rng))
+        else:
+            texts.append(rng.choice(own))
+    # Las de la categoría suelen estar más abajo que el menú y los relacionados
+    rng.shuffle(own)
+    texts[len(texts) * 2 // 3:len(texts) * 2 // 3] = own
+    return texts, set(own)
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de feature_filter')
+    parser.add_argument('--nodes', type=int, default=5000, help='Textos por página')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    totals = {'feature_filter': [0.0, 0, 0], 'filtro anterior': [0.0, 0, 0]}
+    print(f"{'categoría':<16}{'feature_filter':>24}{'filtro anterior':>24}")
+    for category in LEXICONS:
+        texts, own = build_page(category, args.nodes, rng)
+        row = []
+        for label, select in [('feature_filter', FeatureFilter(category).select), ('filtro anterior', legacy_select)]:
+            seconds, chosen = timed(lambda: select(texts), args.runs)
+            relevant = sum(text in own for text in chosen)
+            totals[label][0] += seconds
+            totals[label][1] += relevant
+            totals[label][2] += len(chosen)
+            row.append(f"{relevant:>2}/{len(chosen):<2} {seconds * 1000:7.1f} ms")
+        print(f"{category:<16}{row[0]:>24}{row[1]:>24}")
+
+    nodes = args.nodes * len(LEXICONS)
+    for label, (seconds, relevant, chosen) in totals.items():
+        print(f"{label:<16} {relevant}/{chosen} relevantes, {nodes / seconds:,.0f} textos/s")
+
+
+if __name__ == "__main__":
+    main()
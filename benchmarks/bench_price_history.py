@@ -0,0 +1,115 @@
+"""Velocidad y tamaño de price_history.
+
+    python benchmarks/bench_price_history.py [--products 5000] [--prices 60] [--queries 20000]
+
+Se apuntan `--prices` precios de cada producto repartidos en 90 días (en
+lotes, como los de ProductScraper.extract_many), se compacta el segmento y
+se miden la carga (memmap y estadísticas de todos los productos), cada
+consulta de stats_for, lo que cuesta un lote nuevo ya cargado el histórico
+(lo que paga cada extract_many antes de la consulta siguiente) y los bytes
+en disco por precio. Como referencia, las mismas estadísticas producto a
+producto con listas de Python y statistics.
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+from price_history import PriceHistory, TREND_DAYS
+
+
+def python_stats(rows, now):
+    """Las mismas estadísticas sin numpy, para comparar"""
+    by_product = {}
+    for key, price, _, ts in rows:
+        by_product.setdefault(key, []).append((ts, price))
+    stats = {}
+    for key, series in by_product.items():
+        prices = sorted(price for _, price in series)
+        quartiles = statistics.quantiles(prices, n=4, method='inclusive') if len(prices) > 1 else prices * 3
+        recent = [(ts, price) for ts, price in series if ts >= now - TREND_DAYS * 86400]
+        trend = None
+        if len(recent) >= 2:
+            slope = statistics.linear_regression([ts for ts, _ in recent], [price for _, price in recent]).slope
+            trend = slope * TREND_DAYS * 86400 / statistics.fmean(price for _, price in recent) * 100
+        stats[key] = (prices[0], quartiles[0], quartiles[1], quartiles[2], prices[-1], trend)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de price_history')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--prices', type=int, default=60, help='Precios por producto')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--batches', type=int, default=200, help='Lotes de 10 precios tras la carga')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = time.time()
+    keys = [f"tienda{index % 7}:sku{index}" for index in range(args.products)]
+    rows = []
+    for key in keys:
+        base = rng.uniform(50, 2000)
+        for _ in range(args.prices):
+            price = round(base * rng.uniform(0.8, 1.1), 2)
+            rows.append((key, price, round(base * 1.2, 2), now - rng.uniform(0, 90) * 86400))
+    rng.shuffle(rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = PriceHistory(directory, compact_rows=len(rows) + 1)
+        start = time.perf_counter()
+        for batch in range(0, len(rows), 50):
+            history.append_many(rows[batch:batch + 50])
+        append_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        history.compact()
+        compact_seconds = time.perf_counter() - start
+
+        # Carga en frío, como la de un proceso nuevo
+        history = PriceHistory(directory)
+        start = time.perf_counter()
+        history.load()
+        load_seconds = time.perf_counter() - start
+
+        lookups = [rng.choice(keys) for _ in range(args.queries)]
+        start = time.perf_counter()
+        for key in lookups:
+            history.stats_for(key)
+        query_seconds = time.perf_counter() - start
+
+        batches = [
+            [(rng.choice(keys), round(rng.uniform(50, 2000), 2), None, now) for _ in range(10)]
+            for _ in range(args.batches)
+        ]
+        start = time.perf_counter()
+        for batch in batches:
+            history.append_many(batch)
+            history.stats_for(batch[0][0])
+        batch_seconds = time.perf_counter() - start
+
+        segment = [path for path in Path(directory).glob('segment-*/*')]
+        size = sum(path.stat().st_size for path in segment)
+
+    start = time.perf_counter()
+    python_stats(rows, now)
+    python_seconds = time.perf_counter() - start
+
+    print(f"{len(rows):,} precios de {args.products:,} productos")
+    print(f"Escritura (lotes de 50):       {len(rows) / append_seconds:12,.0f} precios/s")
+    print(f"Compactación:                  {compact_seconds * 1000:12.1f} ms")
+    print(f"Carga y estadísticas (numpy):  {load_seconds * 1000:12.1f} ms")
+    print(f"Mismas estadísticas (Python):  {python_seconds * 1000:12.1f} ms")
+    print(f"Consulta stats_for:            {query_seconds / args.queries * 1e6:12.2f} µs")
+    print(f"Lote de 10 y consulta:         {batch_seconds / args.batches * 1000:12.2f} ms")
+    print(f"Segmento en disco:             {size / len(rows):12.1f} bytes/precio ({size / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
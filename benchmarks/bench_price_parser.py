@@ -0,0 +1,96 @@
+"""Precisión y velocidad de price_parser.
+
+    python benchmarks/bench_price_parser.py [--mb 2] [--runs 5]
+
+Precisión: cada caso de benchmarks/fixtures/price_cases.json indica el
+importe y el tipo esperados (o null si el texto no tiene precio); se
+comparan con el candidato de más confianza de find_prices. Como referencia
+se mide también la expresión que usaba ProductScraper.clean_price, que solo
+da el importe.
+
+Velocidad: las páginas grabadas se repiten hasta `--mb` megas y se pasa
+find_prices por el HTML completo; como referencia, las tres pasadas de
+re.findall del antiguo scraper de backup/ sobre el mismo HTML.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+from price_parser import find_prices
+
+FIXTURES_DIR = BENCH_DIR / 'fixtures'
+
+# Lo que había antes, para comparar
+LEGACY_CLEAN_PRICE = re.compile(r'(\d+[.,]\d{2}|\d+)\s*€')
+LEGACY_PAGE_PATTERNS = [r'(\d+\.?\d*,\d{2})\s*€', r'(\d+,\d{2})\s*€', r'(\d+)\s*€']
+
+
+def legacy_clean_price(text):
+    match = LEGACY_CLEAN_PRICE.search(text)
+    return float(match.group(1).replace('.', '').replace(',', '.')) if match else None
+
+
+def legacy_page_prices(html):
+    return [match for pattern in LEGACY_PAGE_PATTERNS for match in re.findall(pattern, html)]
+
+
+def check_accuracy(cases):
+    engine_ok = legacy_ok = 0
+    failures = []
+    for case in cases:
+        candidates = find_prices(case['text'], hint=case.get('hint', ''))
+        best = max(candidates, key=lambda candidate: candidate.confidence) if candidates else None
+        got = (best.value, best.kind) if best else (None, None)
+        if got == (case['value'], case['kind']):
+            engine_ok += 1
+        else:
+            failures.append((case['text'], (case['value'], case['kind']), got))
+        if legacy_clean_price(case['text']) == case['value']:
+            legacy_ok += 1
+    return engine_ok, legacy_ok, failures
+
+
+def build_page(megabytes):
+    html = ''.join(path.read_text(encoding='utf-8') for path in sorted(FIXTURES_DIR.glob('*.html')))
+    return html * (int(megabytes * 1024 * 1024) // len(html) + 1)
+
+
+def timed(fn, html, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(html)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de price_parser')
+    parser.add_argument('--mb', type=float, default=2, help='Tamaño de la página de prueba')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = json.loads((FIXTURES_DIR / 'price_cases.json').read_text(encoding='utf-8'))
+    engine_ok, legacy_ok, failures = check_accuracy(cases)
+    print(f"Precisión price_parser: {engine_ok}/{len(cases)} (importe y tipo)")
+    print(f"Precisión clean_price anterior: {legacy_ok}/{len(cases)} (solo importe)")
+    for text, expected, got in failures:
+        print(f"  {text!r}: se esperaba {expected}, se obtuvo {got}")
+
+    html = build_page(args.mb)
+    size = len(html.encode('utf-8')) / (1024 * 1024)
+    for label, fn in [('price_parser.find_prices', find_prices), ('3 x re.findall (backup)', legacy_page_prices)]:
+        seconds, found = timed(fn, html, args.runs)
+        print(f"{label:<28}{size:>6.1f} MB en {seconds * 1000:7.1f} ms -> {size / seconds:6.1f} MB/s, "
+              f"{found} coincidencias")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
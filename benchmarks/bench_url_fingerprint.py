@@ -0,0 +1,66 @@
+"""Mide cuántas URLs por segundo procesa url_fingerprint.
+
+    python benchmarks/bench_url_fingerprint.py [--urls 20000]
+
+Se generan URLs distintas para cada tienda y se limpia la caché por URL
+antes de medir, de modo que cuenta el coste real del análisis.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from url_fingerprint import fingerprint_url, describe
+
+TEMPLATES = [
+    "https://www.pccomponentes.com/{brand}-{model}-{size}-{feature}-{capacity}gb-{word}",
+    "https://www.mediamarkt.es/es/product/_tv-{feature}-{size}-{brand}-{model}-4k-smart-tv-{sku}.html",
+    "https://www.amazon.es/{Brand}-{Model}-Smartphone-{capacity}GB-{Word}/dp/B0{sku}/ref=sr_1_{n}?keywords={word}",
+    "https://www.elcorteingles.es/electrodomesticos/A{sku}-lavadora-{brand}-{model}-{n}-kg-1400-rpm/",
+]
+
+BRANDS = ['samsung', 'lg', 'bosch', 'hp', 'lenovo', 'xiaomi', 'sony', 'asus']
+FEATURES = ['oled', 'qled', 'uhd', 'wifi', 'gaming', 'hdr10']
+WORDS = ['negro', 'plata', 'pro', 'ultra', 'serie', 'edicion', 'compacto']
+
+
+def generate_urls(count, seed=42):
+    rng = random.Random(seed)
+    urls = []
+    for index in range(count):
+        model = f"{rng.choice('qwertyuiop')}{rng.randint(10, 99)}{rng.choice('abcdefgh')}{index}"
+        values = {
+            'brand': rng.choice(BRANDS),
+            'model': model,
+            'feature': rng.choice(FEATURES),
+            'size': rng.choice([32, 43, 55, 65, 75]),
+            'capacity': rng.choice([64, 128, 256, 512]),
+            'word': rng.choice(WORDS),
+            'sku': rng.randint(10 ** 7, 10 ** 8),
+            'n': rng.randint(1, 12)
+        }
+        values.update({'Brand': values['brand'].title(), 'Model': model.upper(), 'Word': values['word'].title()})
+        urls.append(rng.choice(TEMPLATES).format(**values))
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de url_fingerprint')
+    parser.add_argument('--urls', type=int, default=20000)
+    args = parser.parse_args()
+
+    urls = generate_urls(args.urls)
+    fingerprint_url.cache_clear()
+
+    start = time.perf_counter()
+    for url in urls:
+        describe(fingerprint_url(url))
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(urls)} URLs en {elapsed:.3f} s -> {len(urls) / elapsed:,.0f} URLs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Servidor local de páginas de tienda grabadas.
+
+    python benchmarks/fixture_server.py [--port 8901] [--latency normal:120,40]
+                                        [--pad-kb 400] [--kbps 4000]
+
+Responde a `/{dominio}/{ruta}` con benchmarks/fixtures/{dominio}.html,
+independientemente de la ruta, que es el formato que usa FetchClient cuando
+se define FETCH_BASE_URL. `--pad-kb` añade al final del <body> scripts de
+relleno para simular el peso de una ficha real y `--kbps` limita el ancho
+de banda, de modo que se note leer solo el <head>.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from mock_llm_server import parse_distribution
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+CHUNK_SIZE = 16 * 1024
+
+
+def load_fixtures(directory, pad_kb=0):
+    """Lee las páginas grabadas indexadas por dominio"""
+    filler = ''
+    if pad_kb:
+        line = '<script>window.__STATE__.push({"widget":"recomendados","items":[1,2,3,4,5,6,7,8]});</script>\n'
+        filler = line * (pad_kb * 1024 // len(line) + 1)
+
+    fixtures = {}
+    for path in sorted(directory.glob('*.html')):
+        html = path.read_text(encoding='utf-8')
+        if filler:
+            html = html.replace('</body>', filler + '</body>', 1)
+        fixtures[path.stem] = html.encode('utf-8')
+    return fixtures
+
+
+def find_fixture(fixtures, host):
+    host = host.lower().split(':')[0]
+    if host in fixtures:
+        return fixtures[host]
+    # Hosts móviles o sin www apuntan a la misma página
+    bare = host.split('.', 1)[1] if host.count('.') > 1 else host
+    for name, body in fixtures.items():
+        if name == bare or name.endswith('.' + bare):
+            return body
+    return None
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Los clientes cortan conexiones a medias a propósito; no es un error
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FixtureServer/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        host = self.path.lstrip('/').split('/', 1)[0].split('?', 1)[0]
+        body = find_fixture(self.server.fixtures, host)
+
+        with self.server.lock:
+            latency = self.server.latency(self.server.rng)
+        time.sleep(latency / 1000)
+
+        if body is None:
+            data = f"Sin página grabada para {host}".encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        # Envío por trozos respetando el ancho de banda pedido
+        delay = CHUNK_SIZE / (self.server.args.kbps * 1024) if self.server.args.kbps else 0
+        try:
+            for start in range(0, len(body), CHUNK_SIZE):
+                self.wfile.write(body[start:start + CHUNK_SIZE])
+                if delay:
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente ya tiene lo que necesitaba (p. ej. solo el <head>)
+            self.close_connection = True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de páginas de tienda grabadas')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8901, help='0 para elegir un puerto libre')
+    parser.add_argument('--fixtures', type=Path, default=FIXTURES_DIR)
+    parser.add_argument('--latency', default='normal:120,40', help='Latencia hasta las cabeceras (ver mock_llm_server)')
+    parser.add_argument('--pad-kb', type=int, default=400, help='Relleno añadido al final del <body>')
+    parser.add_argument('--kbps', type=float, default=0, help='Ancho de banda en KB/s (0 = sin límite)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    server = QuietServer((args.host, args.port), FixtureHandler)
+    server.args = args
+    server.fixtures = load_fixtures(args.fixtures, args.pad_kb)
+    server.latency = parse_distribution(args.latency)
+    server.rng = random.Random(args.seed)
+    server.lock = threading.Lock()
+
+    host, port = server.server_address[:2]
+    print(f"fixture_server escuchando en http://{host}:{port} ({len(server.fixtures)} páginas)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""Servidor local compatible con la API de chat completions de Perplexity/OpenAI.
+
+    python benchmarks/mock_llm_server.py [--port 8900] [--latency lognormal:900,0.4]
+                                         [--token-ms 15] [--rate-429 0.05] [--rate-5xx 0.02]
+
+Sustituye a https://api.perplexity.ai en los benchmarks: basta con apuntar
+PERPLEXITY_BASE_URL a la dirección que imprime al arrancar. Responde con un
+texto fijo en el formato que esperan los prompts, con la latencia hasta el
+primer token sacada de la distribución indicada y el resto de fragmentos
+espaciados `--token-ms`. Admite `stream: true` (SSE) e inyecta errores 429
+(con Retry-After) y 5xx con la probabilidad pedida. GET /stats devuelve los
+contadores de peticiones.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCT_RESPONSE = """### NOMBRE DEL PRODUCTO
+Televisor OLED de 55 pulgadas
+
+### PRECIO APROXIMADO
+Entre 1.100 y 1.400 €
+
+### PERFIL DE USUARIO
+**Ideal para:** quien ve mucho cine y series en una sala con poca luz y quiere negros perfectos.
+
+### PUNTOS FUERTES
+• **Panel OLED:** negros puros y contraste muy alto, se nota sobre todo de noche.
+• **Procesador de imagen:** escala bien el contenido en HD y reduce el ruido.
+• **Gaming:** 4 puertos HDMI 2.1 a 120 Hz con VRR, listo para consolas actuales.
+
+### ASPECTOS A CONSIDERAR
+• **Brillo:** en salones muy luminosos se queda algo corto frente a un Mini LED.
+• **Sonido:** correcto, pero para cine conviene una barra de sonido.
+"""
+
+# Respuesta del modo estructurado (product_record.PRODUCT_SCHEMA)
+PRODUCT_JSON_RESPONSE = json.dumps({
+    "name": "Televisor OLED de 55 pulgadas",
+    "price_min": 1100,
+    "price_max": 1400,
+    "user_profile": "quien ve mucho cine y series en una sala con poca luz y quiere negros perfectos",
+    "strengths": [
+        "Panel OLED: negros puros y contraste muy alto",
+        "Procesador de imagen: buen escalado del contenido HD",
+        "Gaming: 4 HDMI 2.1 a 120 Hz con VRR"
+    ],
+    "caveats": [
+        "Brillo: algo corto en salones muy luminosos",
+        "Sonido: para cine conviene una barra de sonido"
+    ],
+    "key_specs": {"panel": "OLED", "tamaño": "55\"", "frecuencia": "120 Hz", "hdmi": "4x HDMI 2.1"}
+}, ensure_ascii=False)
+
+COMPARISON_RESPONSE = """### 🎯 RESUMEN RÁPIDO
+**¿Cuál elegir?** El primero si priorizas la calidad de imagen; el segundo si buscas el mejor precio.
+
+### 👤 PERFIL IDEAL
+• El primer producto es perfecto para:
+  - **Gamers** que valoran los 120 Hz y el VRR
+  - **Usuarios** que buscan la mejor imagen en cine
+• El segundo producto es perfecto para:
+  - **Usuarios** que quieren una buena tele sin gastar de más
+
+### ⚡ DIFERENCIAS IMPORTANTES
+• **Rendimiento y Velocidad:**
+  - El primer producto: panel de 120 Hz y procesador más rápido.
+  - El segundo producto: 60 Hz, suficiente para TV y streaming.
+
+### 💡 CONSEJO PERSONAL
+**Mi recomendación sincera:** si la usas sobre todo para películas, merece la pena la diferencia.
+"""
+
+RECOMMENDATION_RESPONSE = """### 🎯 MEJORES OPCIONES
+
+1. **Opción principal:** Portátil de 14" con Ryzen 7 y 16 GB de RAM
+   - **Precio aproximado:** 850 €
+   - **Por qué es ideal:** ligero, buena batería y potencia de sobra para el uso descrito.
+
+2. **Alternativa:** Portátil de 15,6" con Core i5 y 16 GB de RAM
+   - **Precio aproximado:** 700 €
+   - **Por qué es ideal:** pantalla más grande por menos dinero.
+
+### 💡 CONSEJOS DE COMPRA
+• Prioriza 16 GB de RAM y SSD de al menos 512 GB.
+"""
+
+
+def parse_distribution(spec):
+    """Convierte 'fixed:800', 'normal:800,200', 'lognormal:800,0.4' o
+    'exponential:800' en una función que devuelve milisegundos"""
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value] or [0.0]
+
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'normal':
+        mean, stdev = values[0], values[1] if len(values) > 1 else values[0] / 4
+        return lambda rng: max(0.0, rng.gauss(mean, stdev))
+    if kind == 'lognormal':
+        # Parámetros: mediana en ms y sigma del logaritmo
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    if kind == 'exponential':
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] else 0.0
+    raise ValueError(f"Distribución desconocida: {spec}")
+
+
+def pick_response(messages):
+    prompt = ' '.join(message.get('content', '') for message in messages).lower()
+    if 'objeto json' in prompt:
+        return PRODUCT_JSON_RESPONSE
+    if 'compara' in prompt or 'analiza estos productos' in prompt:
+        return COMPARISON_RESPONSE
+    if 'presupuesto' in prompt or 'recomienda' in prompt:
+        return RECOMMENDATION_RESPONSE
+    return PRODUCT_RESPONSE
+
+
+def split_chunks(text, size=12):
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.latency = parse_distribution(args.latency)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'streamed': 0, 'rate_limited': 0, 'server_errors': 0}
+
+    def draw(self):
+        """Decide el resultado de una petición: (error, latencia_ms)"""
+        with self.lock:
+            self.counters['requests'] += 1
+            roll = self.rng.random()
+            latency = self.latency(self.rng)
+            if roll < self.args.rate_429:
+                self.counters['rate_limited'] += 1
+                return 429, latency
+            if roll < self.args.rate_429 + self.args.rate_5xx:
+                self.counters['server_errors'] += 1
+                return self.rng.choice([500, 502, 503]), latency
+            return None, latency
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Los clientes cortan conexiones a medias a propósito; no es un error
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockPerplexity/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.state.args.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.server.state.lock:
+                self._send_json(200, dict(self.server.state.counters))
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'JSON inválido'}})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        state = self.server.state
+        error, latency_ms = state.draw()
+        time.sleep(latency_ms / 1000)
+
+        if error == 429:
+            self._send_json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit'}},
+                            {'Retry-After': str(state.args.retry_after)})
+            return
+        if error:
+            self._send_json(error, {'error': {'message': 'Upstream error', 'type': 'server_error'}})
+            return
+
+        messages = body.get('messages', [])
+        content = pick_response(messages)
+        prompt_tokens = sum(len(message.get('content', '')) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        max_tokens = body.get('max_tokens')
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get('model', 'mock')
+        chunks = split_chunks(content)
+
+        if body.get('stream'):
+            with state.lock:
+                state.counters['streamed'] += 1
+            self._stream(completion_id, created, model, chunks, prompt_tokens, completion_tokens)
+            return
+
+        # Sin streaming el cliente espera también a que se genere todo el texto
+        time.sleep(len(chunks) * state.args.token_ms / 1000)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content}
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream(self, completion_id, created, model, chunks, prompt_tokens, completion_tokens):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None, usage=None):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            if usage:
+                payload['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for chunk in chunks:
+                event({'content': chunk})
+                time.sleep(self.server.state.args.token_ms / 1000)
+            event({}, 'stop', {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de chat completions simulado')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900, help='0 para elegir un puerto libre')
+    parser.add_argument('--latency', default='lognormal:900,0.4',
+                        help='Latencia hasta el primer token: fixed:MS, normal:MEDIA,DESV, '
+                             'lognormal:MEDIANA,SIGMA o exponential:MEDIA')
+    parser.add_argument('--token-ms', type=float, default=15, help='Tiempo entre fragmentos de texto')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Probabilidad de responder 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Probabilidad de responder 5xx')
+    parser.add_argument('--retry-after', type=int, default=1, help='Segundos de Retry-After en los 429')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parse_distribution(args.latency)
+
+    server = QuietServer((args.host, args.port), MockHandler)
+    server.state = MockState(args)
+    host, port = server.server_address[:2]
+    print(f"mock_llm_server escuchando en http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Benchmark de extremo a extremo sin red: analizadores y endpoints de Node.
+
+    python benchmarks/run_benchmarks.py [--iterations 20] [--concurrency 1] [--node]
+                                        [--llm-latency lognormal:900,0.4] [--json resultados.json]
+
+Arranca mock_llm_server.py (en lugar de api.perplexity.ai) y
+fixture_server.py (en lugar de las tiendas), apunta a ellos
+PERPLEXITY_BASE_URL y FETCH_BASE_URL y mide:
+
+  - perplexity_analyzer.py: cada etapa (extract, search, image, compare) y
+    analyze_products completo.
+  - backend/scrapers/perplexity_analyzer.py: get_recommendations (también el
+    tiempo hasta el primer fragmento en streaming) y analyze_products.
+  - con --node, server.js: POST /api/compare, /api/recommend y el primer
+    evento de /api/compare/stream.
+
+Por defecto las cachés empiezan vacías y no guardan nada (TTL 0), para medir
+siempre el camino completo; --warm-cache las deja activas. El informe da
+p50/p95/p99 por etapa y, con --json, se guarda en un fichero para comparar
+entre versiones.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# Una URL por página grabada en benchmarks/fixtures
+PRODUCT_URLS = [
+    "https://www.pccomponentes.com/lg-oled55c44la-55-oled-evo-ultrahd-4k-smart-tv",
+    "https://www.mediamarkt.es/es/product/_tv-oled-55-samsung-tq55s90daexxc-uhd-4k-smart-tv-1580734.html",
+    "https://www.amazon.es/Samsung-Galaxy-Smartphone-Android-128GB/dp/B0CMDRCZBJ/ref=sr_1_3",
+    "https://www.elcorteingles.es/electrodomesticos/A45123987-lavadora-bosch-wgg244zmes-9-kg-1400-rpm/"
+]
+
+RECOMMENDATION = {
+    'product_type': 'portátil',
+    'min_budget': '600',
+    'max_budget': '900',
+    'main_use': 'programar y viajar',
+    'specific_needs': 'buena batería y poco peso'
+}
+
+
+class Recorder:
+    """Duraciones por etapa, seguras entre hilos"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(stage, [])
+            self.errors.setdefault(stage, 0)
+            if ok:
+                self.samples[stage].append(seconds)
+            else:
+                self.errors[stage] += 1
+
+    def timed(self, stage, fn, is_ok=lambda result: result is not None):
+        """Envuelve fn para apuntar su duración en `stage`"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                self.record(stage, time.perf_counter() - start, ok=False)
+                raise
+            self.record(stage, time.perf_counter() - start, ok=is_ok(result))
+            return result
+        return wrapper
+
+    def summary(self):
+        with self._lock:
+            return {
+                stage: summarize(samples, self.errors[stage])
+                for stage, samples in self.samples.items()
+            }
+
+
+def percentile(sorted_values, fraction):
+    """Percentil con interpolación lineal sobre valores ya ordenados"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, errors):
+    values = sorted(samples)
+    as_ms = lambda value: round(value * 1000, 1) if value is not None else None
+    return {
+        'count': len(values),
+        'errors': errors,
+        'mean_ms': as_ms(sum(values) / len(values)) if values else None,
+        'p50_ms': as_ms(percentile(values, 0.50)),
+        'p95_ms': as_ms(percentile(values, 0.95)),
+        'p99_ms': as_ms(percentile(values, 0.99)),
+        'max_ms': as_ms(values[-1]) if values else None
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(script, *args):
+    """Arranca uno de los servidores locales y devuelve (proceso, url)"""
+    process = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / script), '--port', '0', *args],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    line = process.stdout.readline()
+    match = re.search(r'http://[\d.]+:\d+', line)
+    if not match:
+        process.kill()
+        raise RuntimeError(f"{script} no arrancó: {line!r}")
+    return process, match.group(0)
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silencia los print() de los analizadores (y su cambio de sys.stdout)"""
+    sink = io.TextIOWrapper(open(os.devnull, 'wb'), encoding='utf-8')
+    with contextlib.redirect_stdout(sink):
+        yield
+
+
+def configure_environment(args, llm_url, fixtures_url, workdir):
+    os.environ.update({
+        'PERPLEXITY_BASE_URL': llm_url,
+        'FETCH_BASE_URL': fixtures_url,
+        'LLM_CACHE_PATH': str(Path(workdir) / 'llm_cache.sqlite3'),
+        'PRODUCT_KEYS_PATH': str(Path(workdir) / 'products.sqlite3')
+    })
+    os.environ.setdefault('PERPLEXITY_API_KEY', 'benchmark')
+    if not args.warm_cache:
+        os.environ['LLM_CACHE_TTL'] = '0'
+        os.environ['PRODUCT_CACHE_TTL'] = '0'
+
+
+def bench_root_analyzer(args, recorder, url_pairs):
+    """perplexity_analyzer.py: etapas por separado y analyze_products completo"""
+    with quiet():
+        module = load_module('bench_root_analyzer', ROOT_DIR / 'perplexity_analyzer.py')
+
+    analyzer_class = module.ProductAnalyzer
+    for method, stage in [
+        ('extract_product_info_from_url', 'root.extract'),
+        ('analyze_product', 'root.search'),
+        ('try_get_product_image', 'root.image'),
+        ('compare_products', 'root.compare')
+    ]:
+        setattr(analyzer_class, method, recorder.timed(stage, getattr(analyzer_class, method)))
+
+    analyze = recorder.timed(
+        'root.analyze_products',
+        module.analyze_products,
+        is_ok=lambda result: bool(result and result.get('success'))
+    )
+    with quiet(), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda pair: analyze(list(pair)), url_pairs))
+
+
+def bench_static_extractor(args, recorder):
+    """static_extractor.py: descarga y extracción de la ficha sin navegador"""
+    from static_extractor import fetch_product_info
+
+    extract = recorder.timed(
+        'static.extract',
+        fetch_product_info,
+        is_ok=lambda result: bool(result and result.get('success'))
+    )
+    urls = [PRODUCT_URLS[index % len(PRODUCT_URLS)] for index in range(args.iterations)]
+    with quiet(), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(extract, urls))
+
+
+def bench_backend_analyzer(args, recorder, url_pairs):
+    """backend/scrapers/perplexity_analyzer.py: lo que ejecuta el worker de Node"""
+    with quiet():
+        module = load_module('bench_backend_analyzer', ROOT_DIR / 'backend' / 'scrapers' / 'perplexity_analyzer.py')
+        analyzer = module.ProductAnalyzer()
+
+    succeeded = lambda result: bool(result and result.get('success'))
+    recommend = recorder.timed('backend.get_recommendations', analyzer.get_recommendations, succeeded)
+    analyze = recorder.timed('backend.analyze_products', analyzer.analyze_products, succeeded)
+
+    def recommend_streaming(_):
+        start = time.perf_counter()
+        first = []
+
+        def on_delta(text):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        result = analyzer.get_recommendations(*RECOMMENDATION.values(), on_delta=on_delta)
+        recorder.record('backend.get_recommendations.first_delta', first[0] if first else 0, ok=bool(first))
+        return result
+
+    with quiet(), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda _: recommend(*RECOMMENDATION.values()), range(args.iterations)))
+        list(executor.map(recommend_streaming, range(args.iterations)))
+        list(executor.map(lambda pair: analyze(list(pair), 'uso diario'), url_pairs))
+
+
+def post_json(url, payload, timeout=120):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def bench_node(args, recorder, url_pairs, workdir):
+    """server.js con su pool de workers Python apuntando a los servidores locales"""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    log_path = Path(workdir) / 'server.log'
+    log = open(log_path, 'w', encoding='utf-8')
+    server = subprocess.Popen(
+        ['node', str(ROOT_DIR / 'server.js')],
+        cwd=str(ROOT_DIR),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(f"{base}/health", timeout=1).read()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    output = log_path.read_text(encoding='utf-8', errors='replace')
+                    raise RuntimeError("server.js no arrancó:\n" + '\n'.join(output.splitlines()[-10:]))
+                time.sleep(0.2)
+
+        def call(stage, path, payload):
+            start = time.perf_counter()
+            try:
+                with post_json(base + path, payload) as response:
+                    ok = json.loads(response.read()).get('success', False)
+            except (OSError, ValueError):
+                ok = False
+            recorder.record(stage, time.perf_counter() - start, ok)
+
+        def call_stream(pair):
+            start = time.perf_counter()
+            try:
+                with post_json(base + '/api/compare/stream', {'urls': list(pair)}) as response:
+                    for raw in response:
+                        if raw.startswith(b'event:'):
+                            recorder.record('node.compare_stream.first_event', time.perf_counter() - start)
+                            break
+            except OSError:
+                recorder.record('node.compare_stream.first_event', time.perf_counter() - start, ok=False)
+
+        recommend = {
+            'productType': RECOMMENDATION['product_type'],
+            'minBudget': RECOMMENDATION['min_budget'],
+            'maxBudget': RECOMMENDATION['max_budget'],
+            'mainUse': RECOMMENDATION['main_use'],
+            'specificNeeds': RECOMMENDATION['specific_needs']
+        }
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda pair: call('node.compare', '/api/compare', {'urls': list(pair)}), url_pairs))
+            list(executor.map(lambda _: call('node.recommend', '/api/recommend', recommend), range(args.iterations)))
+            list(executor.map(call_stream, url_pairs))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        log.close()
+
+
+def fetch_stats(url):
+    try:
+        with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def print_report(stages):
+    print(f"\n{'etapa':<42}{'n':>5}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in sorted(stages.items()):
+        cells = [stats[key] if stats[key] is not None else '-' for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+        print(f"{stage:<42}{stats['count']:>5}{stats['errors']:>5}" + ''.join(f"{cell:>10}" for cell in cells))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de latencia sin red')
+    parser.add_argument('--iterations', type=int, default=20, help='Comparativas por escenario')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--llm-latency', default='lognormal:900,0.4', help='Latencia hasta el primer token')
+    parser.add_argument('--token-ms', type=float, default=15)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-5xx', type=float, default=0.0)
+    parser.add_argument('--page-latency', default='normal:120,40', help='Latencia de las tiendas')
+    parser.add_argument('--page-kb', type=int, default=400, help='Peso añadido a cada página')
+    parser.add_argument('--kbps', type=float, default=0, help='Ancho de banda de las tiendas en KB/s')
+    parser.add_argument('--warm-cache', action='store_true', help='No desactivar las cachés')
+    parser.add_argument('--skip-python', action='store_true', help='No medir los analizadores directamente')
+    parser.add_argument('--node', action='store_true', help='Medir también los endpoints de server.js')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', type=Path, help='Guarda el informe en este fichero')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pairs = list(itertools.combinations(PRODUCT_URLS, 2))
+    url_pairs = [pairs[index % len(pairs)] for index in range(args.iterations)]
+
+    llm, llm_url = start_server(
+        'mock_llm_server.py',
+        '--latency', args.llm_latency,
+        '--token-ms', str(args.token_ms),
+        '--rate-429', str(args.rate_429),
+        '--rate-5xx', str(args.rate_5xx),
+        '--seed', str(args.seed)
+    )
+    fixtures, fixtures_url = start_server(
+        'fixture_server.py',
+        '--latency', args.page_latency,
+        '--pad-kb', str(args.page_kb),
+        '--kbps', str(args.kbps),
+        '--seed', str(args.seed)
+    )
+    recorder = Recorder()
+    started = time.time()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure_environment(args, llm_url, fixtures_url, workdir)
+            if not args.skip_python:
+                bench_static_extractor(args, recorder)
+                bench_root_analyzer(args, recorder, url_pairs)
+                bench_backend_analyzer(args, recorder, url_pairs)
+            if args.node:
+                bench_node(args, recorder, url_pairs, workdir)
+            mock_stats = fetch_stats(llm_url)
+    finally:
+        llm.terminate()
+        fixtures.terminate()
+
+    report = {
+        'timestamp': started,
+        'duration_s': round(time.time() - started, 2),
+        'config': {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        'mock_llm': mock_stats,
+        'stages': recorder.summary()
+    }
+    print_report(report['stages'])
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\nInforme guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Comprueba el coste de arranque de los analizadores con `python -X importtime`.
+
+    python benchmarks/startup_budget.py [--budget-ms 60] [--runs 5] [--top 8]
+
+Para cada punto de entrada se lanza un intérprete nuevo que solo importa el
+módulo y se toma el tiempo acumulado de ese import (la mediana de `--runs`
+ejecuciones); también se muestra el total con el arranque del intérprete. Además se verifica que no se cargan al
+arrancar módulos que solo hacen falta más tarde (openai, requests, bs4...).
+Sale con código 1 si algún punto de entrada se pasa del presupuesto o carga
+algo prohibido, así que sirve como comprobación en CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# (nombre, directorio desde el que se importa, módulo, módulos que no deben cargarse)
+ENTRY_POINTS = [
+    ('perplexity_analyzer', ROOT_DIR, 'perplexity_analyzer',
+     ['openai', 'httpx', 'pydantic', 'requests', 'bs4']),
+    ('backend.perplexity_analyzer', ROOT_DIR / 'backend' / 'scrapers', 'perplexity_analyzer',
+     ['openai', 'httpx', 'pydantic', 'requests', 'bs4', 'url_fingerprint', 'product_key', 'argparse'])
+]
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def measure(directory, module):
+    """Devuelve (ms del import del módulo, ms de todos los imports,
+    {módulo: ms acumulados}, módulos cargados)"""
+    code = f"import sys; import {module}; print(' '.join(sys.modules))"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    env.pop('PYTHONSTARTUP', None)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=str(directory),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{completed.stderr[-2000:]}")
+
+    total_us = 0
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        cumulative[name] = int(cumulative_us) / 1000
+        if not indent:
+            total_us += int(cumulative_us)
+
+    loaded = set(completed.stdout.split())
+    return cumulative.get(module, 0.0), total_us / 1000, cumulative, loaded
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Presupuesto de arranque de los analizadores')
+    parser.add_argument('--budget-ms', type=float, default=60,
+                        help='Tiempo máximo de imports por punto de entrada')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='Imports más lentos que se muestran')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    failed = False
+
+    for name, directory, module, forbidden in ENTRY_POINTS:
+        results = [measure(directory, module) for _ in range(args.runs)]
+        median = statistics.median(own for own, _, _, _ in results)
+        median_total = statistics.median(total for _, total, _, _ in results)
+        _, _, cumulative, loaded = results[-1]
+        unexpected = sorted(module_name for module_name in forbidden if module_name in loaded)
+
+        over_budget = median > args.budget_ms
+        status = 'OK' if not over_budget and not unexpected else 'FALLO'
+        print(f"{status:<6}{name}: {median:.1f} ms (presupuesto {args.budget_ms:.0f} ms, "
+              f"{median_total:.1f} ms con el arranque del intérprete)")
+        if unexpected:
+            print(f"      carga al arrancar: {', '.join(unexpected)}")
+        if over_budget or args.top:
+            slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]
+            for module_name, ms in slowest:
+                print(f"      {ms:8.1f} ms  {module_name}")
+        failed = failed or over_budget or bool(unexpected)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+
+
+class _BrowserSlot:
+    """Un navegador con su contexto y las páginas libres para reutilizar"""
+
+    def __init__(self):
+        self.browser = None
+        self.context = None
+        self.idle_pages = []
+        self.pages_in_use = 0
+        self.navigations = 0
+        self.recycling = False
+        self.lock = asyncio.Lock()
+
+    def healthy(self):
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """Pool de navegadores Chromium de larga duración.
+
+    Lanzar Chromium cuesta cientos de milisegundos y más de 100 MB, así que
+    se lanzan `size` navegadores una vez y se reparten páginas entre ellos
+    (hasta `max_pages_per_context` a la vez en cada uno). Un navegador que
+    se desconecta se relanza, y tras `max_navigations` se recicla para acotar
+    la memoria. Si no hay hueco en ningún navegador durante `acquire_timeout`
+    segundos, page() lanza TimeoutError en lugar de esperar para siempre.
+
+        async with BrowserPool(size=2) as pool:
+            async with pool.page() as page:
+                await page.goto(url)
+    """
+
+    def __init__(self, size=None, max_pages_per_context=4, max_navigations=200,
+                 headless=True, context_options=None, acquire_timeout=None):
+        self.size = size or int(os.getenv('BROWSER_POOL_SIZE', 2))
+        self.max_pages_per_context = max_pages_per_context
+        self.max_navigations = max_navigations
+        self.acquire_timeout = acquire_timeout or float(os.getenv('BROWSER_ACQUIRE_TIMEOUT', 60))
+        self.headless = headless
+        self.context_options = context_options or {}
+
+        self._playwright = None
+        self._slots = []
+        self._available = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        self._available = asyncio.Condition()
+        self._slots = [_BrowserSlot() for _ in range(self.size)]
+        await asyncio.gather(*(self._launch(slot) for slot in self._slots))
+
+    async def close(self):
+        await asyncio.gather(*(self._shutdown(slot) for slot in self._slots))
+        self._slots = []
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self, slot):
+        slot.browser = await self._playwright.chromium.launch(headless=self.headless)
+        slot.context = await slot.browser.new_context(**self.context_options)
+        slot.idle_pages = []
+        slot.navigations = 0
+        slot.recycling = False
+
+    async def _shutdown(self, slot):
+        browser, slot.browser, slot.context, slot.idle_pages = slot.browser, None, None, []
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                print(f"Error cerrando navegador: {str(e)}")
+
+    async def _acquire_slot(self):
+        """Espera a un navegador con hueco para otra página (si no está sano,
+        page() lo relanza)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.acquire_timeout
+        async with self._available:
+            while True:
+                if not self._slots:
+                    raise RuntimeError("El pool de navegadores está cerrado")
+                candidates = [
+                    slot for slot in self._slots
+                    if not slot.recycling and slot.pages_in_use < self.max_pages_per_context
+                ]
+                if candidates:
+                    slot = min(candidates, key=lambda s: s.pages_in_use)
+                    slot.pages_in_use += 1
+                    slot.navigations += 1
+                    return slot
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    await asyncio.wait_for(self._available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Ningún navegador libre en {self.acquire_timeout:g} s") from None
+
+    async def _release_slot(self, slot, page):
+        if page is not None and not page.is_closed() and not slot.recycling:
+            slot.idle_pages.append(page)
+
+        try:
+            async with self._available:
+                slot.pages_in_use -= 1
+                if slot.navigations >= self.max_navigations:
+                    slot.recycling = True
+                must_recycle = slot.recycling and slot.pages_in_use == 0
+
+            if must_recycle:
+                async with slot.lock:
+                    await self._shutdown(slot)
+                    try:
+                        await self._launch(slot)
+                    except Exception as e:
+                        # Sin navegador el slot no está sano: page() lo relanza
+                        # en el próximo uso. No se lanza desde aquí para no
+                        # cambiar el resultado de quien devuelve la página.
+                        print(f"Error reciclando navegador: {str(e)}")
+                        await self._shutdown(slot)
+                        slot.navigations = 0
+                        slot.recycling = False
+        finally:
+            async with self._available:
+                self._available.notify_all()
+
+    @asynccontextmanager
+    async def page(self):
+        """Presta una página; al salir vuelve al pool para reutilizarse"""
+        slot = await self._acquire_slot()
+        page = None
+        try:
+            async with slot.lock:
+                if not slot.healthy():
+                    print("Navegador desconectado, relanzando...")
+                    await self._shutdown(slot)
+                    try:
+                        await self._launch(slot)
+                    except Exception:
+                        # Sin contexto no vale: que el siguiente lo vuelva a intentar
+                        await self._shutdown(slot)
+                        raise
+            page = slot.idle_pages.pop() if slot.idle_pages else await slot.context.new_page()
+            yield page
+        except Exception:
+            # Una página que ha fallado puede haber quedado en mal estado
+            if page is not None and not page.is_closed():
+                await page.close()
+            page = None
+            raise
+        finally:
+            await self._release_slot(slot, page)
@@ -0,0 +1,33 @@
+import os
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+
+_loaded = False
+
+
+def load_env():
+    """Carga el .env de la raíz del proyecto una sola vez por proceso.
+
+    Las variables ya definidas en el entorno tienen prioridad. dotenv solo se
+    importa si existe el fichero, así que en producción (variables puestas
+    por la plataforma) no cuesta nada.
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    env_file = ROOT_DIR / '.env'
+    if env_file.is_file():
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+
+
+def perplexity_settings():
+    """api_key y base_url para el cliente de Perplexity"""
+    load_env()
+    return {
+        'api_key': os.getenv('PERPLEXITY_API_KEY'),
+        'base_url': os.getenv('PERPLEXITY_BASE_URL', "https://api.perplexity.ai")
+    }
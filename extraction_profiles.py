@@ -0,0 +1,152 @@
+"""Perfiles de extracción aprendidos por dominio.
+
+Para cada dominio y campo (name, price, features, image) se guarda la
+estrategia (selector CSS o metadato) que dio un valor válido. Las páginas
+siguientes del mismo dominio prueban primero esa estrategia y solo amplían
+la búsqueda si falla.
+
+Cada perfil lleva una tasa de acierto con media exponencial: si baja de
+`min_success` (la tienda ha cambiado la maqueta) se descarta la estrategia
+y se aprende la que haya funcionado. Los perfiles se guardan en SQLite con
+PROFILE_VERSION; al cambiar la forma de las estrategias se sube la versión
+y los perfiles antiguos se ignoran.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from metrics import REGISTRY
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+PROFILE_VERSION = 1
+
+# Tasa de acierto por debajo de la cual se olvida la estrategia aprendida
+MIN_SUCCESS = float(os.getenv('PROFILE_MIN_SUCCESS', 0.5))
+
+# Peso de cada página en la tasa: con 0.2 hacen falta 4 fallos seguidos para olvidar
+SMOOTHING = 0.2
+
+PROFILE_LOOKUPS = REGISTRY.counter(
+    'comparador_profile_lookups_total', 'Extracciones por campo según el perfil (hit/widened/miss)'
+)
+
+
+class ExtractionProfiles:
+    """Estrategias aprendidas por dominio y campo, persistidas en SQLite.
+
+    Igual que ProductKeyRegistry, si la base de datos no está disponible
+    se trabaja solo en memoria.
+    """
+
+    def __init__(self, path=None, min_success=MIN_SUCCESS):
+        self.path = Path(path) if path else CACHE_DIR / 'extraction_profiles.sqlite3'
+        self.min_success = min_success
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._db = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    domain TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    revision INTEGER NOT NULL,
+                    fields TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+            for domain, revision, fields in self._db.execute(
+                'SELECT domain, revision, fields FROM profiles WHERE version = ?', (PROFILE_VERSION,)
+            ):
+                self._profiles[domain] = {'revision': revision, 'fields': json.loads(fields)}
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Perfiles de extracción no disponibles, se usará solo memoria: {str(e)}")
+            self._db = None
+
+    def preferred(self, domain, field):
+        """Estrategia aprendida para el campo, o None"""
+        with self._lock:
+            entry = self._profiles.get(domain, {}).get('fields', {}).get(field)
+            return entry['strategy'] if entry else None
+
+    def order(self, domain, field, strategies):
+        """`strategies` con la aprendida delante (aunque no esté en la lista)"""
+        learned = self.preferred(domain, field)
+        if not learned:
+            return list(strategies)
+        return [learned] + [strategy for strategy in strategies if strategy != learned]
+
+    def record(self, domain, field, strategy):
+        """Apunta qué estrategia dio el campo en una página (None si ninguna)"""
+        with self._lock:
+            profile = self._profiles.setdefault(domain, {'revision': 0, 'fields': {}})
+            entry = profile['fields'].get(field)
+            if entry is None:
+                PROFILE_LOOKUPS.inc(field=field, result='miss' if strategy is None else 'learned')
+                if strategy is None:
+                    return
+                profile['fields'][field] = {'strategy': strategy, 'rate': 1.0, 'uses': 1}
+                profile['revision'] += 1
+                self._save(domain, profile)
+                return
+
+            hit = strategy == entry['strategy']
+            PROFILE_LOOKUPS.inc(field=field, result='hit' if hit else 'widened' if strategy else 'miss')
+            entry['rate'] = (1 - SMOOTHING) * entry['rate'] + SMOOTHING * hit
+            entry['uses'] += 1
+            if not hit and entry['rate'] < self.min_success:
+                print(f"Perfil de {domain} invalidado para {field}: {entry['strategy']} ({entry['rate']:.2f})")
+                if strategy:
+                    profile['fields'][field] = {'strategy': strategy, 'rate': 1.0, 'uses': 1}
+                else:
+                    del profile['fields'][field]
+                profile['revision'] += 1
+            self._save(domain, profile)
+
+    def invalidate(self, domain, field=None):
+        """Olvida lo aprendido de un dominio (o de uno de sus campos)"""
+        with self._lock:
+            profile = self._profiles.get(domain)
+            if not profile:
+                return
+            if field is None:
+                profile['fields'].clear()
+            else:
+                profile['fields'].pop(field, None)
+            profile['revision'] += 1
+            self._save(domain, profile)
+
+    def _save(self, domain, profile):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO profiles (domain, version, revision, fields, updated) VALUES (?, ?, ?, ?, ?)',
+                (domain, PROFILE_VERSION, profile['revision'], json.dumps(profile['fields']), time.time())
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error guardando el perfil de {domain}: {str(e)}")
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._profiles))
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_profiles():
+    """Perfiles compartidos por todo el proceso"""
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = ExtractionProfiles(os.getenv('EXTRACTION_PROFILES_PATH'))
+    return _profiles
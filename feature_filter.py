@@ -0,0 +1,206 @@
+"""Clasificación de textos de la página como características del producto.
+
+Los léxicos por categoría (las de url_fingerprint.CATEGORIES), los términos
+de especificación comunes y las palabras de navegación se compilan una sola
+vez en una única expresión regular, igual que en url_fingerprint. Cada texto
+se recorre una vez, se puntúa según los términos que contiene y, tras
+quitar duplicados, se quedan los `k` mejores: menos ruido y especificaciones
+más útiles en el prompt.
+"""
+import heapq
+import re
+from functools import lru_cache
+
+MAX_FEATURES = 10
+MIN_LENGTH = 11
+MAX_LENGTH = 200
+
+# Las mismas que filtraba ProductScraper; se usan también en el navegador
+NAVIGATION_WORDS = ['cookie', 'menú', 'inicio', 'carrito', 'cuenta', 'login', 'regístrate', 'perfil']
+
+# Textos que no son del producto (sin tildes: se comparan con el texto normalizado)
+EXCLUDE_TERMS = [
+    'cookie', 'cookies', 'menu', 'inicio', 'carrito', 'cuenta', 'login', 'registrate', 'perfil', 'registro',
+    'envio', 'envios', 'devolucion', 'devoluciones', 'politica', 'privacidad', 'newsletter', 'ayuda',
+    'contacto', 'siguenos', 'redes sociales', 'atencion al cliente', 'financiacion', 'valoraciones',
+    'opiniones', 'preguntas frecuentes', 'iniciar sesion'
+]
+
+# Especificaciones que valen para cualquier producto
+GENERIC_TERMS = [
+    'dimensiones', 'medidas', 'peso', 'alto', 'ancho', 'fondo', 'color', 'material', 'consumo',
+    'clase energetica', 'eficiencia energetica', 'potencia', 'conectividad', 'wifi', 'bluetooth',
+    'usb', 'garantia del fabricante', 'modelo', 'referencia'
+]
+
+# Un léxico por cada categoría de url_fingerprint.CATEGORIES
+LEXICONS = {
+    'tv': ['pulgadas', 'pantalla', 'panel', 'resolucion', 'uhd', '4k', '8k', 'oled', 'qled', 'mini led', 'hdr',
+           'hdr10', 'dolby vision', 'dolby atmos', 'smart tv', 'sistema operativo', 'webos', 'tizen', 'google tv',
+           'procesador', 'tasa de refresco', 'hdmi', 'hdmi 2.1', 'vesa', 'sonido', 'altavoces', 'sintonizador',
+           'tdt', 'vrr', 'allm'],
+    'telefono': ['pantalla', 'procesador', 'ram', 'almacenamiento', 'camara', 'camara principal', 'camara frontal',
+                 'bateria', 'carga rapida', 'carga inalambrica', '5g', 'nfc', 'sim', 'esim', 'android', 'ios',
+                 'resistencia al agua', 'ip68', 'amoled', 'tasa de refresco'],
+    'portatil': ['procesador', 'cpu', 'ram', 'memoria', 'ssd', 'almacenamiento', 'pantalla', 'resolucion',
+                 'tarjeta grafica', 'grafica', 'gpu', 'bateria', 'autonomia', 'teclado', 'retroiluminado',
+                 'sistema operativo', 'windows', 'thunderbolt', 'usb-c', 'hdmi', 'webcam', 'peso', 'ddr4', 'ddr5'],
+    'sobremesa': ['procesador', 'cpu', 'ram', 'memoria', 'ssd', 'hdd', 'almacenamiento', 'tarjeta grafica',
+                  'grafica', 'gpu', 'fuente de alimentacion', 'placa base', 'refrigeracion', 'sistema operativo',
+                  'windows', 'ddr4', 'ddr5'],
+    'tablet': ['pantalla', 'procesador', 'ram', 'almacenamiento', 'bateria', 'autonomia', 'camara', 'lapiz',
+               'teclado', 'android', 'ipados', '5g', 'wifi 6'],
+    'nevera': ['capacidad', 'litros', 'capacidad neta', 'no frost', 'congelador', 'frigorifico', 'combi',
+               'clase energetica', 'nivel de ruido', 'ruido', 'dispensador', 'inverter', 'zona fresca',
+               'cajones', 'estantes', 'puertas', 'alto', 'ancho'],
+    'lavadora': ['capacidad', 'carga', 'kg', 'centrifugado', 'rpm', 'programas', 'motor', 'inverter',
+                 'clase energetica', 'nivel de ruido', 'ruido', 'vapor', 'autodosificacion', 'inicio diferido',
+                 'programa rapido', 'antialergias', 'consumo de agua'],
+    'secadora': ['capacidad', 'carga', 'kg', 'bomba de calor', 'condensacion', 'programas', 'sensor de humedad',
+                 'clase energetica', 'nivel de ruido', 'ruido', 'antiarrugas'],
+    'lavavajillas': ['cubiertos', 'servicios', 'programas', 'clase energetica', 'nivel de ruido', 'ruido',
+                     'consumo de agua', 'tercera bandeja', 'secado', 'media carga', 'integrable', 'inicio diferido'],
+    'monitor': ['pulgadas', 'pantalla', 'panel', 'ips', 'va', 'oled', 'resolucion', 'tasa de refresco', 'hz',
+                'tiempo de respuesta', 'ms', 'hdr', 'brillo', 'nits', 'contraste', 'freesync', 'g-sync',
+                'displayport', 'hdmi', 'usb-c', 'curvo', 'vesa', 'ajuste de altura'],
+    'auriculares': ['cancelacion de ruido', 'anc', 'bateria', 'autonomia', 'bluetooth', 'codec', 'ldac', 'aptx',
+                    'microfono', 'drivers', 'respuesta en frecuencia', 'resistencia al agua', 'estuche de carga',
+                    'multipunto'],
+    'consola': ['almacenamiento', 'ssd', 'resolucion', '4k', 'fps', 'hdr', 'mando', 'lector', 'juegos',
+                'retrocompatibilidad', 'ray tracing', 'hdmi 2.1'],
+    'tarjeta_grafica': ['memoria', 'vram', 'gddr6', 'gddr6x', 'nucleos', 'cuda', 'frecuencia', 'boost',
+                        'ray tracing', 'dlss', 'fsr', 'consumo', 'tdp', 'conectores', 'displayport', 'hdmi',
+                        'pcie', 'ranuras']
+}
+
+# Cifras con unidad: casi siempre son especificaciones
+_UNITS = ['pulgadas', 'pulg', '"', 'hz', 'gb', 'tb', 'mb', 'ghz', 'mhz', 'kg', 'g', 'l', 'litros', 'w', 'kw',
+          'kwh', 'mah', 'mp', 'rpm', 'db', 'nits', 'cd/m2', 'ms', 'mm', 'cm', 'v', 'h', 'horas', 'fps', 'bits']
+
+# Puntuación
+CATEGORY_TERM_SCORE = 2.0
+GENERIC_TERM_SCORE = 1.0
+OTHER_CATEGORY_TERM_SCORE = 0.3
+MEASURE_SCORE = 1.0
+MAX_TERM_HITS = 3
+SPEC_SHAPE_SCORE = 1.0
+BULLET_SCORE = 0.5
+LONG_TEXT_PENALTY = 0.5
+LONG_TEXT = 120
+MIN_SCORE = 1.0
+
+_FOLD = str.maketrans('áéíóúüàèìòùâêîôûñ', 'aeiouuaeiouaeioun')
+
+
+def normalize(text):
+    """Minúsculas, sin tildes y con los espacios colapsados"""
+    text = text.lower()
+    # translate es lento; la mayoría de textos no llevan tildes
+    if not text.isascii():
+        text = text.translate(_FOLD)
+    return ' '.join(text.split())
+
+
+def _alternatives(words):
+    # Las alternativas más largas primero para que "hdmi 2.1" gane a "hdmi"
+    return '|'.join(re.escape(word).replace(r'\ ', r'\s') for word in sorted(set(words), key=len, reverse=True))
+
+
+_TERMS = {term for terms in LEXICONS.values() for term in terms} | set(GENERIC_TERMS)
+
+MATCHER = re.compile(
+    rf'(?P<measure>\d+(?:[.,]\d+)?\s?(?:{_alternatives(_UNITS)}))(?![a-z0-9])'
+    rf'|(?<![a-z0-9])(?:(?P<exclude>{_alternatives(EXCLUDE_TERMS)})|(?P<term>{_alternatives(_TERMS)}))(?![a-z0-9])'
+)
+
+_BULLETS = '-•·*▪–'
+_BULLET = re.compile(rf'^[{re.escape(_BULLETS)}]\s*')
+
+
+def _spec_key(normalized):
+    """Clave para quitar duplicados: el nombre de la especificación si es
+    "nombre: valor" y, si no, el texto sin viñetas ni puntuación"""
+    text = _BULLET.sub('', normalized)
+    name, colon, value = text.partition(':')
+    if colon and value.strip() and len(name) <= 40:
+        return name.strip()
+    return re.sub(r'[^\w ]+', '', text).strip()
+
+
+class FeatureFilter:
+    """Puntúa y selecciona características para una categoría (o ninguna)"""
+
+    def __init__(self, category=None):
+        self.category = category
+        self.category_terms = {term for term in LEXICONS.get(category, [])}
+
+    def _term_score(self, term):
+        if self.category is None:
+            return GENERIC_TERM_SCORE
+        if term in self.category_terms:
+            return CATEGORY_TERM_SCORE
+        if term in GENERIC_TERMS:
+            return GENERIC_TERM_SCORE
+        return OTHER_CATEGORY_TERM_SCORE
+
+    def score(self, text):
+        """Puntuación del texto como característica; 0 si no lo es"""
+        if not text or not MIN_LENGTH <= len(text) <= MAX_LENGTH:
+            return 0.0
+        # Sin dos puntos ni viñeta no es una característica: se descarta sin más
+        if ':' not in text and text[0] not in _BULLETS:
+            return 0.0
+        normalized = normalize(text)
+        name, colon, value = normalized.partition(':')
+        bullet = _BULLET.match(normalized) is not None
+        shaped = bool(colon and name.strip() and value.strip() and 'http' not in name)
+        if not (shaped or bullet):
+            return 0.0
+
+        score = SPEC_SHAPE_SCORE if shaped else BULLET_SCORE
+        terms = set()
+        measured = False
+        for match in MATCHER.finditer(normalized):
+            kind = match.lastgroup
+            if kind == 'exclude':
+                return 0.0
+            if kind == 'measure':
+                measured = True
+            else:
+                terms.add(' '.join(match.group(kind).split()))
+
+        score += sum(sorted((self._term_score(term) for term in terms), reverse=True)[:MAX_TERM_HITS])
+        if measured:
+            score += MEASURE_SCORE
+        if len(text) > LONG_TEXT:
+            score -= LONG_TEXT_PENALTY
+        return score
+
+    def select(self, texts, k=MAX_FEATURES):
+        """Los `k` mejores textos sin duplicados, de más a menos puntuación
+        (a igualdad, en el orden de la página)"""
+        best = {}
+        seen = set()
+        for index, text in enumerate(texts):
+            # Menús y pies se repiten muchas veces en la misma página
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            text = ' '.join(text.split())
+            score = self.score(text)
+            if score < MIN_SCORE:
+                continue
+            key = _spec_key(normalize(text))
+            if key not in best or score > best[key][0]:
+                best[key] = (score, -index, text)
+        return [text for _, _, text in heapq.nlargest(k, best.values())]
+
+
+@lru_cache(maxsize=None)
+def get_filter(category=None):
+    """Filtro compartido por categoría"""
+    return FeatureFilter(category)
+
+
+def select_features(texts, category=None, k=MAX_FEATURES):
+    return get_filter(category).select(texts, k)
@@ -0,0 +1,262 @@
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class DNSCache:
+    """Caché de resoluciones DNS de un FetchClient.
+
+    Solo la usan las conexiones de su adaptador de requests (aiohttp tiene
+    la suya en el conector); socket.getaddrinfo no se toca.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """Direcciones IP de `host`, en el orden de getaddrinfo"""
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (addresses, now + self.ttl)
+        return addresses
+
+
+def _cached_dns_connection(base, dns_cache):
+    """Subclase de la conexión de urllib3 que resuelve con `dns_cache`.
+
+    Solo cambia el host al que se conecta el socket (`_dns_host`); SNI y la
+    verificación del certificado siguen usando el nombre del dominio.
+    """
+
+    class CachedDNSConnection(base):
+        def _new_conn(self):
+            host = self._dns_host
+            try:
+                addresses = dns_cache.resolve(host, self.port)
+            except OSError:
+                # Que urllib3 dé su error de resolución de siempre
+                return super()._new_conn()
+            error = None
+            try:
+                for address in addresses:
+                    self._dns_host = address
+                    try:
+                        return super()._new_conn()
+                    except Exception as e:
+                        error = e
+                raise error
+            finally:
+                self._dns_host = host
+
+    return CachedDNSConnection
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """HTTPAdapter cuyas conexiones resuelven con una DNSCache propia"""
+
+    def __init__(self, dns_cache, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+            pools[scheme] = type(pool_class.__name__, (pool_class,), {
+                'ConnectionCls': _cached_dns_connection(pool_class.ConnectionCls, self.dns_cache)
+            })
+        self.poolmanager.pool_classes_by_scheme = pools
+
+
+class HostStats:
+    """Latencias por dominio (tiempo hasta recibir las cabeceras)"""
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds, ok=True):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {
+                'requests': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'ewma': None
+            })
+            stats['requests'] += 1
+            if not ok:
+                stats['errors'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['ewma'] = seconds if stats['ewma'] is None else 0.8 * stats['ewma'] + 0.2 * seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                host: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(1000 * stats['total'] / stats['requests'], 1),
+                    'ewma_ms': round(1000 * stats['ewma'], 1),
+                    'max_ms': round(1000 * stats['max'], 1)
+                }
+                for host, stats in self._hosts.items()
+            }
+
+
+class FetchClient:
+    """Cliente HTTP compartido para descargar páginas de producto.
+
+    Mantiene conexiones keep-alive por dominio (como mucho
+    `max_connections_per_host` simultáneas contra cada tienda), pide
+    contenido comprimido y apunta la latencia de cada dominio. Sirve tanto
+    para código síncrono (`get`) como asíncrono (`get_text_async`).
+
+    Con `base_url` todas las páginas se piden a ese servidor como
+    `{base_url}/{dominio}{ruta}`; lo usan los benchmarks para trabajar con
+    páginas grabadas y sin red.
+    """
+
+    def __init__(self, max_connections_per_host=4, timeout=10, dns_ttl=300, base_url=None):
+        self.max_connections_per_host = max_connections_per_host
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.dns_cache = DNSCache(ttl=dns_ttl)
+        self.stats = HostStats()
+
+        self.headers = make_headers(accept_encoding=True)
+        self.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept-Language': 'es-ES,es;q=0.9',
+            'Connection': 'keep-alive'
+        })
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = CachedDNSAdapter(
+            self.dns_cache,
+            pool_connections=32,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Una sesión de aiohttp por bucle de eventos (asyncio.run crea uno por llamada)
+        self._async_sessions = {}
+
+    def _resolve(self, url):
+        if not self.base_url:
+            return url
+        parsed = urlparse(url)
+        return f"{self.base_url}/{parsed.netloc}{parsed.path}" + (f"?{parsed.query}" if parsed.query else '')
+
+    def get(self, url, **kwargs):
+        """GET síncrono reutilizando conexiones; acepta los argumentos de requests"""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self._resolve(url), **kwargs)
+        except requests.RequestException:
+            self.stats.record(host, time.perf_counter() - start, ok=False)
+            raise
+        self.stats.record(host, time.perf_counter() - start, ok=response.ok)
+        return response
+
+    async def get_text_async(self, url, **kwargs):
+        """GET asíncrono con aiohttp; devuelve (status, texto)"""
+        import asyncio
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        entry = self._async_sessions.get(loop)
+        if entry is None:
+            entry = await self._open_async_session(loop)
+        session = entry[0]
+
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            async with session.get(self._resolve(url), **kwargs) as response:
+                self.stats.record(host, time.perf_counter() - start, ok=response.status < 400)
+                return response.status, await response.text(errors='replace')
+        except aiohttp.ClientError:
+            self.stats.record(host, time.perf_counter() - start, ok=False)
+            raise
+
+    async def _open_async_session(self, loop):
+        import aiohttp
+
+        # Bucles cerrados sin shutdown_asyncgens: ya no se puede cerrar su sesión
+        for other in [other for other in self._async_sessions if other.is_closed()]:
+            self._async_sessions.pop(other, None)
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.max_connections_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=60
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        guard = self._close_on_shutdown(loop, session)
+        entry = (session, guard)
+        self._async_sessions[loop] = entry
+        await guard.__anext__()
+        return entry
+
+    async def _close_on_shutdown(self, loop, session):
+        """Generador asíncrono que cierra la sesión en su propio bucle: el
+        bucle lo cierra en shutdown_asyncgens (al terminar asyncio.run)"""
+        try:
+            yield
+        finally:
+            entry = self._async_sessions.get(loop)
+            if entry is not None and entry[0] is session:
+                del self._async_sessions[loop]
+            await session.close()
+
+    async def close_async(self):
+        """Cierra la sesión del bucle actual"""
+        import asyncio
+
+        entry = self._async_sessions.get(asyncio.get_running_loop())
+        if entry is not None:
+            await entry[1].aclose()
+
+
+_fetch_client = None
+_client_lock = threading.Lock()
+
+
+def get_fetch_client():
+    """Cliente compartido por todo el proceso, configurado por variables de entorno"""
+    global _fetch_client
+    with _client_lock:
+        if _fetch_client is None:
+            _fetch_client = FetchClient(
+                max_connections_per_host=int(os.getenv('FETCH_MAX_CONNECTIONS_PER_HOST', 4)),
+                timeout=float(os.getenv('FETCH_TIMEOUT', 10)),
+                dns_ttl=int(os.getenv('FETCH_DNS_TTL', 300)),
+                base_url=os.getenv('FETCH_BASE_URL')
+            )
+    return _fetch_client
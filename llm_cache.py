@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+
+class ResponseCache:
+    """Caché de respuestas en dos niveles: LRU en memoria delante de SQLite en disco.
+
+    Las entradas caducan según su TTL y el fichero se recorta por tamaño
+    eliminando primero lo menos usado. La base de datos se comparte entre
+    procesos, así que una respuesta obtenida por un worker sirve a los demás
+    y sobrevive a los reinicios.
+    """
+
+    def __init__(self, path=None, max_memory_entries=256, max_disk_bytes=50 * 1024 * 1024,
+                 default_ttl=6 * 3600):
+        self.path = Path(path) if path else CACHE_DIR / 'llm_cache.sqlite3'
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.default_ttl = default_ttl
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0
+        }
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            """)
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Caché en disco no disponible, se usará solo memoria: {str(e)}")
+            self._db = None
+
+    @staticmethod
+    def make_key(model, temperature, messages):
+        """Genera la clave a partir del prompt normalizado, el modelo y la temperatura"""
+        normalized = [
+            [message['role'], re.sub(r'\s+', ' ', message['content']).strip()]
+            for message in messages
+        ]
+        payload = json.dumps([model, temperature, normalized], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe o ha caducado"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+            row = None
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        'SELECT value, expires_at FROM entries WHERE key = ?', (key,)
+                    ).fetchone()
+                    if row and row[1] > now:
+                        self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+                        self._db.commit()
+                    else:
+                        row = None
+                except sqlite3.Error as e:
+                    print(f"Error leyendo caché: {str(e)}")
+                    row = None
+
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+
+            self.counters['disk_hits'] += 1
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key, value, ttl=None):
+        """Guarda un valor de texto con su TTL en segundos"""
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.counters['writes'] += 1
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at, size) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, value, expires_at, now, len(value.encode('utf-8')))
+                )
+                self._evict_disk(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Error escribiendo caché: {str(e)}")
+
+    def get_json(self, key):
+        """Como get, pero para valores guardados con set_json"""
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def set_json(self, key, value, ttl=None):
+        self.set(key, json.dumps(value, ensure_ascii=False), ttl)
+
+    def stats(self):
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        """Elimina lo caducado y, si se supera el tamaño máximo, lo menos usado"""
+        deleted = self._db.execute('DELETE FROM entries WHERE expires_at <= ?', (now,)).rowcount
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total > self.max_disk_bytes:
+            target = int(self.max_disk_bytes * 0.9)
+            rows = self._db.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                stale.append((key,))
+                total -= size
+            self._db.executemany('DELETE FROM entries WHERE key = ?', stale)
+            deleted += len(stale)
+        self.counters['evictions'] += max(deleted, 0)
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Caché compartida por todo el proceso, configurada por variables de entorno"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(
+            path=os.getenv('LLM_CACHE_PATH'),
+            max_memory_entries=int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', 256)),
+            max_disk_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', 50)) * 1024 * 1024),
+            default_ttl=int(os.getenv('LLM_CACHE_TTL', 6 * 3600))
+        )
+    return _default_cache
@@ -0,0 +1,455 @@
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from metrics import REGISTRY, span
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Clases de prioridad: a igualdad de recursos sale antes la de menor valor
+PRIORITIES = {'interactive': 0, 'batch': 1, 'prewarm': 2}
+
+# Espera entre comprobaciones de las llamadas que no pueden salir: las de
+# otros procesos no despiertan a las de este, así que se vuelve a mirar
+POLL_SECONDS = 0.05
+
+# Latido de cada proceso con llamadas en espera o en vuelo; las de un
+# proceso sin latido desde hace STALE_SECONDS (ha muerto) dejan de contar
+HEARTBEAT_SECONDS = 5
+STALE_SECONDS = 30
+
+LLM_RATE_LIMITED = REGISTRY.counter(
+    'comparador_llm_rate_limited_total', 'Respuestas 429 de la API del modelo'
+)
+
+_priority = contextvars.ContextVar('llm_priority', default='interactive')
+
+
+@contextmanager
+def priority(name):
+    """Prioridad de las llamadas al modelo hechas dentro del bloque (y de los
+    hilos lanzados con una copia del contexto)"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Fallos de red o de tiempo de espera del cliente (openai no se importa aquí:
+# se reconocen por el nombre de la clase)
+_TRANSIENT_ERRORS = {'APIConnectionError', 'APITimeoutError'}
+
+
+def _transient(error):
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def _status_code(error):
+    return getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Planificador común de todas las llamadas al modelo, compartido entre
+    procesos.
+
+    Antes de cada llamada se reserva una plaza de concurrencia y fichas de
+    los cubos de peticiones/minuto y tokens/minuto (prompt estimado más
+    `max_tokens`; lo no usado se devuelve al terminar). Las llamadas
+    esperan en una cola por prioridad: las interactivas pasan delante de
+    las de lotes y precalentamiento, y `class_limits` acota las que pueden
+    estar en vuelo de una clase (BATCH_LLM_CONCURRENCY para 'batch').
+
+    El estado (cubos, llamadas en vuelo y en espera, límite de concurrencia
+    y bloqueo tras un 429) vive en SQLite, así que los workers de server.js
+    y el del pool de lotes comparten los mismos límites: LLM_RPM, LLM_TPM,
+    LLM_CONCURRENCY y BATCH_LLM_CONCURRENCY son para todo el servidor y la
+    cola ordena las llamadas de todos los procesos. Igual que en
+    ProductKeyRegistry, si la base de datos no está disponible se trabaja
+    solo en memoria (y los límites pasan a ser del proceso).
+
+    La concurrencia se ajusta con AIMD: sube poco a poco mientras la
+    latencia está por debajo de `latency_target` y se reduce a la mitad con
+    un 429 (y un 20 % si la latencia se dispara). Tras un 429 nadie sale
+    hasta que pasa el Retry-After, y la llamada se reintenta hasta
+    `max_retries` veces; lo mismo con los 5xx y los errores de conexión o
+    de tiempo agotado, con espera exponencial.
+    """
+
+    def __init__(self, rpm=0, tpm=0, concurrency=4, max_concurrency=16, min_concurrency=1,
+                 latency_target=30.0, max_retries=3, backoff=1.0, class_limits=None, path=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.class_limits = {PRIORITIES[name]: limit for name, limit in (class_limits or {}).items() if limit}
+
+        self.path = Path(path) if path else CACHE_DIR / 'llm_scheduler.sqlite3'
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._active = 0
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._db = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = self._open(str(self.path))
+        except (OSError, sqlite3.Error) as e:
+            print(f"Planificador compartido no disponible, se usará solo memoria: {str(e)}")
+            self._db = self._open(':memory:')
+
+    def _open(self, database):
+        db = sqlite3.connect(database, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS owners (
+                owner TEXT PRIMARY KEY,
+                seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                running INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS calls_queue ON calls (running, priority, id);
+            CREATE TABLE IF NOT EXISTS state (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        self._db = db
+        with self._transaction() as db:
+            now = time.time()
+            self._purge(db, now)
+            # Sin ningún proceso vivo se empieza de cero (límite de la
+            # configuración actual, cubos llenos)
+            if db.execute('SELECT COUNT(*) FROM owners').fetchone()[0] == 0:
+                db.execute('DELETE FROM calls')
+                db.execute('DELETE FROM state')
+            db.executemany('INSERT OR IGNORE INTO state (name, value) VALUES (?, ?)', [
+                ('limit', float(self.concurrency)), ('blocked_until', 0.0), ('last_decrease', 0.0),
+                ('requests_level', float(self.rpm)), ('requests_updated', now),
+                ('tokens_level', float(self.tpm)), ('tokens_updated', now)
+            ])
+        return db
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rpm=float(os.getenv('LLM_RPM', 0)),
+            tpm=float(os.getenv('LLM_TPM', 0)),
+            concurrency=int(os.getenv('LLM_CONCURRENCY', 4)),
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 16)),
+            latency_target=float(os.getenv('LLM_LATENCY_TARGET', 30)),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', 3)),
+            class_limits={'batch': int(os.getenv('BATCH_LLM_CONCURRENCY', 4))},
+            path=os.getenv('LLM_SCHEDULER_PATH')
+        )
+
+    def stats(self):
+        """Estado compartido por todos los procesos"""
+        now = time.time()
+        with self._transaction() as db:
+            state = self._state(db)
+            running, waiting = db.execute(
+                'SELECT COALESCE(SUM(running), 0), COUNT(*) - COALESCE(SUM(running), 0) FROM calls'
+            ).fetchone()
+        return {
+            'limit': round(state['limit'], 2),
+            'in_flight': running,
+            'waiting': waiting,
+            'blocked_for': max(0.0, round(state['blocked_until'] - now, 2))
+        }
+
+    # --- Estado en SQLite ---
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def _state(self, db):
+        return dict(db.execute('SELECT name, value FROM state').fetchall())
+
+    def _set(self, db, **values):
+        db.executemany('UPDATE state SET value = ? WHERE name = ?', [(value, name) for name, value in values.items()])
+
+    def _purge(self, db, now):
+        db.execute('DELETE FROM calls WHERE owner IN (SELECT owner FROM owners WHERE seen < ?)', (now - STALE_SECONDS,))
+        db.execute('DELETE FROM owners WHERE seen < ?', (now - STALE_SECONDS,))
+
+    def _beat(self, db, now):
+        db.execute('INSERT OR REPLACE INTO owners (owner, seen) VALUES (?, ?)', (self.owner, now))
+
+    def _bucket(self, state, name, per_minute, now):
+        """Fichas disponibles ahora en el cubo `name` (se rellena a
+        `per_minute` por minuto hasta `per_minute`)"""
+        elapsed = max(0.0, now - state[f'{name}_updated'])
+        return min(per_minute, state[f'{name}_level'] + elapsed * per_minute / 60)
+
+    def _delay(self, level, amount, per_minute):
+        """Segundos hasta tener `amount` fichas (0 si ya están o no hay límite)"""
+        if not per_minute:
+            return 0
+        amount = min(amount, per_minute)
+        return 0 if level >= amount else (amount - level) / (per_minute / 60)
+
+    # --- Reserva y liberación ---
+
+    def _enqueue(self):
+        with self._transaction() as db:
+            self._beat(db, time.time())
+            call_id = db.execute(
+                'INSERT INTO calls (owner, priority, running) VALUES (?, ?, 0)',
+                (self.owner, PRIORITIES[_priority.get()])
+            ).lastrowid
+        with self._wakeup:
+            self._active += 1
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._keep_alive, daemon=True)
+                self._heartbeat.start()
+        return call_id
+
+    def _finish(self, call_id):
+        with self._wakeup:
+            self._active -= 1
+            self._wakeup.notify_all()
+
+    def _dequeue(self, call_id):
+        try:
+            with self._transaction() as db:
+                db.execute('DELETE FROM calls WHERE id = ?', (call_id,))
+        finally:
+            self._finish(call_id)
+
+    def _keep_alive(self):
+        """Mantiene el latido mientras el proceso tenga llamadas"""
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            if not self._active:
+                continue
+            try:
+                with self._transaction() as db:
+                    self._beat(db, time.time())
+            except sqlite3.Error as e:
+                print(f"Error actualizando el planificador: {str(e)}")
+
+    def _grant(self, call_id, cost):
+        """0 si la llamada puede salir ya, los segundos que debe esperar o
+        None si depende de que termine otra"""
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                self._beat(db, now)
+                self._purge(db, now)
+                head = db.execute(
+                    'SELECT id, priority FROM calls WHERE running = 0 ORDER BY priority, id LIMIT 1'
+                ).fetchone()
+                if head is None or head[0] != call_id:
+                    return None
+                state = self._state(db)
+                if now < state['blocked_until']:
+                    return state['blocked_until'] - now
+                running = db.execute('SELECT COUNT(*) FROM calls WHERE running = 1').fetchone()[0]
+                if running >= max(self.min_concurrency, int(state['limit'])):
+                    return None
+                class_limit = self.class_limits.get(head[1])
+                if class_limit and db.execute(
+                    'SELECT COUNT(*) FROM calls WHERE running = 1 AND priority = ?', (head[1],)
+                ).fetchone()[0] >= class_limit:
+                    return None
+
+                requests = self._bucket(state, 'requests', self.rpm, now)
+                tokens = self._bucket(state, 'tokens', self.tpm, now)
+                delay = max(self._delay(requests, 1, self.rpm), self._delay(tokens, cost, self.tpm))
+                if delay > 0:
+                    return delay
+
+                self._set(
+                    db,
+                    requests_level=requests - min(1, self.rpm), requests_updated=now,
+                    tokens_level=tokens - min(cost, self.tpm), tokens_updated=now
+                )
+                db.execute('UPDATE calls SET running = 1 WHERE id = ?', (call_id,))
+                return 0
+        except sqlite3.OperationalError as e:
+            # Base de datos ocupada más de la cuenta: se vuelve a intentar
+            print(f"Planificador ocupado: {str(e)}")
+            return POLL_SECONDS
+
+    def _release(self, call_id, unused_tokens, latency=None, rate_limited=None, failed=False):
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                db.execute('DELETE FROM calls WHERE id = ?', (call_id,))
+                state = self._state(db)
+                if self.tpm:
+                    tokens = self._bucket(state, 'tokens', self.tpm, now)
+                    self._set(db, tokens_level=min(self.tpm, tokens + max(0, unused_tokens)), tokens_updated=now)
+
+                if rate_limited is not None:
+                    LLM_RATE_LIMITED.inc()
+                    wait = rate_limited if rate_limited else self.backoff
+                    self._set(db, blocked_until=max(state['blocked_until'], now + wait))
+                    self._decrease(db, state, now, 0.5)
+                elif latency is not None and not failed:
+                    if latency > self.latency_target:
+                        self._decrease(db, state, now, 0.8)
+                    else:
+                        limit = state['limit']
+                        self._set(db, limit=min(self.max_concurrency, limit + 1 / limit))
+        except sqlite3.Error as e:
+            print(f"Error liberando la llamada en el planificador: {str(e)}")
+        finally:
+            self._finish(call_id)
+
+    def _decrease(self, db, state, now, factor):
+        # Una sola reducción por "ronda": las respuestas que ya estaban en
+        # vuelo cuando llegó la primera señal no vuelven a recortar
+        if now - state['last_decrease'] < 1.0:
+            return
+        self._set(db, last_decrease=now, limit=max(self.min_concurrency, state['limit'] * factor))
+
+    def _acquire(self, cost):
+        call_id = self._enqueue()
+        try:
+            while True:
+                delay = self._grant(call_id, cost)
+                if delay == 0:
+                    return call_id
+                # Las de este proceso despiertan al liberar; las de otros, no
+                with self._wakeup:
+                    self._wakeup.wait(min(delay or POLL_SECONDS, 1.0))
+        except BaseException:
+            self._dequeue(call_id)
+            raise
+
+    async def _acquire_async(self, cost):
+        import asyncio
+        call_id = self._enqueue()
+        try:
+            while True:
+                delay = self._grant(call_id, cost)
+                if delay == 0:
+                    return call_id
+                await asyncio.sleep(min(delay or POLL_SECONDS, 1.0))
+        except BaseException:
+            self._dequeue(call_id)
+            raise
+
+    # --- Llamadas ---
+
+    def _outcome(self, error, attempt):
+        """Qué hacer tras un error: (retry_after para _release, segundos a
+        esperar antes de reintentar) o None si no se reintenta"""
+        status = _status_code(error)
+        if status == 429:
+            return (_retry_after(error) or 0, None)
+        if ((status and status >= 500) or _transient(error)) and attempt < self.max_retries:
+            return (None, self.backoff * 2 ** attempt)
+        return None
+
+    def call(self, fn, prompt_tokens=0, max_tokens=0):
+        """Ejecuta `fn()` (una llamada al modelo) respetando los límites"""
+        cost = prompt_tokens + max_tokens
+        for attempt in range(self.max_retries + 1):
+            with span_queue():
+                call_id = self._acquire(cost)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                outcome = self._outcome(e, attempt)
+                self._release(call_id, max_tokens, rate_limited=outcome[0] if outcome else None, failed=True)
+                if outcome is None or attempt == self.max_retries:
+                    raise
+                if outcome[1]:
+                    time.sleep(outcome[1])
+                continue
+            except BaseException:
+                self._release(call_id, max_tokens, failed=True)
+                raise
+            self._release(call_id, _unused(result, max_tokens), latency=time.monotonic() - start)
+            return result
+
+    async def acall(self, fn, prompt_tokens=0, max_tokens=0):
+        """Versión para asyncio de call: `fn()` devuelve una corrutina"""
+        import asyncio
+        cost = prompt_tokens + max_tokens
+        for attempt in range(self.max_retries + 1):
+            with span_queue():
+                call_id = await self._acquire_async(cost)
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except BaseException as e:
+                outcome = self._outcome(e, attempt) if isinstance(e, Exception) else None
+                self._release(call_id, max_tokens, rate_limited=outcome[0] if outcome else None, failed=True)
+                if outcome is None or attempt == self.max_retries:
+                    raise
+                if outcome[1]:
+                    await asyncio.sleep(outcome[1])
+                continue
+            self._release(call_id, _unused(result, max_tokens), latency=time.monotonic() - start)
+            return result
+
+
+def _unused(result, max_tokens):
+    """Tokens reservados y no generados, estimados a 4 caracteres por token"""
+    if isinstance(result, str):
+        return max_tokens - len(result) // 4
+    return 0
+
+
+@contextmanager
+def span_queue():
+    """Tiempo de espera en la cola del planificador, como etapa `llm_queue`"""
+    with span('llm_queue', priority=_priority.get()):
+        yield
+
+
+def estimate_tokens(messages):
+    """Tokens aproximados de un prompt (4 caracteres por token)"""
+    return sum(len(message.get('content') or '') for message in messages) // 4
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Planificador compartido por todos los analizadores del proceso"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler.from_env()
+        return _scheduler
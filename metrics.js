@@ -0,0 +1,146 @@
+// Métricas del proceso Node en formato de texto de Prometheus. Usa los
+// mismos nombres que metrics.py: las etapas que miden los workers Python
+// llegan con cada respuesta y se suman aquí (ver mergeWorkerMetrics), así
+// que /metrics da una vista única de Node y Python.
+
+const DEFAULT_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+
+const CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8';
+
+const labelKey = (labels = {}) => JSON.stringify(
+    Object.keys(labels)
+        .filter(name => labels[name] !== undefined && labels[name] !== null)
+        .sort()
+        .map(name => [name, String(labels[name])])
+);
+
+const formatLabels = (key, extra = []) => {
+    const pairs = [...JSON.parse(key), ...extra];
+    if (pairs.length === 0) return '';
+    const escape = value => value.replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+    return '{' + pairs.map(([name, value]) => `${name}="${escape(value)}"`).join(',') + '}';
+};
+
+class Counter {
+    constructor(name, help) {
+        this.name = name;
+        this.help = help;
+        this.values = new Map();
+    }
+
+    inc(labels = {}, amount = 1) {
+        const key = labelKey(labels);
+        this.values.set(key, (this.values.get(key) || 0) + amount);
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} counter`];
+        for (const [key, value] of [...this.values].sort()) {
+            lines.push(`${this.name}${formatLabels(key)} ${value}`);
+        }
+        return lines;
+    }
+}
+
+class Histogram {
+    constructor(name, help, buckets = DEFAULT_BUCKETS) {
+        this.name = name;
+        this.help = help;
+        this.buckets = [...buckets].sort((a, b) => a - b);
+        this.series = new Map();
+    }
+
+    observe(labels, value) {
+        const key = labelKey(labels);
+        let series = this.series.get(key);
+        if (!series) {
+            series = { counts: this.buckets.map(() => 0), sum: 0, count: 0 };
+            this.series.set(key, series);
+        }
+        const index = this.buckets.findIndex(bound => value <= bound);
+        if (index !== -1) series.counts[index]++;
+        series.sum += value;
+        series.count++;
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+        for (const [key, series] of [...this.series].sort()) {
+            let cumulative = 0;
+            this.buckets.forEach((bound, index) => {
+                cumulative += series.counts[index];
+                lines.push(`${this.name}_bucket${formatLabels(key, [['le', String(bound)]])} ${cumulative}`);
+            });
+            lines.push(`${this.name}_bucket${formatLabels(key, [['le', '+Inf']])} ${series.count}`);
+            lines.push(`${this.name}_sum${formatLabels(key)} ${series.sum}`);
+            lines.push(`${this.name}_count${formatLabels(key)} ${series.count}`);
+        }
+        return lines;
+    }
+}
+
+class Registry {
+    constructor() {
+        this.metrics = new Map();
+    }
+
+    counter(name, help) {
+        if (!this.metrics.has(name)) this.metrics.set(name, new Counter(name, help));
+        return this.metrics.get(name);
+    }
+
+    histogram(name, help, buckets) {
+        if (!this.metrics.has(name)) this.metrics.set(name, new Histogram(name, help, buckets));
+        return this.metrics.get(name);
+    }
+
+    render() {
+        const lines = [];
+        for (const metric of this.metrics.values()) lines.push(...metric.render());
+        return lines.join('\n') + '\n';
+    }
+}
+
+const registry = new Registry();
+
+const stageSeconds = registry.histogram('comparador_stage_seconds', 'Duración de cada etapa del análisis en segundos');
+const stageErrors = registry.counter('comparador_stage_errors_total', 'Etapas terminadas con excepción');
+registry.counter('comparador_llm_tokens_total', 'Tokens consumidos según response.usage');
+registry.counter('comparador_cache_lookups_total', 'Consultas a las cachés por resultado (hit/miss)');
+registry.counter('comparador_retailer_errors_total', 'Errores al descargar o extraer páginas, por tienda');
+registry.counter('comparador_llm_rate_limited_total', 'Respuestas 429 de la API del modelo');
+registry.counter('comparador_fetch_tier_total', 'Extracciones de fichas por nivel (static/browser) y resultado');
+registry.counter('comparador_profile_lookups_total', 'Extracciones por campo según el perfil (hit/widened/miss)');
+
+// Mide una promesa como etapa: duración siempre y error si se rechaza
+const timeStage = async (stage, labels, fn) => {
+    const start = process.hrtime.bigint();
+    try {
+        return await fn();
+    } catch (error) {
+        stageErrors.inc({ stage, ...labels });
+        throw error;
+    } finally {
+        stageSeconds.observe({ stage, ...labels }, Number(process.hrtime.bigint() - start) / 1e9);
+    }
+};
+
+// Suma lo que un worker Python midió durante un trabajo (metrics.collect)
+const mergeWorkerMetrics = collected => {
+    if (!collected) return;
+    for (const [stage, labels, seconds] of collected.spans || []) {
+        stageSeconds.observe({ stage, ...labels }, seconds);
+    }
+    for (const [name, labels, amount] of collected.counters || []) {
+        registry.counter(name, 'Contador de los procesos Python').inc(labels, amount);
+    }
+};
+
+module.exports = {
+    CONTENT_TYPE,
+    registry,
+    stageSeconds,
+    stageErrors,
+    timeStage,
+    mergeWorkerMetrics
+};
@@ -0,0 +1,190 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Límites de los histogramas de latencia, en segundos
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        collector = _collector.get()
+        if collector is not None:
+            collector['counters'].append([self.name, dict(key), amount])
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key, [("le", _format_value(float(bound)))])} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {series["count"]}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(series["sum"])}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {series["count"]}')
+        return lines
+
+
+class Registry:
+    """Métricas del proceso en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'comparador_stage_seconds', 'Duración de cada etapa del análisis en segundos'
+)
+STAGE_ERRORS = REGISTRY.counter(
+    'comparador_stage_errors_total', 'Etapas terminadas con excepción'
+)
+LLM_TOKENS = REGISTRY.counter(
+    'comparador_llm_tokens_total', 'Tokens consumidos según response.usage'
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    'comparador_cache_lookups_total', 'Consultas a las cachés por resultado (hit/miss)'
+)
+RETAILER_ERRORS = REGISTRY.counter(
+    'comparador_retailer_errors_total', 'Errores al descargar o extraer páginas, por tienda'
+)
+
+# Recolector de la tarea en curso (ver collect); None fuera de un trabajo
+_collector = contextvars.ContextVar('metrics_collector', default=None)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Mide el bloque como una etapa: alimenta el histograma y, si hay
+    excepción, el contador de errores"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, **labels)
+        collector = _collector.get()
+        if collector is not None:
+            collector['spans'].append([stage, dict(_label_key(labels)), round(elapsed, 6)])
+
+
+@contextmanager
+def collect():
+    """Reúne las etapas y contadores registrados dentro del bloque.
+
+    Lo usa el worker para adjuntar a cada respuesta lo que ha medido y que
+    server.js lo incorpore a sus propias métricas. Las tareas lanzadas en
+    otros hilos no heredan el recolector.
+    """
+    collected = {'spans': [], 'counters': []}
+    token = _collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _collector.reset(token)
+
+
+def record_usage(usage, model=None):
+    """Suma los tokens de `response.usage` (si la API los devuelve)"""
+    if usage is None:
+        return
+    for kind in ('prompt', 'completion'):
+        if isinstance(usage, dict):
+            amount = usage.get(f'{kind}_tokens')
+        else:
+            amount = getattr(usage, f'{kind}_tokens', None)
+        if amount:
+            LLM_TOKENS.inc(amount, kind=kind, model=model)
+
+
+def render():
+    return REGISTRY.render()
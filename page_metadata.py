@@ -0,0 +1,101 @@
+import codecs
+from html.parser import HTMLParser
+
+# Metadatos de imagen por orden de preferencia
+IMAGE_META_KEYS = ['og:image', 'twitter:image', 'product:image']
+
+# Selectores sobre el documento completo cuando el <head> no trae la imagen
+FULL_DOCUMENT_SELECTORS = [
+    'meta[property="og:image"]',
+    'meta[name="twitter:image"]',
+    'meta[property="product:image"]',
+    'img[class*="product-image"]',
+    'img[class*="main-image"]'
+]
+
+
+class HeadMetaParser(HTMLParser):
+    """Recoge las etiquetas <meta> y avisa cuando termina el <head>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.head_done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            attrs = dict(attrs)
+            key = attrs.get('property') or attrs.get('name')
+            if key and attrs.get('content'):
+                self.meta.setdefault(key.lower(), attrs['content'])
+        elif tag == 'body':
+            self.head_done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.head_done = True
+
+
+def _response_decoder(response):
+    content_type = response.headers.get('Content-Type', '').lower()
+    encoding = response.encoding if 'charset=' in content_type else 'utf-8'
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def _preferred_first(strategies, preferred):
+    if preferred in strategies:
+        return [preferred] + [strategy for strategy in strategies if strategy != preferred]
+    return list(strategies)
+
+
+def locate_product_image(response, chunk_size=16 * 1024, preferred=None):
+    """Busca la imagen del producto leyendo la respuesta por trozos.
+
+    `response` debe venir de una petición con stream=True. Se analiza el HTML
+    según llega y se deja de descargar en cuanto aparece el metadato
+    preferido (og:image por defecto) o termina el <head>. Solo si ahí no hay
+    ninguna imagen se lee el resto de la página y se buscan selectores sobre
+    el documento completo.
+
+    `preferred` es la estrategia (clave de metadato o selector) que funcionó
+    antes en la misma tienda (ver extraction_profiles); se prueba la primera.
+    Devuelve (imagen, estrategia), o (None, None).
+    """
+    meta_keys = _preferred_first(IMAGE_META_KEYS, preferred)
+    parser = HeadMetaParser()
+    decoder = _response_decoder(response)
+    received = []
+    chunks = response.iter_content(chunk_size=chunk_size)
+
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        received.append(text)
+        parser.feed(text)
+        if meta_keys[0] in parser.meta or parser.head_done:
+            break
+
+    for key in meta_keys:
+        if key in parser.meta:
+            response.close()
+            return parser.meta[key], key
+
+    # Sin metadatos en el <head>: hace falta el documento entero
+    for chunk in chunks:
+        received.append(decoder.decode(chunk))
+    received.append(decoder.decode(b'', final=True))
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(''.join(received), 'html.parser')
+    for selector in _preferred_first(FULL_DOCUMENT_SELECTORS, preferred):
+        element = soup.select_one(selector)
+        if element:
+            return element.get('content') or element.get('src'), selector
+    return None, None
+
+
+def find_product_image(response, chunk_size=16 * 1024):
+    """Como locate_product_image, solo la imagen"""
+    return locate_product_image(response, chunk_size)[0]
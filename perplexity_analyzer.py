@@ -1,233 +1,440 @@
-from openai import OpenAI
-import re
 import json
 import sys
-import io
 import os
-from urllib.parse import urlparse, unquote
-from dotenv import load_dotenv
-from pathlib import Path
-from bs4 import BeautifulSoup
-import requests
-
-# Configuración para caracteres especiales
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-
-# Configuración inicial
-ROOT_DIR = Path(__file__).parent.parent.parent
-load_dotenv(ROOT_DIR / '.env')
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import load_env, perplexity_settings
+from llm_cache import get_cache
+from page_metadata import locate_product_image
+from url_fingerprint import fingerprint_url, describe
+from single_flight import flights
+from product_key import canonicalize_url, product_key, comparison_key, PRODUCT_ANALYSIS
+from metrics import span, record_usage, CACHE_LOOKUPS, RETAILER_ERRORS
+from llm_scheduler import get_scheduler, estimate_tokens
+from product_record import (
+    PRODUCT_SCHEMA,
+    ProductRecord,
+    compact_products,
+    is_valid_record,
+    price_history_of,
+    price_history_text
+)
+
+# Configuración inicial. openai y requests (los imports más pesados) se
+# cargan en el primer uso del cliente correspondiente.
+load_env()
+
+MODEL = "llama-3.1-sonar-large-128k-online"
+
+# Vigencia del análisis de cada producto, reutilizado entre comparativas
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', 24 * 3600))
+
+# 'structured': el análisis de cada producto se pide como JSON (ProductRecord)
+# y la comparativa se construye con su versión compacta; 'markdown': texto libre
+STRUCTURED_ANALYSIS = os.getenv('PRODUCT_ANALYSIS_MODE', 'structured') == 'structured'
+
+# Descargas de imágenes simultáneas en gather_products_info; van en su propio
+# pool para no esperar detrás de las búsquedas en el LLM
+IMAGE_CONCURRENCY = int(os.getenv('ANALYZER_IMAGE_CONCURRENCY', 8))
+
+def price_context(price_history):
+    """Frase con los precios registrados para los prompts de análisis, o vacía"""
+    if not price_history:
+        return ''
+    return (f"\n\nPrecios que hemos registrado en tiendas para este producto: {price_history_text(price_history)}. "
+            "Usa estos datos para el precio en lugar de estimarlo.")
+
+def search_messages(product_description, price_history=None):
+    """Mensajes para analizar un producto a partir de su descripción y, si
+    lo hay, su histórico de precios (ver price_history)"""
+    prompt = f"""
+    Analiza este producto y proporciona información en este formato:
+
+    ### NOMBRE DEL PRODUCTO
+    [Nombre comercial claro y conciso]
+
+    ### PRECIO APROXIMADO
+    [Rango de precio en euros]
+
+    ### PERFIL DE USUARIO
+    **Ideal para:** [describe el usuario perfecto para este producto]
+
+    ### PUNTOS FUERTES
+    • **[Característica Principal]:** [beneficio práctico]
+    • **[Segunda Característica]:** [beneficio práctico]
+    • **[Tercera Característica]:** [beneficio práctico]
+
+    ### ASPECTOS A CONSIDERAR
+    • **[Limitación 1]:** [explicación práctica]
+    • **[Limitación 2]:** [explicación práctica]
+
+    Producto a analizar: {product_description}{price_context(price_history)}
+    """
+
+    messages = [
+        {
+            "role": "system",
+            "content": "Eres un experto en tecnología que habla de forma natural y cercana. Da información práctica y útil."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    return messages
+
+def record_messages(product_description, price_history=None):
+    """Mensajes para analizar un producto en el modo estructurado (JSON)"""
+    return [
+        {
+            "role": "system",
+            "content": "Eres un experto en tecnología. Respondes únicamente con un objeto JSON válido, sin texto adicional."
+        },
+        {
+            "role": "user",
+            "content": (
+                "Analiza este producto y devuelve un objeto JSON con este esquema "
+                f"(textos en español, breves y prácticos):\n{json.dumps(PRODUCT_SCHEMA, ensure_ascii=False)}\n\n"
+                f"Producto a analizar: {product_description}{price_context(price_history)}"
+            )
+        }
+    ]
+
+def comparison_messages(products_info):
+    """Mensajes para comparar los productos ya analizados"""
+    prompt = f"""
+    Como experto asesor de compras, compara estos productos (P1, P2...: nombre | precio,
+    ideal: usuario ideal, +: puntos fuertes, -: limitaciones, specs: especificaciones):
+
+    {products_info}
+
+    Estructura tu respuesta exactamente así:
+
+    ### 🎯 RESUMEN RÁPIDO
+    **¿Cuál elegir?** [Una frase clara y directa sobre qué producto es mejor para cada tipo de usuario]
+
+    ### 👤 PERFIL IDEAL
+    • El primer producto es perfecto para:
+      - **Gamers** que valoran [característica principal]
+      - **Usuarios** que buscan [beneficio principal]
+      - **Personas** que necesitan [ventaja específica]
+
+    • El segundo producto es perfecto para:
+      - **Gamers** que prefieren [característica principal]
+      - **Usuarios** que quieren [beneficio principal]
+      - **Personas** que buscan [ventaja específica]
+
+    ### ⚡ DIFERENCIAS IMPORTANTES
+    • **Rendimiento y Velocidad:**
+      - El primer producto: [explicar características y beneficios]
+      - El segundo producto: [explicar características y beneficios]
+
+    • **Diseño y Calidad:**
+      - El primer producto: [explicar características importantes]
+      - El segundo producto: [explicar características importantes]
+
+    • **Características Especiales:**
+      - El primer producto: [mencionar funciones únicas]
+      - El segundo producto: [mencionar funciones únicas]
+
+    ### 💡 CONSEJO PERSONAL
+    **Mi recomendación sincera:** [Da un consejo claro sobre qué producto elegir según el tipo de usuario, explicando el porqué de forma natural]
+    """
+
+    messages = [
+        {
+            "role": "system",
+            "content": """Eres un experto que ayuda a elegir productos.
+            - Usa un tono natural y amigable
+            - Mantén los emojis en los títulos
+            - Usa negritas (**) para destacar puntos clave
+            - Usa viñetas como se indica en el formato
+            - Explica los beneficios prácticos
+            - Da recomendaciones claras y directas"""
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    return messages
+
+def recommendation_messages(product_type, min_budget, max_budget, main_use, specific_needs):
+    """Mensajes para recomendar un producto según presupuesto y uso"""
+    return [
+        {
+            "role": "system",
+            "content": "Eres un asesor experto que combina conocimiento profundo con capacidad de explicar de forma simple. Evita tecnicismos innecesarios y céntrate en el valor real para el usuario. Sé honesto sobre ventajas y desventajas."
+        },
+        {
+            "role": "user",
+            "content": f"Recomienda un producto de tipo {product_type} con un presupuesto entre {min_budget} y {max_budget}. El producto se usará principalmente para {main_use}. Necesidades específicas: {specific_needs}."
+        }
+    ]
+
+def fetch_product_image(fetch_client, url):
+    """Descarga el inicio de la página y devuelve la imagen del producto (o None)"""
+    retailer = fingerprint_url(url)['retailer']
+    # Los dominios que bloquean las peticiones sin navegador (ver tiered_fetch)
+    # no se intentan: el resultado sería otro 403 o un captcha
+    from tiered_fetch import get_tier_memory, domain_of
+    from static_extractor import BLOCKED_STATUSES
+    from extraction_profiles import get_profiles
+    domain = domain_of(url)
+    memory = get_tier_memory()
+    if memory.is_blocked(domain):
+        return None
+    try:
+        with span('image_fetch', retailer=retailer):
+            response = fetch_client.get(url, stream=True)
+            with response:
+                if response.status_code == 200:
+                    profiles = get_profiles()
+                    image, strategy = locate_product_image(response, preferred=profiles.preferred(domain, 'image'))
+                    profiles.record(domain, 'image', strategy)
+                    return image
+        RETAILER_ERRORS.inc(retailer=retailer, reason=f"http_{response.status_code}")
+        if response.status_code in BLOCKED_STATUSES:
+            memory.record(domain, False, f"http_{response.status_code}")
+        return None
+    except Exception as e:
+        RETAILER_ERRORS.inc(retailer=retailer, reason=type(e).__name__)
+        print(f"Error obteniendo imagen: {str(e)}")
+        return None
 
 class ProductAnalyzer:
     def __init__(self):
-        self.api_key = os.getenv('PERPLEXITY_API_KEY')
+        self.settings = perplexity_settings()
+        self.api_key = self.settings['api_key']
         if not self.api_key:
             raise ValueError("No se encontró PERPLEXITY_API_KEY en las variables de entorno")
 
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.perplexity.ai"
-        )
+        self._client = None
+        self._fetch_client = None
+        self.cache = get_cache()
+
+    @property
+    def client(self):
+        """Cliente de Perplexity, creado (e importado openai) en el primer uso"""
+        if self._client is None:
+            from openai import OpenAI
+            # Los reintentos los gestiona el planificador (llm_scheduler)
+            self._client = OpenAI(**self.settings, max_retries=0)
+        return self._client
+
+    @property
+    def fetch_client(self):
+        """Cliente HTTP compartido para las páginas; importa requests en el primer uso"""
+        if self._fetch_client is None:
+            from http_client import get_fetch_client
+            self._fetch_client = get_fetch_client()
+        return self._fetch_client
+
+    def _complete(self, messages, max_tokens, temperature=0.3, accept=None):
+        """Llama al modelo reutilizando respuestas idénticas ya obtenidas.
+
+        Con `accept`, solo se guardan en caché las respuestas que lo cumplen.
+        """
+        cache_key = self.cache.make_key(MODEL, temperature, messages)
+        cached = self.cache.get(cache_key)
+        CACHE_LOOKUPS.inc(cache='llm', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            print("Utilizando resultado en caché.")
+            return cached
+
+        # Si otro hilo ya está pidiendo exactamente lo mismo, esperamos a su respuesta
+        return flights.do(cache_key, self._request_completion, cache_key, messages, max_tokens, temperature, accept)
+
+    def _request_completion(self, cache_key, messages, max_tokens, temperature, accept=None):
+        def create():
+            response = self.client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            record_usage(response.usage, MODEL)
+            return response.choices[0].message.content
+
+        # El planificador decide cuándo sale la llamada y reintenta los 429 y 5xx
+        content = get_scheduler().call(create, estimate_tokens(messages), max_tokens)
+        if content and (accept is None or accept(content)):
+            self.cache.set(cache_key, content)
+        return content
 
     def extract_product_info_from_url(self, url):
         """Extrae información del producto desde la URL"""
         print(f"\nExtrayendo información de URL: {url}")
         
-        decoded_url = unquote(url)
-        path = urlparse(decoded_url).path
-        clean_path = path.replace('-', ' ').replace('_', ' ').replace('/', ' ').lower()
-        
-        patterns = {
-            'brand': r'(samsung|lg|philips|bosch|siemens|balay|whirlpool|apple|hp|lenovo|acer|asus|msi)',
-            'model': r'([a-zA-Z0-9]+-?[a-zA-Z0-9]+)',
-            'features': r'(wifi|smart|digital|\d+\s*(gb|tb|inch|pulgadas|\"|cm|kg|w|hz))',
-            'category': r'(tv|telefono|portatil|laptop|nevera|lavadora|secadora|monitor)'
-        }
-        
-        extracted_info = {}
-        for key, pattern in patterns.items():
-            matches = re.finditer(pattern, clean_path, re.IGNORECASE)
-            extracted_info[key] = list(set([match.group(0) for match in matches]))
-        
-        product_description = ' '.join([
-            item for sublist in extracted_info.values() 
-            for item in sublist
-        ])
+        with span('url_parse'):
+            product_description = describe(fingerprint_url(url))
 
         print(f"Información extraída: {product_description}")
         return product_description
 
-    def search_product_info(self, product_description):
+    def search_product_info(self, product_description, price_history=None):
         """Busca información detallada del producto"""
         print(f"Buscando información para: {product_description}")
         
         try:
-            prompt = f"""
-            Analiza este producto y proporciona información en este formato:
-
-            ### NOMBRE DEL PRODUCTO
-            [Nombre comercial claro y conciso]
-
-            ### PRECIO APROXIMADO
-            [Rango de precio en euros]
-
-            ### PERFIL DE USUARIO
-            **Ideal para:** [describe el usuario perfecto para este producto]
-
-            ### PUNTOS FUERTES
-            • **[Característica Principal]:** [beneficio práctico]
-            • **[Segunda Característica]:** [beneficio práctico]
-            • **[Tercera Característica]:** [beneficio práctico]
-
-            ### ASPECTOS A CONSIDERAR
-            • **[Limitación 1]:** [explicación práctica]
-            • **[Limitación 2]:** [explicación práctica]
-
-            Producto a analizar: {product_description}
-            """
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": "Eres un experto en tecnología que habla de forma natural y cercana. Da información práctica y útil."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+            messages = search_messages(product_description, price_history)
 
-            response = self.client.chat.completions.create(
-                model="llama-3.1-sonar-large-128k-online",
-                messages=messages,
-                temperature=0.3,
-                max_tokens=1000
-            )
-
-            return response.choices[0].message.content
+            with span('llm_search'):
+                return self._complete(messages, max_tokens=1000)
 
         except Exception as e:
             print(f"Error en búsqueda: {str(e)}")
             return None
 
-    def try_get_product_image(self, url):
-        """Intenta obtener la imagen del producto"""
+    def search_product_record(self, product_description, price_history=None):
+        """Análisis estructurado del producto (ProductRecord) o None si el
+        modelo no devuelve un JSON que cumpla el esquema"""
+        print(f"Buscando información estructurada para: {product_description}")
+
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                selectors = [
-                    'meta[property="og:image"]',
-                    'meta[name="twitter:image"]',
-                    'meta[property="product:image"]',
-                    'img[class*="product-image"]',
-                    'img[class*="main-image"]'
-                ]
-                
-                for selector in selectors:
-                    element = soup.select_one(selector)
-                    if element:
-                        return element.get('content') or element.get('src')
-                        
-            return None
+            with span('llm_search', format='json'):
+                content = self._complete(
+                    record_messages(product_description, price_history),
+                    max_tokens=700,
+                    temperature=0.2,
+                    accept=is_valid_record
+                )
+            return ProductRecord.from_llm(content)
+
         except Exception as e:
-            print(f"Error obteniendo imagen: {str(e)}")
+            print(f"Error en búsqueda estructurada: {str(e)}")
             return None
 
+    def analyze_product(self, product_description, price_history=None):
+        """{details, record} del producto; en el modo estructurado, si el JSON
+        no es válido se recurre al análisis en texto libre (record None).
+        `price_history` son las estadísticas de price_history_of, si las hay"""
+        if STRUCTURED_ANALYSIS:
+            record = self.search_product_record(product_description, price_history)
+            if record:
+                return {"details": record.to_markdown(), "record": record.to_dict()}
+        details = self.search_product_info(product_description, price_history)
+        return {"details": details, "record": None} if details else None
+
+    def try_get_product_image(self, url):
+        """Intenta obtener la imagen del producto"""
+        return fetch_product_image(self.fetch_client, url)
+
     def compare_products(self, products_info):
         """Compara productos con enfoque en uso real y formato mejorado"""
         try:
-            prompt = f"""
-            Como experto asesor de compras, compara estos productos:
-
-            {products_info}
-
-            Estructura tu respuesta exactamente así:
-
-            ### 🎯 RESUMEN RÁPIDO
-            **¿Cuál elegir?** [Una frase clara y directa sobre qué producto es mejor para cada tipo de usuario]
-
-            ### 👤 PERFIL IDEAL
-            • El primer producto es perfecto para:
-              - **Gamers** que valoran [característica principal]
-              - **Usuarios** que buscan [beneficio principal]
-              - **Personas** que necesitan [ventaja específica]
-
-            • El segundo producto es perfecto para:
-              - **Gamers** que prefieren [característica principal]
-              - **Usuarios** que quieren [beneficio principal]
-              - **Personas** que buscan [ventaja específica]
-
-            ### ⚡ DIFERENCIAS IMPORTANTES
-            • **Rendimiento y Velocidad:**
-              - El primer producto: [explicar características y beneficios]
-              - El segundo producto: [explicar características y beneficios]
-
-            • **Diseño y Calidad:**
-              - El primer producto: [explicar características importantes]
-              - El segundo producto: [explicar características importantes]
-
-            • **Características Especiales:**
-              - El primer producto: [mencionar funciones únicas]
-              - El segundo producto: [mencionar funciones únicas]
-
-            ### 💡 CONSEJO PERSONAL
-            **Mi recomendación sincera:** [Da un consejo claro sobre qué producto elegir según el tipo de usuario, explicando el porqué de forma natural]
-            """
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Eres un experto que ayuda a elegir productos.
-                    - Usa un tono natural y amigable
-                    - Mantén los emojis en los títulos
-                    - Usa negritas (**) para destacar puntos clave
-                    - Usa viñetas como se indica en el formato
-                    - Explica los beneficios prácticos
-                    - Da recomendaciones claras y directas"""
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+            messages = comparison_messages(products_info)
 
-            response = self.client.chat.completions.create(
-                model="llama-3.1-sonar-large-128k-online",
-                messages=messages,
-                temperature=0.3,
-                max_tokens=2000
-            )
-
-            return response.choices[0].message.content
+            with span('llm_compare'):
+                return self._complete(messages, max_tokens=2000)
 
         except Exception as e:
             print(f"Error en comparación: {str(e)}")
             return None
 
-def analyze_products(urls):
-    """Función principal para analizar productos"""
+def gather_products_info(analyzer, urls, max_workers=None, timeout=None):
+    """Busca la información y la imagen de todos los productos a la vez.
+
+    Cada producto se analiza una sola vez y su resultado (detalles, registro
+    estructurado, imagen y características extraídas de la URL) se guarda en
+    caché con su clave de producto, así que se reutiliza en cualquier otra
+    comparativa que lo incluya. Las estadísticas de precios registrados
+    (price_history) no se guardan con él: se consultan cada vez, que cuesta
+    microsegundos.
+
+    Para los que faltan se lanzan dos tareas independientes (búsqueda en el
+    LLM y descarga de la imagen), cada una en su pool, así que el tiempo es
+    el de la más lenta. Los resultados mantienen el orden de entrada y un
+    producto que no termina dentro de `timeout` se descarta sin retrasar al
+    resto.
+    """
+    max_workers = max_workers or int(os.getenv('ANALYZER_CONCURRENCY', 4))
+    timeout = timeout or float(os.getenv('ANALYZER_PRODUCT_TIMEOUT', 60))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    image_executor = ThreadPoolExecutor(max_workers=max(1, min(len(urls), IMAGE_CONCURRENCY)))
     try:
-        analyzer = ProductAnalyzer()
-        products_info = []
-        
+        stages = []
+        seen = set()
         for url in urls:
+            # Las variantes de un mismo enlace comparten clave de producto
+            key = product_key(url)
+            if key in seen:
+                print(f"Producto repetido, se omite: {url}")
+                continue
+            seen.add(key)
+
+            price_history = price_history_of(key)
+            cached = analyzer.cache.get_json(f"{PRODUCT_ANALYSIS}:{key}")
+            CACHE_LOOKUPS.inc(cache='product', result='hit' if cached else 'miss')
+            if cached:
+                print(f"Producto en caché: {key}")
+                stages.append((url, key, cached, price_history, None, None))
+                continue
+
+            url = canonicalize_url(url)
             product_description = analyzer.extract_product_info_from_url(url)
             if product_description:
-                details = analyzer.search_product_info(product_description)
-                image_url = analyzer.try_get_product_image(url)
-                if details:
-                    products_info.append({
-                        "details": details,
-                        "image": image_url
-                    })
+                stages.append((
+                    url,
+                    key,
+                    None,
+                    price_history,
+                    executor.submit(analyzer.analyze_product, product_description, price_history),
+                    image_executor.submit(flights.do, ('image', key), analyzer.try_get_product_image, url)
+                ))
+
+        wait([future for *_, details_future, image_future in stages if details_future
+              for future in (details_future, image_future)], timeout=timeout)
+
+        products_info = []
+        for url, key, cached, price_history, details_future, image_future in stages:
+            if cached:
+                products_info.append({"key": key, **cached, "price_history": price_history})
+                continue
+            if not details_future.done():
+                print(f"Tiempo agotado analizando: {url}")
+                continue
+            analysis = details_future.result()
+            image_url = image_future.result() if image_future.done() else None
+            if analysis:
+                product = {
+                    **analysis,
+                    "image": image_url,
+                    "specs": fingerprint_url(url)
+                }
+                # Sin imagen (p. ej. por tiempo agotado) no se guarda, para reintentarla
+                if image_url:
+                    analyzer.cache.set_json(f"{PRODUCT_ANALYSIS}:{key}", product, ttl=PRODUCT_CACHE_TTL)
+                products_info.append({"key": key, **product, "price_history": price_history})
+        return products_info
+    finally:
+        # No esperar a las tareas que se hayan quedado colgadas
+        executor.shutdown(wait=False, cancel_futures=True)
+        image_executor.shutdown(wait=False, cancel_futures=True)
+
+def compare_cached(analyzer, products_info):
+    """Compara los productos reutilizando la comparativa del mismo conjunto en cualquier orden"""
+    key = comparison_key([p["key"] for p in products_info])
+    comparison = analyzer.cache.get(key)
+    CACHE_LOOKUPS.inc(cache='comparison', result='hit' if comparison is not None else 'miss')
+    if comparison is not None:
+        print("Comparativa en caché.")
+        return comparison
+
+    comparison = analyzer.compare_products(compact_products(products_info))
+    if comparison:
+        analyzer.cache.set(key, comparison)
+    return comparison
+
+def analyze_products(urls):
+    """Función principal para analizar productos"""
+    try:
+        analyzer = ProductAnalyzer()
+        products_info = gather_products_info(analyzer, urls)
         
         result = None
         if len(products_info) > 1:
-            comparison = analyzer.compare_products("\n\n".join([p["details"] for p in products_info]))
+            comparison = compare_cached(analyzer, products_info)
             result = {
                 "success": True,
                 "type": "comparison",
@@ -263,6 +470,9 @@ def analyze_products(urls):
         return error_result
 
 if __name__ == "__main__":
+    # Configuración para caracteres especiales
+    sys.stdout.reconfigure(encoding='utf-8')
+
     if len(sys.argv) < 2:
         print("Proporciona al menos una URL")
         sys.exit(1)
@@ -0,0 +1,469 @@
+"""Histórico de precios por producto.
+
+Cada extracción con precio (ProductScraper) se apunta aquí con la clave de
+producto de product_key, y las estadísticas (mínimo, mediana, percentiles,
+tendencia de 30 días) se pasan a los prompts en lugar de pedir al modelo
+que adivine el rango de precios.
+
+Formato en disco (PRICE_HISTORY_PATH, por defecto .cache/price_history/):
+
+- journal-<n>.bin: registros de 20 bytes (instante, precio, precio
+  original, producto) que se añaden con O_APPEND; cada escritura es
+  atómica, así que varios procesos pueden apuntar precios a la vez sin
+  bloqueos.
+- segment-<n>-<pid>/: las mismas columnas en ficheros separados (ts.u4,
+  price.f4, original.f4, product.u8) ordenadas por producto e instante, que
+  se leen con np.memmap. segment.json indica el segmento vigente, cuántos
+  bytes de cada diario incluye y en qué diario se escribe ahora.
+
+Cuando los registros fuera del segmento llegan a COMPACT_ROWS se escribe un
+segmento nuevo con todo y se pasa a escribir en el diario siguiente; los
+diarios ya incluidos se borran pasado un rato.
+
+El producto se guarda como un hash de 64 bits de su clave, así que no hace
+falta coordinar identificadores entre procesos. Al cargar se calculan de
+una vez, con operaciones vectorizadas, las estadísticas de todos los
+productos; después cada lote de precios nuevos solo recalcula las de sus
+productos y cada consulta es una búsqueda en un dict.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import numpy as np
+from metrics import span
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Días de la tendencia
+TREND_DAYS = 30
+
+# Registros en el diario a partir de los que se reescribe el segmento
+COMPACT_ROWS = int(os.getenv('PRICE_HISTORY_COMPACT_ROWS', 10000))
+
+# Registros nuevos a partir de los que se recalcula todo en lugar de
+# insertarlos uno a uno
+MERGE_ROWS = 2000
+
+# Cada cuánto (segundos) se mira si otro proceso ha apuntado precios
+REFRESH_SECONDS = float(os.getenv('PRICE_HISTORY_REFRESH', 5))
+
+ROW = np.dtype([('ts', '<u4'), ('price', '<f4'), ('original', '<f4'), ('product', '<u8')])
+COLUMNS = {'ts': '<u4', 'price': '<f4', 'original': '<f4', 'product': '<u8'}
+
+
+def product_hash(key):
+    """Clave de producto -> entero de 64 bits con el que se guarda"""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+@dataclass
+class PriceStats:
+    count: int
+    last: float
+    original: float | None
+    min: float
+    p25: float
+    median: float
+    p75: float
+    max: float
+    trend_30d: float | None
+    first_seen: int
+    last_seen: int
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _empty():
+    return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+
+
+def group_stats(columns, now=None, trend_days=TREND_DAYS):
+    """Estadísticas de todos los productos a la vez.
+
+    `columns` son los arrays ts/price/original/product ordenados por producto
+    e instante. Devuelve (hashes, dict de arrays con una posición por
+    producto). La tendencia es la pendiente de la recta de mínimos cuadrados
+    de los precios de los últimos `trend_days` días, como porcentaje del
+    precio medio en ese periodo (None con menos de dos precios).
+    """
+    product, ts = columns['product'], columns['ts']
+    price = columns['price'].astype(np.float64)
+    if not len(product):
+        return product[:0], {}
+
+    starts = np.flatnonzero(np.r_[True, product[1:] != product[:-1]])
+    ends = np.r_[starts[1:], len(product)]
+    counts = ends - starts
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    # Percentiles por grupo con los precios ordenados dentro de cada producto
+    ordered = price[np.lexsort((price, group))]
+
+    def percentile(q):
+        position = starts + q * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, ends - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    # Tendencia: sumas por grupo de x, y, xy y xx con x en días hasta ahora
+    now = time.time() if now is None else now
+    recent = ts >= now - trend_days * 86400
+    days = (ts[recent].astype(np.float64) - now) / 86400
+    y = price[recent]
+    sums = [np.bincount(group[recent], weights, minlength=len(starts))
+            for weights in (None, days, y, days * y, days * days)]
+    n, sx, sy, sxy, sxx = sums
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sxy - sx * sy) / denominator
+        trend = np.where((n >= 2) & (denominator > 0), slope * trend_days / (sy / n) * 100, np.nan)
+
+    last = ends - 1
+    return product[starts], {
+        'count': counts,
+        'last': price[last],
+        'original': columns['original'][last].astype(np.float64),
+        'min': ordered[starts],
+        'p25': percentile(0.25),
+        'median': percentile(0.5),
+        'p75': percentile(0.75),
+        'max': ordered[last],
+        'trend_30d': trend,
+        'first_seen': ts[starts],
+        'last_seen': ts[last]
+    }
+
+
+class PriceHistory:
+    """Diarios de precios y segmento columnar, con las estadísticas en memoria.
+
+    Igual que ProductKeyRegistry, si el directorio no está disponible se
+    trabaja solo en memoria.
+    """
+
+    def __init__(self, path=None, compact_rows=COMPACT_ROWS, refresh_seconds=REFRESH_SECONDS):
+        self.path = Path(path) if path else CACHE_DIR / 'price_history'
+        self.compact_rows = compact_rows
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._memory = []          # registros que solo están en memoria
+        self._loaded = False
+        self._checked = 0.0
+        self._meta = None          # mtime de segment.json al cargar
+        self._generation = 0
+        self._journals = {}        # diario -> bytes ya leídos
+        self._segment_rows = 0
+        self._columns = _empty()
+        self._index = {}
+        self._stats = {}
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"Histórico de precios no disponible, se usará solo memoria: {str(e)}")
+            self.path = None
+
+    def append(self, key, current_price, original_price=None, timestamp=None):
+        self.append_many([(key, current_price, original_price, timestamp)])
+
+    def append_many(self, rows):
+        """Apunta varios precios de una vez: [(clave, actual, original, instante)]"""
+        now = time.time()
+        records = [
+            (int(timestamp or now), current, original if original else np.nan, product_hash(key))
+            for key, current, original, timestamp in rows
+            if current and np.isfinite(current) and current > 0
+        ]
+        if not records:
+            return
+        data = np.array(records, dtype=ROW)
+        with self._lock:
+            # Para saber en qué diario se escribe
+            self._refresh()
+            written = False
+            if self.path is not None:
+                try:
+                    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+                    fd = os.open(self.path / self._active(), flags, 0o644)
+                    try:
+                        os.write(fd, data.tobytes())
+                    finally:
+                        os.close(fd)
+                    written = True
+                except OSError as e:
+                    print(f"Error guardando precios: {str(e)}")
+            # Las propias escrituras (y lo que hayan apuntado otros procesos
+            # desde la última lectura) se ven ya en la siguiente consulta
+            if written:
+                self._catch_up()
+            else:
+                self._memory.append(data)
+                self._merge(data)
+            self._maybe_compact()
+
+    def load(self):
+        """Lee el histórico y calcula las estadísticas si no está hecho (para
+        no hacerlo en la primera consulta)"""
+        with self._lock:
+            self._refresh()
+
+    def stats_for(self, key):
+        """PriceStats del producto, o None si no hay precios suyos"""
+        with self._lock:
+            self._refresh()
+            row = self._index.get(product_hash(key))
+            if row is None:
+                return None
+            values = {name: column[row] for name, column in self._stats.items()}
+        for name in ('original', 'trend_30d'):
+            if values[name] != values[name]:
+                values[name] = None
+        return PriceStats(**values)
+
+    def series(self, key):
+        """(instantes, precios) del producto, en orden"""
+        with self._lock:
+            self._refresh()
+            columns = self._columns
+        product = columns['product']
+        value = np.uint64(product_hash(key))
+        start, end = np.searchsorted(product, value, 'left'), np.searchsorted(product, value, 'right')
+        return columns['ts'][start:end], columns['price'][start:end]
+
+    def compact(self):
+        """Reescribe el segmento con todos los diarios"""
+        with self._lock:
+            self._refresh(force=True)
+            self._compact()
+
+    # Lectura
+
+    def _active(self):
+        return f'journal-{self._generation}.bin'
+
+    def _meta_mtime(self):
+        try:
+            return os.stat(self.path / 'segment.json').st_mtime_ns
+        except OSError:
+            return 0
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._loaded and now - self._checked < self.refresh_seconds:
+            return
+        self._checked = now
+        if self.path is None:
+            if not self._loaded:
+                self._reload()
+            return
+        # Un segmento nuevo (de cualquier proceso) obliga a releer; si no,
+        # basta con lo que se haya añadido a los diarios
+        if force or not self._loaded or self._meta_mtime() != self._meta:
+            self._reload()
+        else:
+            self._catch_up()
+        self._maybe_compact()
+
+    def _reload(self):
+        with span('price_history_load'):
+            mtime = self._meta_mtime() if self.path is not None else 0
+            meta = self._read_meta()
+            segment = self._read_segment(meta)
+            chunks = []
+            self._journals = {}
+            for name in self._journal_names():
+                data, self._journals[name] = self._read_journal(name, meta['journals'].get(name, 0))
+                chunks.append(data)
+            tail = np.concatenate(chunks + self._memory) if chunks or self._memory else np.empty(0, ROW)
+            self._rebuild(segment, tail)
+        self._meta = mtime
+        self._generation = meta['generation']
+        self._segment_rows = meta['rows']
+        self._loaded = True
+
+    def _rebuild(self, columns, tail):
+        """Columnas y estadísticas de todos los productos desde cero"""
+        if len(tail):
+            merged = {name: np.concatenate([columns[name], tail[name]]) for name in COLUMNS}
+            order = np.lexsort((merged['ts'], merged['product']))
+            self._columns = {name: column[order] for name, column in merged.items()}
+        else:
+            self._columns = columns
+        hashes, stats = group_stats(self._columns)
+        self._stats = _rounded(stats)
+        self._index = {value: row for row, value in enumerate(hashes.tolist())}
+
+    def _read_meta(self):
+        empty = {'segment': None, 'rows': 0, 'journals': {}, 'generation': 0}
+        if self.path is None:
+            return empty
+        try:
+            return {**empty, **json.loads((self.path / 'segment.json').read_text(encoding='utf-8'))}
+        except FileNotFoundError:
+            return empty
+        except (OSError, ValueError) as e:
+            print(f"Segmento del histórico ilegible, se leen solo los diarios: {str(e)}")
+            return empty
+
+    def _read_segment(self, meta):
+        if not meta['rows']:
+            return _empty()
+        directory = self.path / meta['segment']
+        try:
+            return {
+                name: np.memmap(directory / f'{name}.{dtype[1:]}', dtype=dtype, mode='r', shape=(meta['rows'],))
+                for name, dtype in COLUMNS.items()
+            }
+        except (OSError, ValueError) as e:
+            print(f"Segmento del histórico ilegible, se leen solo los diarios: {str(e)}")
+            return _empty()
+
+    def _journal_names(self):
+        if self.path is None:
+            return []
+        return sorted(path.name for path in self.path.glob('journal-*.bin'))
+
+    def _read_journal(self, name, offset):
+        """(registros del diario desde el byte `offset`, byte hasta el que se ha leído)"""
+        try:
+            with open(self.path / name, 'rb') as journal:
+                journal.seek(offset)
+                data = journal.read()
+        except FileNotFoundError:
+            return np.empty(0, ROW), offset
+        # Un registro a medio escribir se deja para la siguiente lectura
+        data = data[:len(data) - len(data) % ROW.itemsize]
+        return np.frombuffer(data, dtype=ROW), offset + len(data)
+
+    def _catch_up(self):
+        """Añade lo escrito en los diarios desde la última lectura"""
+        chunks = []
+        for name in {self._active(), *self._journals}:
+            offset = self._journals.get(name, 0)
+            try:
+                size = os.stat(self.path / name).st_size
+            except OSError:
+                continue
+            if size - offset >= ROW.itemsize:
+                data, self._journals[name] = self._read_journal(name, offset)
+                chunks.append(data)
+        if chunks:
+            self._merge(np.concatenate(chunks))
+
+    def _merge(self, rows):
+        """Inserta `rows` en las columnas ordenadas y recalcula solo las
+        estadísticas de sus productos"""
+        if not self._loaded:
+            return
+        if len(rows) > MERGE_ROWS:
+            self._rebuild(self._columns, rows)
+            return
+        rows = rows[np.lexsort((rows['ts'], rows['product']))]
+        product, ts = self._columns['product'], self._columns['ts']
+        starts = np.searchsorted(product, rows['product'], 'left')
+        ends = np.searchsorted(product, rows['product'], 'right')
+        positions = [
+            start + np.searchsorted(ts[start:end], value, 'right')
+            for start, end, value in zip(starts.tolist(), ends.tolist(), rows['ts'])
+        ]
+        self._columns = {
+            name: np.insert(column, positions, rows[name]) for name, column in self._columns.items()
+        }
+
+        product = self._columns['product']
+        affected = np.unique(rows['product'])
+        starts = np.searchsorted(product, affected, 'left')
+        ends = np.searchsorted(product, affected, 'right')
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts.tolist(), ends.tolist())])
+        hashes, stats = group_stats({name: column[rows] for name, column in self._columns.items()})
+        stats = _rounded(stats)
+        if not self._stats:
+            self._stats = {name: [] for name in stats}
+        for position, value in enumerate(hashes.tolist()):
+            row = self._index.get(value)
+            if row is None:
+                self._index[value] = len(self._stats['count'])
+                for name, column in stats.items():
+                    self._stats[name].append(column[position])
+            else:
+                for name, column in stats.items():
+                    self._stats[name][row] = column[position]
+
+    # Escritura del segmento
+
+    def _maybe_compact(self):
+        if self.path is not None and len(self._columns['product']) - self._segment_rows >= self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        """Escribe las columnas cargadas como segmento nuevo y pasa al
+        diario siguiente"""
+        if self.path is None:
+            return
+        # Si otro proceso ha escrito un segmento desde la última lectura, se
+        # recarga en la siguiente consulta y ya se verá entonces
+        if self._meta_mtime() != self._meta:
+            return
+        self._catch_up()
+        generation = self._generation + 1
+        name = f'segment-{generation}-{os.getpid()}'
+        directory = self.path / name
+        rows = len(self._columns['product'])
+        try:
+            directory.mkdir(exist_ok=True)
+            for column, dtype in COLUMNS.items():
+                self._columns[column].astype(dtype).tofile(directory / f'{column}.{dtype[1:]}')
+            meta = self.path / f'segment.json.{os.getpid()}'
+            meta.write_text(json.dumps({
+                'segment': name, 'rows': rows, 'journals': self._journals, 'generation': generation
+            }), encoding='utf-8')
+            os.replace(meta, self.path / 'segment.json')
+        except OSError as e:
+            print(f"Error compactando el histórico de precios: {str(e)}")
+            return
+        self._memory = []
+        self._meta = self._meta_mtime()
+        self._generation = generation
+        self._segment_rows = rows
+
+        # Los segmentos anteriores pueden seguir mapeados en otros procesos y
+        # puede quedar quien escriba en un diario anterior: se borran si no se
+        # usan desde hace un rato (los diarios, solo si ya están en el segmento)
+        for old in self.path.glob('segment-*'):
+            if old.name != name and time.time() - old.stat().st_mtime > 3600:
+                shutil.rmtree(old, ignore_errors=True)
+        for journal, offset in list(self._journals.items()):
+            try:
+                stat = os.stat(self.path / journal)
+            except OSError:
+                del self._journals[journal]
+                continue
+            if stat.st_size == offset and time.time() - stat.st_mtime > 3600:
+                os.remove(self.path / journal)
+                del self._journals[journal]
+
+
+def _rounded(stats):
+    """Redondeadas y como listas de Python: cada consulta es solo indexar"""
+    return {
+        name: (np.round(column, 1 if name == 'trend_30d' else 2) if column.dtype.kind == 'f' else column).tolist()
+        for name, column in stats.items()
+    }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_price_history():
+    """Histórico compartido por todo el proceso"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = PriceHistory(os.getenv('PRICE_HISTORY_PATH'))
+    return _history
@@ -0,0 +1,229 @@
+"""Motor único de precios.
+
+El texto (o el HTML entero) se recorre buscando solo las marcas de moneda
+(€, EUR, euros, &euro;) y el importe se lee alrededor de cada una, sin
+volver a pasar por el documento. Se reconocen el formato español/europeo
+("1.059,00 €", "1 059,00 €") y el de punto decimal ("1,059.00 €",
+"12.50 €"), con el símbolo delante o detrás. Cada importe se devuelve
+como PriceCandidate con su tipo, deducido de lo que lo rodea:
+
+- 'current': precio de venta ("ahora", "oferta" o sin etiqueta)
+- 'original': PVP, precio anterior o tachado ("antes", "PVPR", clases strike/former)
+- 'saving': ahorro o descuento ("ahorra 100 €", "-100 €")
+- 'unit': precio por unidad de medida ("2,49 €/kg")
+- 'installment': cuota ("29,99 €/mes", "al mes")
+
+y una confianza entre 0 y 1. pick_prices elige el precio actual y el
+original de una lista de candidatos.
+"""
+import re
+from dataclasses import dataclass
+
+MIN_PRICE = 1
+
+# Separadores de miles admitidos además del punto: espacios duros (no el
+# espacio normal, que uniría "128 GB 699 €" en 128699)
+_THOUSANDS = r'.\u00a0\u202f'
+
+_AMOUNT = (
+    rf'\d{{1,3}}(?:[{_THOUSANDS}]\d{{3}})+(?:,\d{{1,2}})?'   # 1.059,00 / 1.059
+    r'|\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?'                    # 1,059.00
+    r'|\d+(?:[.,]\d{1,2})?'                                 # 1059,00 / 12.50 / 99
+)
+_SPACE = r'(?:\s|&nbsp;|&#160;)?'
+_UNITS = r'kg|g|l|litro|ml|m|m2|ud|u|unidad|lavado|c[áa]psula|mes'
+
+# El recorrido del texto busca solo la moneda, que es mucho más rara que las
+# cifras, y el importe y la unidad se leen luego alrededor de cada marca.
+# Cada grafía se busca como literal: re las localiza casi a velocidad de
+# memchr, mientras que una alternancia se prueba en cada posición del HTML
+_CURRENCY_MARKS = [re.compile(re.escape(mark)) for mark in ('€', '&euro;', 'EUR', 'eur', 'Eur')]
+_CURRENCY_WORD = re.compile(r'(?:EUR|eur|Eur)(?:os?|OS?)?\b')
+_AMOUNT_BEFORE = re.compile(rf'(?<![\d.,])(?P<amount>{_AMOUNT}){_SPACE}$')
+_AMOUNT_AFTER = re.compile(rf'{_SPACE}(?P<amount>{_AMOUNT})(?!\d)')
+_UNIT = re.compile(rf'\s?(?:/|al\s|por\s)\s?(?P<unit>{_UNITS})\b', re.IGNORECASE)
+
+# Caracteres que se miran antes de la moneda para leer el importe
+_AMOUNT_WINDOW = 24
+
+# Solo para importes sin moneda (atributos data-price, valores del modelo)
+_BARE_AMOUNT = re.compile(rf'(?<![\d.,])(?:{_AMOUNT})(?!\d)')
+
+# Etiqueta inmediatamente anterior al importe (admite etiquetas HTML en medio)
+_LABEL = re.compile(
+    r'(?P<label>p\.?v\.?p\.?r?|precio\s+(?:original|anterior|recomendado|de\s+referencia)|antes|era'
+    r'|ahora|hoy|oferta|precio|desde|te\s+ahorras|ahorras?|ahorro|descuento|rebaja|cuota)'
+    r'(?:\s|<[^>]*>|&nbsp;|[:.\-])*$',
+    re.IGNORECASE
+)
+_LOOKBEHIND = 40
+
+_ORIGINAL_LABELS = ('pvp', 'precio original', 'precio anterior', 'precio recomendado',
+                    'precio de referencia', 'antes', 'era')
+_SAVING_LABELS = ('ahorra', 'ahorro', 'te ahorras', 'descuento', 'rebaja')
+
+# Pistas en clases o selectores del elemento que contiene el texto
+_ORIGINAL_HINT = re.compile(r'strike|tachad|old|former|before|was|pvp|original|list|rrp|anterior|crossed|regular|prev',
+                            re.IGNORECASE)
+_CURRENT_HINT = re.compile(r'current|sale|final|now|actual|oferta|offer|special|promo', re.IGNORECASE)
+
+
+@dataclass
+class PriceCandidate:
+    value: float
+    kind: str
+    confidence: float
+    currency: str | None
+    text: str
+    start: int
+    unit: str | None = None
+    hint: str = ''
+
+
+def parse_amount(text):
+    """Importe sin moneda -> float: "1.059,00", "1,059.00", "1059", "12.5".
+
+    Con un solo separador seguido de tres cifras se entiende como miles
+    ("1.059" -> 1059), que es lo habitual en las tiendas españolas.
+    """
+    if text is None or isinstance(text, bool):
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    number = re.sub(r'[\s\u00a0\u202f]|&nbsp;|&#160;', '', str(text))
+    if ',' in number and '.' in number:
+        decimal = ',' if number.rfind(',') > number.rfind('.') else '.'
+        number = number.replace('.' if decimal == ',' else ',', '').replace(',', '.')
+    elif ',' in number:
+        number = number.replace(',', '') if re.fullmatch(r'\d{1,3}(?:,\d{3})+', number) else number.replace(',', '.')
+    elif '.' in number and re.fullmatch(r'\d{1,3}(?:\.\d{3})+', number):
+        number = number.replace('.', '')
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def _classify(text, start, hint, unit):
+    """(tipo, ajuste de confianza) según la etiqueta previa, la unidad y la pista"""
+    if unit:
+        return ('installment' if unit.lower() == 'mes' else 'unit'), 0.0
+
+    match = _LABEL.search(text, max(0, start - _LOOKBEHIND), start)
+    label = ' '.join(match.group('label').lower().replace('.', '').split()) if match else ''
+    if label == 'cuota':
+        return 'installment', 0.0
+    # "-100 €" es un ahorro; "1.299-1.499 €", un rango
+    minus = text[max(0, start - 1):start] == '-' and not text[max(0, start - 2):start - 1].isdigit()
+    if label.startswith(_SAVING_LABELS) or minus:
+        return 'saving', 0.0
+    if label.startswith(_ORIGINAL_LABELS):
+        return 'original', 0.15
+    if hint and _ORIGINAL_HINT.search(hint):
+        return 'original', 0.1
+    if label == 'desde':
+        return 'current', -0.2
+    if label or (hint and _CURRENT_HINT.search(hint)):
+        return 'current', 0.1
+    return 'current', 0.0
+
+
+def _currency_spans(text):
+    """Posiciones (inicio, fin) de las marcas de moneda, en orden"""
+    spans = [match.span() for match in _CURRENCY_MARKS[0].finditer(text)]
+    if '&euro;' in text:
+        spans.extend(match.span() for match in _CURRENCY_MARKS[1].finditer(text))
+    for mark in _CURRENCY_MARKS[2:]:
+        for match in mark.finditer(text):
+            start = match.start()
+            if start and text[start - 1].isalnum():
+                continue
+            word = _CURRENCY_WORD.match(text, start)
+            if word:
+                spans.append(word.span())
+    spans.sort()
+    return spans
+
+
+def find_prices(text, hint='', require_currency=True):
+    """Todos los importes del texto en una sola pasada, como PriceCandidate.
+
+    `hint` son las clases o el selector del elemento de donde sale el texto
+    ("price-former", "span.sc-strike-price"): ayuda a distinguir el precio
+    tachado del actual. Con require_currency=False también se aceptan
+    números sueltos, con menos confianza.
+    """
+    if not text:
+        return []
+    candidates = []
+    for start, end in _currency_spans(text):
+        amount = _AMOUNT_BEFORE.search(text, max(0, start - _AMOUNT_WINDOW), start)
+        if amount:
+            start = amount.start()
+        else:
+            amount = _AMOUNT_AFTER.match(text, end)
+            if not amount:
+                continue
+            end = amount.end()
+        value = parse_amount(amount.group('amount'))
+        if value is None:
+            continue
+
+        unit = _UNIT.match(text, end)
+        if unit:
+            end = unit.end()
+            unit = unit.group('unit').lower()
+        kind, adjustment = _classify(text, start, hint, unit)
+        decimals = 0.15 if re.search(r'[.,]\d{1,2}$', amount.group('amount')) else 0.0
+        candidates.append(PriceCandidate(
+            value=value,
+            kind=kind,
+            confidence=round(min(1.0, max(0.0, 0.6 + decimals + adjustment)), 2),
+            currency='EUR',
+            text=text[start:end].strip(),
+            start=start,
+            unit=unit,
+            hint=hint
+        ))
+
+    if not candidates and not require_currency:
+        for match in _BARE_AMOUNT.finditer(text):
+            value = parse_amount(match.group(0))
+            if value is None:
+                continue
+            kind, adjustment = _classify(text, match.start(), hint, None)
+            candidates.append(PriceCandidate(
+                value=value, kind=kind, confidence=round(max(0.0, 0.3 + adjustment), 2), currency=None,
+                text=match.group(0), start=match.start(), hint=hint
+            ))
+    return candidates
+
+
+def pick_prices(candidates, min_price=MIN_PRICE):
+    """(precio actual, precio original) como PriceCandidate, o None.
+
+    El actual es el menor de los candidatos de venta; el original, el mayor
+    de los marcados como PVP/tachados o, si no hay ninguno, el mayor de los
+    de venta. Las cuotas, ahorros y precios por unidad no cuentan.
+    """
+    valid = [candidate for candidate in candidates if candidate.value > min_price]
+    current = [candidate for candidate in valid if candidate.kind == 'current']
+    original = [candidate for candidate in valid if candidate.kind == 'original']
+    pool = current or original
+    if not pool:
+        return None, None
+
+    cheapest = min(pool, key=lambda candidate: (candidate.value, -candidate.confidence))
+    dearest = max(original or current, key=lambda candidate: (candidate.value, candidate.confidence))
+    return cheapest, dearest if dearest.value > cheapest.value else None
+
+
+def parse_price(text, hint='', require_currency=True, min_price=0):
+    """Precio de venta de un texto corto (el de más confianza), o None"""
+    candidates = [
+        candidate for candidate in find_prices(text, hint, require_currency)
+        if candidate.value > min_price and candidate.kind in ('current', 'original')
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: (candidate.kind == 'current', candidate.confidence)).value
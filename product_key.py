@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote, unquote
+
+from url_fingerprint import fingerprint_url
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Reglas compartidas con server.js: parámetros de seguimiento que no
+# identifican el producto y prefijos de host de las versiones móviles
+with open(Path(__file__).parent / 'url_rules.json', encoding='utf-8') as rules_file:
+    _RULES = json.load(rules_file)
+
+TRACKING_PARAMS = set(_RULES['tracking_params'])
+TRACKING_PREFIXES = tuple(_RULES['tracking_prefixes'])
+MOBILE_PREFIXES = tuple(_RULES['mobile_prefixes'])
+
+# Segmentos /ref=... de Amazon al final de la ruta
+_AMAZON_REF = re.compile(r'/ref=[^/]*$')
+
+
+def canonicalize_url(url):
+    """Normaliza una URL de producto para que todas sus variantes coincidan"""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    for prefix in MOBILE_PREFIXES:
+        if host.startswith(prefix):
+            host = 'www.' + host[len(prefix):]
+            break
+
+    path = quote(unquote(parts.path), safe="/:@!$&'()*+,;=-._~")
+    path = _AMAZON_REF.sub('', path)
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+
+    return urlunsplit(('https', host, path or '/', urlencode(query), ''))
+
+
+def compute_product_key(url):
+    """Clave estable del producto: tienda + referencia (o slug si no hay referencia)"""
+    fingerprint = fingerprint_url(canonicalize_url(url))
+    identifier = fingerprint['sku'] or fingerprint['slug'].lower() or canonicalize_url(url)
+    return f"{fingerprint['retailer']}:{identifier}"
+
+
+# Prefijos de la caché. El backend guarda la descripción de cada producto y
+# una comparativa con el contexto del usuario; perplexity_analyzer y
+# async_analyzer, el análisis de cada producto y su propia comparativa.
+# Con prefijos distintos ninguno lee lo que ha guardado el otro.
+PRODUCT_INFO = 'product_info'
+PRODUCT_ANALYSIS = 'product_analysis'
+COMPARISON_INFO = 'comparison_info'
+COMPARISON_ANALYSIS = 'comparison_analysis'
+
+
+def comparison_key(product_keys, user_context=None, prefix=COMPARISON_ANALYSIS):
+    """Clave de una comparativa que no depende del orden de los productos"""
+    context = ' '.join((user_context or '').lower().split())
+    payload = json.dumps([sorted(set(product_keys)), context], ensure_ascii=False)
+    return f'{prefix}:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ProductKeyRegistry:
+    """Tabla de alias URL -> clave de producto persistida en SQLite.
+
+    Además de memorizar lo calculado permite asociar a mano una URL a una
+    clave ya conocida (por ejemplo, cuando otra fuente revela que dos
+    enlaces distintos son el mismo producto).
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else CACHE_DIR / 'products.sqlite3'
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._db = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS aliases (
+                    url TEXT PRIMARY KEY,
+                    product_key TEXT NOT NULL,
+                    first_seen REAL NOT NULL
+                )
+            """)
+            self._db.execute('CREATE INDEX IF NOT EXISTS aliases_key ON aliases (product_key)')
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Tabla de alias no disponible, se usará solo memoria: {str(e)}")
+            self._db = None
+
+    def resolve(self, url):
+        """Devuelve la clave de producto de cualquier variante de la URL"""
+        canonical = canonicalize_url(url)
+        with self._lock:
+            key = self._aliases.get(canonical)
+            if key is not None:
+                return key
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        'SELECT product_key FROM aliases WHERE url = ?', (canonical,)
+                    ).fetchone()
+                    if row:
+                        self._aliases[canonical] = row[0]
+                        return row[0]
+                except sqlite3.Error as e:
+                    print(f"Error leyendo alias: {str(e)}")
+
+        key = compute_product_key(canonical)
+        self.register_alias(canonical, key)
+        return key
+
+    def register_alias(self, url, product_key):
+        """Asocia una URL (o variante) a una clave de producto"""
+        canonical = canonicalize_url(url)
+        with self._lock:
+            self._aliases[canonical] = product_key
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO aliases (url, product_key, first_seen) VALUES (?, ?, '
+                    'COALESCE((SELECT first_seen FROM aliases WHERE url = ?), ?))',
+                    (canonical, product_key, canonical, time.time())
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Error guardando alias: {str(e)}")
+
+    def aliases_of(self, product_key):
+        """URLs conocidas para una clave de producto"""
+        if self._db is None:
+            return [url for url, key in self._aliases.items() if key == product_key]
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT url FROM aliases WHERE product_key = ?', (product_key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Registro compartido por todo el proceso"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProductKeyRegistry(os.getenv('PRODUCT_KEYS_PATH'))
+    return _registry
+
+
+def product_key(url):
+    return get_registry().resolve(url)
@@ -0,0 +1,242 @@
+import json
+import re
+import time
+from dataclasses import dataclass, field, asdict
+from price_parser import parse_price
+
+# Esquema que se pide al modelo en el modo estructurado
+PRODUCT_SCHEMA = {
+    "type": "object",
+    "required": ["name"],
+    "properties": {
+        "name": {"type": "string", "description": "Nombre comercial claro y conciso"},
+        "price_min": {"type": ["number", "null"], "description": "Precio mínimo aproximado en euros"},
+        "price_max": {"type": ["number", "null"], "description": "Precio máximo aproximado en euros"},
+        "user_profile": {"type": "string", "description": "Usuario ideal, en una frase"},
+        "strengths": {"type": "array", "items": {"type": "string"}, "description": "3 puntos fuertes con su beneficio práctico"},
+        "caveats": {"type": "array", "items": {"type": "string"}, "description": "2 limitaciones con su explicación práctica"},
+        "key_specs": {"type": "object", "additionalProperties": {"type": "string"}, "description": "Especificaciones clave: nombre -> valor"}
+    }
+}
+
+# Límites para que un registro no crezca sin control dentro de los prompts
+MAX_ITEMS = 5
+MAX_SPECS = 8
+MAX_TEXT = 200
+
+_JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+
+
+def _text(value, limit=MAX_TEXT):
+    if value is None:
+        return ''
+    return ' '.join(str(value).split())[:limit]
+
+
+def _euros(value):
+    return f"{value:,.0f}".replace(',', '.')
+
+
+def _price(value):
+    """Número o texto como "1.299,99 €" -> float; None si no hay precio"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_price(str(value), require_currency=False)
+
+
+def _items(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError("Se esperaba una lista")
+    items = [_text(item) for item in value]
+    return [item for item in items if item][:MAX_ITEMS]
+
+
+def _specs(value):
+    # Se admite también [{"name": ..., "value": ...}], que algunos modelos devuelven
+    if isinstance(value, list):
+        value = {item.get('name'): item.get('value') for item in value if isinstance(item, dict)}
+    if not isinstance(value, dict):
+        raise ValueError("key_specs debe ser un objeto")
+    specs = {}
+    for name, spec in value.items():
+        name, spec = _text(name, 40), _text(spec, 80)
+        if name and spec:
+            specs[name] = spec
+        if len(specs) == MAX_SPECS:
+            break
+    return specs
+
+
+@dataclass
+class ProductRecord:
+    """Análisis de un producto en forma de registro validado.
+
+    Es lo que se guarda en la caché de productos y lo que se usa para
+    construir el prompt de comparación en formato compacto, en lugar del
+    texto completo de cada análisis.
+    """
+    name: str
+    price_min: float | None = None
+    price_max: float | None = None
+    user_profile: str = ''
+    strengths: list = field(default_factory=list)
+    caveats: list = field(default_factory=list)
+    key_specs: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Valida y normaliza un dict con el esquema; ValueError si no lo cumple"""
+        if not isinstance(data, dict):
+            raise ValueError("El análisis no es un objeto JSON")
+        name = _text(data.get('name'), 120)
+        if not name:
+            raise ValueError("Falta el nombre del producto")
+
+        price_min, price_max = _price(data.get('price_min')), _price(data.get('price_max'))
+        if price_min is not None and price_max is not None and price_min > price_max:
+            price_min, price_max = price_max, price_min
+
+        return cls(
+            name=name,
+            price_min=price_min,
+            price_max=price_max,
+            user_profile=_text(data.get('user_profile')),
+            strengths=_items(data.get('strengths') or []),
+            caveats=_items(data.get('caveats') or []),
+            key_specs=_specs(data.get('key_specs') or {})
+        )
+
+    @classmethod
+    def from_llm(cls, text):
+        """Registro a partir de la respuesta del modelo (admite ```json ... ```)"""
+        match = _JSON_OBJECT.search(text or '')
+        if not match:
+            raise ValueError("La respuesta no contiene un objeto JSON")
+        try:
+            data = json.loads(match.group(0))
+        except ValueError as e:
+            raise ValueError(f"JSON inválido: {e}") from None
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_fingerprint(cls, fingerprint, name=None):
+        """Registro mínimo con lo que se sabe por la URL (ver url_fingerprint)"""
+        specs = {}
+        if fingerprint.get('category'):
+            specs['categoría'] = fingerprint['category']
+        if fingerprint.get('size'):
+            specs['tamaño'] = fingerprint['size']
+        if fingerprint.get('capacity'):
+            specs['capacidad'] = ', '.join(fingerprint['capacity'])
+        if fingerprint.get('features'):
+            specs['características'] = ', '.join(fingerprint['features'])
+        return cls.from_dict({
+            'name': name or ' '.join(part for part in (fingerprint.get('brand'), fingerprint.get('model')) if part)
+                    or fingerprint.get('sku') or fingerprint.get('retailer'),
+            'key_specs': specs
+        })
+
+    def to_dict(self):
+        return asdict(self)
+
+    def price_range(self):
+        if self.price_min is None and self.price_max is None:
+            return ''
+        if self.price_min is None or self.price_max is None or self.price_min == self.price_max:
+            return f"{_euros(self.price_min if self.price_max is None else self.price_max)} €"
+        return f"{_euros(self.price_min)}-{_euros(self.price_max)} €"
+
+    def to_markdown(self):
+        """Mismo formato de secciones que el análisis en texto libre, para la web"""
+        sections = [f"### NOMBRE DEL PRODUCTO\n{self.name}"]
+        if self.price_range():
+            sections.append(f"### PRECIO APROXIMADO\n{self.price_range()}")
+        if self.user_profile:
+            sections.append(f"### PERFIL DE USUARIO\n**Ideal para:** {self.user_profile}")
+        if self.strengths:
+            sections.append("### PUNTOS FUERTES\n" + '\n'.join(f"• {item}" for item in self.strengths))
+        if self.caveats:
+            sections.append("### ASPECTOS A CONSIDERAR\n" + '\n'.join(f"• {item}" for item in self.caveats))
+        if self.key_specs:
+            sections.append("### ESPECIFICACIONES\n" + '\n'.join(
+                f"• **{name}:** {value}" for name, value in self.key_specs.items()
+            ))
+        return '\n\n'.join(sections)
+
+    def compact(self, index):
+        """Unas pocas líneas por producto para el prompt de comparación"""
+        header = f"P{index}: {self.name}"
+        if self.price_range():
+            header += f" | {self.price_range()}"
+        lines = [header]
+        if self.user_profile:
+            lines.append(f"ideal: {self.user_profile}")
+        if self.strengths:
+            lines.append("+ " + '; '.join(self.strengths))
+        if self.caveats:
+            lines.append("- " + '; '.join(self.caveats))
+        if self.key_specs:
+            lines.append("specs: " + '; '.join(f"{name}={value}" for name, value in self.key_specs.items()))
+        return '\n'.join(lines)
+
+
+def record_of(product):
+    """ProductRecord de un producto de la caché, o None si es de antes del modo estructurado"""
+    data = product.get('record')
+    if not data:
+        return None
+    try:
+        return ProductRecord.from_dict(data)
+    except ValueError:
+        return None
+
+
+def price_history_of(key):
+    """Estadísticas de los precios registrados del producto (ver price_history)
+    como dict, o None si no hay; numpy se importa en el primer uso"""
+    try:
+        from price_history import get_price_history
+        stats = get_price_history().stats_for(key)
+    except Exception as e:
+        print(f"Histórico de precios no disponible: {str(e)}")
+        return None
+    return stats.to_dict() if stats else None
+
+
+def price_history_text(history):
+    """Una línea con el histórico para los prompts"""
+    since = time.strftime('%d/%m/%Y', time.localtime(history['first_seen']))
+    text = (f"{history['count']} precios desde {since}: último {_euros(history['last'])} €, "
+            f"mín {_euros(history['min'])} €, mediana {_euros(history['median'])} €, máx {_euros(history['max'])} €")
+    if history.get('original'):
+        text += f", PVP {_euros(history['original'])} €"
+    if history.get('trend_30d') is not None:
+        text += f", {history['trend_30d']:+.1f} % en 30 días".replace('.', ',')
+    return text
+
+
+def compact_products(products_info):
+    """Texto de los productos para el prompt de comparación: los registros en
+    formato compacto y, si algún producto no tiene registro, su análisis tal cual.
+    Con histórico de precios se añade una línea con lo que hemos visto"""
+    blocks = []
+    for index, product in enumerate(products_info, 1):
+        record = record_of(product)
+        block = record.compact(index) if record else f"P{index}:\n{product['details']}"
+        if product.get('price_history'):
+            block += f"\nprecios vistos: {price_history_text(product['price_history'])}"
+        blocks.append(block)
+    return '\n\n'.join(blocks)
+
+
+def is_valid_record(text):
+    """Para no guardar en caché respuestas que no cumplen el esquema"""
+    try:
+        ProductRecord.from_llm(text)
+        return True
+    except ValueError:
+        return False
@@ -1,105 +1,274 @@
-from playwright.sync_api import sync_playwright
+import asyncio
 import json
 import sys
-import re
+from urllib.parse import urlparse
+from metrics import span, RETAILER_ERRORS
+from url_fingerprint import detect_retailer, fingerprint_url
+from static_extractor import fetch_product_info_async
+from feature_filter import select_features, NAVIGATION_WORDS
+from tiered_fetch import TieredFetcher
+from extraction_profiles import get_profiles
+from price_parser import find_prices, pick_prices, parse_price
+from price_history import get_price_history
+from product_key import product_key
+from product_record import price_history_text
+
+# Estrategias por defecto; el perfil del dominio pone delante la que funcionó
+NAME_SELECTORS = ['h1', '[itemprop="name"]']
+BROAD_PRICE_SELECTOR = '[class*="price"], .pvp, [data-price]'
+BROAD_FEATURE_SELECTOR = 'li, [class*="feature"], [class*="spec"]'
+
+# Selectores distintos que se guardan para las características
+MAX_LEARNED_SELECTORS = 3
+
+# Textos candidatos a característica que devuelve el navegador; feature_filter
+# elige después los mejores para la categoría
+MAX_FEATURE_CANDIDATES = 60
+
+# Todo se extrae con un único page.evaluate: el script consulta los
+# selectores, filtra en el propio navegador (longitud, palabras de
+# navegación, duplicados, máximo de candidatas) y devuelve solo los
+# textos útiles, cada uno con un selector corto "padre > elemento" para
+# aprenderlo en el perfil del dominio. Se ignoran ids y clases con números
+# largos, que suelen ser únicos de cada página.
+EXTRACT_JS = """
+({nameSelectors, priceSelectors, featureSelectors, noiseWords, maxCandidates}) => {
+    const text = node => (node.textContent || '').replace(/\\s+/g, ' ').trim();
+    const query = selector => {
+        try {
+            return document.querySelectorAll(selector);
+        } catch (e) {
+            return [];
+        }
+    };
+    const stable = name => !/\\d{3,}/.test(name);
+    const part = node => {
+        const tag = node.tagName.toLowerCase();
+        if (node.id && stable(node.id)) return tag + '#' + CSS.escape(node.id);
+        const classes = [...node.classList].filter(stable).slice(0, 2);
+        return tag + classes.map(name => '.' + CSS.escape(name)).join('');
+    };
+    const selectorOf = node => {
+        const parent = node.parentElement;
+        return parent && parent.tagName !== 'BODY' ? part(parent) + ' > ' + part(node) : part(node);
+    };
+
+    let name = null;
+    for (const selector of nameSelectors) {
+        const node = query(selector)[0];
+        if (node && text(node)) {
+            name = {text: text(node), selector};
+            break;
+        }
+    }
+
+    // Precios: textos cortos con cifra y euro; el primer selector que da alguno
+    let prices = {selector: null, items: []};
+    for (const selector of priceSelectors) {
+        const seen = new Set();
+        const items = [];
+        for (const node of query(selector)) {
+            const value = text(node);
+            if (value.length > 80 || !/\\d\\s*€/.test(value) || seen.has(value)) continue;
+            seen.add(value);
+            items.push({text: value, selector: selectorOf(node)});
+        }
+        if (items.length) {
+            prices = {selector, items};
+            break;
+        }
+    }
+
+    // Características: solo el filtro barato (forma, longitud, navegación);
+    // la puntuación por categoría se hace en Python con feature_filter
+    let features = {selector: null, items: []};
+    for (const selector of featureSelectors) {
+        const seen = new Set();
+        const items = [];
+        for (const node of query(selector)) {
+            const value = text(node);
+            const lower = value.toLowerCase();
+            if (value.length <= 10 || seen.has(value)) continue;
+            if (!(value.includes(':') || value.startsWith('-') || value.startsWith('•'))) continue;
+            if (noiseWords.some(word => lower.includes(word))) continue;
+            seen.add(value);
+            items.push({text: value, selector: selectorOf(node)});
+            if (items.length >= maxCandidates) break;
+        }
+        if (items.length) {
+            features = {selector, items};
+            break;
+        }
+    }
+
+    return {name, prices, features};
+}
+"""
 
 class ProductScraper:
-    def __init__(self):
+    def __init__(self, tiered=True):
         self.timeout = 30000
         self.min_price = 1
         self.max_features = 10
+        # Probar antes JSON-LD/OpenGraph con una petición HTTP y abrir el
+        # navegador solo para los dominios que lo necesitan (ver tiered_fetch)
+        self.fetcher = TieredFetcher(self) if tiered else None
+        self.profiles = get_profiles()
+        self.history = get_price_history()
 
     def clean_price(self, text):
-        """Limpia y extrae un precio del texto"""
-        if not text:
+        """Precio de venta de un texto (ver price_parser)"""
+        return parse_price(text, min_price=self.min_price)
+
+    def _learned_first(self, domain, field, broad):
+        learned = self.profiles.preferred(domain, field)
+        return [learned, broad] if learned and learned != broad else [broad]
+
+    async def _extract_page(self, page, domain, category=None):
+        """Nombre, precios y características en una sola ida y vuelta al navegador"""
+        content = await page.evaluate(EXTRACT_JS, {
+            'nameSelectors': self.profiles.order(domain, 'name', NAME_SELECTORS),
+            'priceSelectors': self._learned_first(domain, 'price', BROAD_PRICE_SELECTOR),
+            'featureSelectors': self._learned_first(domain, 'features', BROAD_FEATURE_SELECTOR),
+            'noiseWords': NAVIGATION_WORDS,
+            'maxCandidates': MAX_FEATURE_CANDIDATES
+        })
+
+        name = content['name']
+        self.profiles.record(domain, 'name', name['selector'] if name else None)
+
+        # El selector de cada elemento sirve también de pista (clases strike, pvp...)
+        candidates = [
+            candidate for item in content['prices']['items']
+            for candidate in find_prices(item['text'], hint=item['selector'])
+        ]
+        current, original = pick_prices(candidates, self.min_price)
+        self.profiles.record(domain, 'price', self._price_strategy(content['prices']['selector'], current, original))
+
+        features = content['features']
+        selected = select_features([item['text'] for item in features['items']], category, self.max_features)
+        chosen = set(selected)
+        items = [item for item in features['items'] if ' '.join(item['text'].split()) in chosen]
+        self.profiles.record(domain, 'features', self._feature_strategy(features['selector'], items))
+
+        return {
+            'name': name['text'] if name else '',
+            'current_price': current.value if current else None,
+            'original_price': original.value if original else None,
+            'features': selected
+        }
+
+    def _price_strategy(self, selector, current, original):
+        """El selector aprendido si dio precios; tras el barrido amplio, los
+        elementos del precio actual y del original"""
+        if current is None:
             return None
-        match = re.search(r'(\d+[.,]\d{2}|\d+)\s*€', text)
-        if match:
-            price = float(match.group(1).replace('.', '').replace(',', '.'))
-            return price if price > self.min_price else None
-        return None
+        if selector != BROAD_PRICE_SELECTOR:
+            return selector
+        return ', '.join(dict.fromkeys(candidate.hint for candidate in (current, original) if candidate))
 
-    def extract_info(self, url):
-        """Extrae información básica del producto"""
+    def _feature_strategy(self, selector, items):
+        if not items:
+            return None
+        if selector != BROAD_FEATURE_SELECTOR:
+            return selector
+        return ', '.join(list(dict.fromkeys(item['selector'] for item in items))[:MAX_LEARNED_SELECTORS])
+
+    async def extract_info_async(self, url, pool):
+        """Extrae información básica del producto usando una página del pool"""
         print(f"Extrayendo información de: {url}")
+        retailer = detect_retailer(urlparse(url).netloc)[0]
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            try:
-                # Cargar página
-                page.goto(url, timeout=self.timeout)
-                page.wait_for_selector('h1', timeout=5000)
+        try:
+            with span('scrape', retailer=retailer):
+                async with pool.page() as page:
+                    # Cargar página
+                    await page.goto(url, timeout=self.timeout)
+                    await page.wait_for_selector('h1', timeout=5000)
                 
-                # Extraer información básica
-                product_info = {
-                    'success': False,
-                    'url': url,
-                    'name': '',
-                    'current_price': None,
-                    'original_price': None,
-                    'features': [],
-                    'error': None
-                }
-
-                # 1. Nombre del producto
-                title_element = page.query_selector('h1')
-                if title_element:
-                    product_info['name'] = title_element.text_content().strip()
-                    print(f"Nombre encontrado: {product_info['name']}")
-
-                # 2. Precios
-                prices = []
-                price_elements = page.query_selector_all('[class*="price"], .pvp, [data-price]')
-                for element in price_elements:
-                    price = self.clean_price(element.text_content())
-                    if price:
-                        prices.append(price)
-
-                if prices:
-                    prices.sort()
-                    product_info['current_price'] = prices[0]
-                    if len(prices) > 1:
-                        product_info['original_price'] = prices[-1]
-                    print(f"Precio actual: {product_info['current_price']}€")
+                    # Extraer información básica
+                    product_info = {
+                        'success': False,
+                        'url': url,
+                        'name': '',
+                        'current_price': None,
+                        'original_price': None,
+                        'features': [],
+                        'error': None
+                    }
+
+                    # Nombre, precios y características
+                    product_info.update(await self._extract_page(
+                        page, urlparse(url).netloc.lower(), fingerprint_url(url)['category']
+                    ))
+                    if product_info['name']:
+                        print(f"Nombre encontrado: {product_info['name']}")
+                    if product_info['current_price']:
+                        print(f"Precio actual: {product_info['current_price']}€")
                     if product_info['original_price']:
                         print(f"Precio original: {product_info['original_price']}€")
+                    print(f"Características encontradas: {len(product_info['features'])}")
 
-                # 3. Características
-                feature_elements = page.query_selector_all('li, [class*="feature"], [class*="spec"]')
-                features = set()
-                
-                for element in feature_elements:
-                    text = element.text_content().strip()
-                    if (len(text) > 10 and 
-                        (':' in text or text.startswith('-') or text.startswith('•')) and
-                        not any(word in text.lower() for word in [
-                            'cookie', 'menú', 'inicio', 'carrito', 'cuenta', 
-                            'login', 'regístrate', 'perfil'
-                        ])):
-                        features.add(text)
-
-                product_info['features'] = list(features)[:self.max_features]
-                print(f"Características encontradas: {len(product_info['features'])}")
-
-                # Determinar si la extracción fue exitosa
-                product_info['success'] = bool(
-                    product_info['name'] and 
-                    (product_info['current_price'] or product_info['features'])
-                )
-
-                return product_info
-
-            except Exception as e:
-                print(f"Error: {str(e)}")
-                return {
-                    'success': False,
-                    'url': url,
-                    'error': str(e)
-                }
-            finally:
-                browser.close()
+                    # Determinar si la extracción fue exitosa
+                    product_info['success'] = bool(
+                        product_info['name'] and 
+                        (product_info['current_price'] or product_info['features'])
+                    )
+                    if not product_info['success']:
+                        RETAILER_ERRORS.inc(retailer=retailer, reason='incomplete')
+
+                    return product_info
+
+        except Exception as e:
+            RETAILER_ERRORS.inc(retailer=retailer, reason=type(e).__name__)
+            print(f"Error: {str(e)}")
+            return {
+                'success': False,
+                'url': url,
+                'error': str(e)
+            }
+
+    async def extract_static_async(self, url):
+        """Extrae la información del HTML servido (JSON-LD, OpenGraph), sin navegador"""
+        print(f"Extrayendo sin navegador: {url}")
+        return await fetch_product_info_async(url)
+
+    async def extract_many(self, urls, pool=None):
+        """Extrae varios productos en paralelo compartiendo navegadores.
+
+        Por defecto cada URL pasa por TieredFetcher: petición HTTP primero y
+        Playwright solo si hace falta. Si se necesita el navegador y no se
+        pasa un pool, se crea uno solo para este lote. Los precios
+        encontrados se apuntan en el histórico (ver record_prices).
+        """
+        if self.fetcher is not None:
+            results = await self.fetcher.fetch_many(urls, pool)
+        elif pool is None:
+            from browser_pool import BrowserPool
+            async with BrowserPool() as own_pool:
+                results = await asyncio.gather(*(self.extract_info_async(url, own_pool) for url in urls))
+        else:
+            results = await asyncio.gather(*(self.extract_info_async(url, pool) for url in urls))
+        self.record_prices(results)
+        return results
+
+    def record_prices(self, results):
+        """Apunta en el histórico los precios encontrados y añade a cada
+        resultado con precio las estadísticas de su producto (price_history)"""
+        found = [
+            (product_key(info['url']), info) for info in results
+            if info.get('success') and info.get('current_price')
+        ]
+        self.history.append_many([
+            (key, info['current_price'], info.get('original_price'), None) for key, info in found
+        ])
+        for key, info in found:
+            stats = self.history.stats_for(key)
+            info['price_history'] = stats.to_dict() if stats else None
+
+    def extract_info(self, url):
+        """Versión síncrona de extract_info_async para un único producto"""
+        return asyncio.run(self.extract_many([url]))[0]
 
     def format_for_gpt(self, product_info):
         """Formatea la información para enviar a GPT"""
@@ -122,6 +291,7 @@ PRODUCTO: {product_info['name']}
 PRECIOS:
 - Actual: {product_info['current_price']}€
 {f"- Original: {product_info['original_price']}€" if product_info['original_price'] else ""}
+{f"- Histórico: {price_history_text(product_info['price_history'])}" if product_info.get('price_history') else ""}
 
 CARACTERÍSTICAS ENCONTRADAS:
 {chr(10).join(f"- {feature}" for feature in product_info['features'])}
@@ -136,11 +306,10 @@ Por favor, analiza esta información y proporciona:
 def compare_products(urls):
     """Compara múltiples productos"""
     scraper = ProductScraper()
-    products_info = []
-    
-    for url in urls:
-        info = scraper.extract_info(url)
-        products_info.append(scraper.format_for_gpt(info))
+    products_info = [
+        scraper.format_for_gpt(info)
+        for info in asyncio.run(scraper.extract_many(urls))
+    ]
     
     prompt = """Por favor, compara los siguientes productos:
 
@@ -129,24 +129,13 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const requestData = {
                 urls: state.products,
-                context: context
+                userContext: context
             };
  
             console.log('Enviando datos:', requestData);
  
-            const response = await fetch('/api/compare', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestData)
-            });
- 
-            if (!response.ok) {
-                throw new Error(`Error ${response.status}: ${response.statusText}`);
-            }
- 
-            const data = await response.json();
+            const data = await postStream('/api/compare/stream', requestData,
+                streamInto(elements.productForm.resultArea, 'comparison-content'));
             console.log('Respuesta recibida:', data);
  
             if (data.error) {
@@ -165,6 +154,65 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
  
+    // Envía la petición a un endpoint de streaming (Server-Sent Events) y va
+    // entregando el texto a `onDelta`; devuelve el resultado final.
+    async function postStream(url, body, onDelta) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(body)
+        });
+ 
+        if (!response.ok) {
+            throw new Error(`Error ${response.status}: ${response.statusText}`);
+        }
+ 
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+ 
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+ 
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+ 
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+ 
+                const payload = JSON.parse(data || '{}');
+                if (event === 'delta') onDelta(payload.text);
+                else if (event === 'result') return payload;
+                else if (event === 'error') throw new Error(payload.error);
+            }
+        }
+ 
+        throw new Error('La conexión se cerró antes de recibir el resultado');
+    }
+ 
+    // Sustituye el spinner por el texto según va llegando
+    function streamInto(container, className) {
+        let target = null;
+        return text => {
+            if (!container) return;
+            if (!target) {
+                container.innerHTML = `<div class="${className} streaming"></div>`;
+                target = container.firstElementChild;
+            }
+            target.textContent += text;
+        };
+    }
+ 
     function validateUrl(url) {
         try {
             new URL(url);
@@ -283,19 +331,8 @@ document.addEventListener('DOMContentLoaded', () => {
         showLoading(elements.advisorForm.resultArea);
  
         try {
-            const response = await fetch('/api/recommend', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(formData)
-            });
- 
-            if (!response.ok) {
-                throw new Error(`Error del servidor: ${response.status}`);
-            }
- 
-            const data = await response.json();
+            const data = await postStream('/api/recommend/stream', formData,
+                streamInto(elements.advisorForm.resultArea, 'advisor-result'));
             console.log('Respuesta del recomendador:', data);
  
             if (data.error) {
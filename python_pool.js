@@ -0,0 +1,256 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+const { stageSeconds, stageErrors, mergeWorkerMetrics } = require('./metrics');
+
+const secondsSince = start => (Date.now() - start) / 1000;
+
+// Pool de procesos Python persistentes que hablan NDJSON por stdin/stdout
+// (ver backend/scrapers/analyzer_worker.py). Cada proceso atiende un trabajo
+// a la vez; los trabajos que llegan con todos ocupados esperan en cola.
+class PythonWorkerPool {
+    constructor({ command, script, size = 2, maxJobsPerWorker = 100, restartDelayMs = 1000, env = {} }) {
+        this.command = command;
+        this.script = script;
+        this.size = size;
+        this.maxJobsPerWorker = maxJobsPerWorker;
+        this.restartDelayMs = restartDelayMs;
+        this.env = env;
+
+        this.workers = new Set();
+        this.queue = [];
+        this.nextJobId = 1;
+        this.closed = false;
+    }
+
+    start() {
+        for (let i = 0; i < this.size; i++) {
+            this.spawnWorker();
+        }
+    }
+
+    spawnWorker() {
+        const proc = spawn(this.command, [this.script], {
+            stdio: ['pipe', 'pipe', 'inherit'],
+            env: { ...process.env, PYTHONUNBUFFERED: '1', ...this.env }
+        });
+
+        const worker = {
+            proc,
+            ready: false,
+            retiring: false,
+            jobsDone: 0,
+            current: null,
+            exited: false,
+            startedAt: Date.now()
+        };
+        this.workers.add(worker);
+
+        proc.stdout.setEncoding('utf8');
+        readline.createInterface({ input: proc.stdout }).on('line', line => {
+            this.handleMessage(worker, line);
+        });
+
+        // Un EPIPE al escribir en un proceso que acaba de morir se gestiona en 'exit'
+        proc.stdin.on('error', () => {});
+
+        // Si el proceso ni siquiera llega a lanzarse (p. ej. ENOENT) puede no
+        // haber 'exit': se retira y se relanza desde aquí. Sin pid es que no
+        // se lanzó; otros errores (no poder matarlo) acaban en 'exit'.
+        proc.on('error', error => {
+            console.error('❌ Error al lanzar el proceso de análisis:', error.message);
+            if (proc.pid === undefined) {
+                this.handleExit(worker, error.code || 'error', null);
+            }
+        });
+
+        proc.on('exit', (code, signal) => this.handleExit(worker, code, signal));
+
+        return worker;
+    }
+
+    handleMessage(worker, line) {
+        let message;
+        const parseStart = process.hrtime.bigint();
+        try {
+            message = JSON.parse(line);
+        } catch {
+            return;
+        }
+        stageSeconds.observe({ stage: 'ipc_json_parse' }, Number(process.hrtime.bigint() - parseStart) / 1e9);
+
+        if (message.type === 'ready') {
+            worker.ready = true;
+            stageSeconds.observe({ stage: 'python_spawn' }, secondsSince(worker.startedAt));
+            console.log(`🐍 Proceso de análisis listo (pid ${message.pid})`);
+            this.dispatch();
+            return;
+        }
+
+        const job = worker.current;
+        if (!job || job.id !== message.id) return;
+
+        if (message.type === 'delta') {
+            if (job.onDelta) job.onDelta(message.text);
+            return;
+        }
+
+        if (message.type === 'item') {
+            if (job.onItem) job.onItem(message.index, message.result);
+            return;
+        }
+
+        this.finishJob(worker);
+        stageSeconds.observe({ stage: 'python_ipc', mode: job.mode }, secondsSince(job.dispatchedAt));
+        mergeWorkerMetrics(message.metrics);
+        if (message.type === 'result') {
+            job.resolve(message.result);
+        } else {
+            stageErrors.inc({ stage: 'python_ipc', mode: job.mode });
+            job.reject(new Error(message.error || 'Error en el proceso de análisis'));
+        }
+        this.dispatch();
+    }
+
+    handleExit(worker, code, signal) {
+        // 'error' y 'exit' pueden llegar los dos para el mismo proceso
+        if (worker.exited) return;
+        worker.exited = true;
+        this.workers.delete(worker);
+
+        const job = worker.current;
+        if (job) {
+            worker.current = null;
+            clearTimeout(job.timer);
+            stageErrors.inc({ stage: 'python_ipc', mode: job.mode });
+            job.reject(new Error(`El proceso de análisis terminó inesperadamente (${signal || code})`));
+        }
+
+        if (this.closed || worker.retiring) return;
+
+        // Si el proceso muere nada más arrancar esperamos antes de relanzarlo
+        // para no entrar en un bucle de reinicios.
+        const crashedEarly = Date.now() - worker.startedAt < this.restartDelayMs;
+        console.error(`⚠️ Proceso de análisis finalizado (${signal || code}), relanzando...`);
+        setTimeout(() => {
+            if (!this.closed) {
+                this.spawnWorker();
+            }
+        }, crashedEarly ? this.restartDelayMs : 0);
+    }
+
+    finishJob(worker) {
+        clearTimeout(worker.current.timer);
+        worker.current = null;
+        worker.jobsDone++;
+
+        // Reciclar el proceso tras N trabajos para acotar el uso de memoria
+        if (worker.jobsDone >= this.maxJobsPerWorker) {
+            this.retire(worker);
+        }
+    }
+
+    retire(worker) {
+        worker.retiring = true;
+        this.workers.delete(worker);
+        worker.proc.stdin.end();
+        if (!this.closed) {
+            this.spawnWorker();
+        }
+    }
+
+    // Con `onDelta` el proceso envía el texto del modelo en fragmentos según
+    // se genera; la promesa se resuelve igualmente con el resultado final.
+    // `onItem(index, result)` recibe los resultados parciales de un lote.
+    // Si `signal` se aborta, el trabajo sale de la cola o, si ya se está
+    // ejecutando, se mata su proceso (que el pool relanza).
+    run(mode, params, { timeoutMs = 90000, onDelta = null, onItem = null, signal = null } = {}) {
+        return new Promise((resolve, reject) => {
+            if (this.closed) {
+                reject(new Error('El pool de análisis está cerrado'));
+                return;
+            }
+            if (signal && signal.aborted) {
+                reject(signal.reason);
+                return;
+            }
+
+            const job = {
+                id: this.nextJobId++, mode, params, timeoutMs, onDelta, onItem, resolve, reject, queuedAt: Date.now()
+            };
+
+            if (signal) {
+                const onAbort = () => this.cancel(job, signal.reason);
+                signal.addEventListener('abort', onAbort, { once: true });
+                job.resolve = value => { signal.removeEventListener('abort', onAbort); resolve(value); };
+                job.reject = error => { signal.removeEventListener('abort', onAbort); reject(error); };
+            }
+
+            this.queue.push(job);
+            this.dispatch();
+        });
+    }
+
+    cancel(job, reason) {
+        const queued = this.queue.indexOf(job);
+        if (queued !== -1) {
+            this.queue.splice(queued, 1);
+            job.reject(reason);
+            return;
+        }
+
+        for (const worker of this.workers) {
+            if (worker.current === job) {
+                this.abortRunning(worker, reason);
+                return;
+            }
+        }
+    }
+
+    // El proceso sigue ocupado con el trabajo: lo matamos y se relanza
+    abortRunning(worker, reason) {
+        const job = worker.current;
+        clearTimeout(job.timer);
+        worker.current = null;
+        worker.ready = false;
+        stageErrors.inc({ stage: 'python_ipc', mode: job.mode });
+        job.reject(reason);
+        worker.proc.kill('SIGKILL');
+    }
+
+    dispatch() {
+        for (const worker of this.workers) {
+            if (this.queue.length === 0) return;
+            if (!worker.ready || worker.current) continue;
+
+            const job = this.queue.shift();
+            worker.current = job;
+            job.dispatchedAt = Date.now();
+            stageSeconds.observe({ stage: 'python_queue', mode: job.mode }, secondsSince(job.queuedAt));
+            job.timer = setTimeout(() => {
+                if (worker.current !== job) return;
+                const error = new Error('El análisis ha tardado demasiado tiempo');
+                error.code = 'ETIMEDOUT';
+                this.abortRunning(worker, error);
+            }, job.timeoutMs);
+
+            worker.proc.stdin.write(JSON.stringify({
+                id: job.id,
+                mode: job.mode,
+                params: job.params,
+                stream: Boolean(job.onDelta)
+            }) + '\n');
+        }
+    }
+
+    close() {
+        this.closed = true;
+        for (const job of this.queue.splice(0)) {
+            job.reject(new Error('El pool de análisis está cerrado'));
+        }
+        for (const worker of this.workers) {
+            worker.proc.stdin.end();
+        }
+    }
+}
+
+module.exports = { PythonWorkerPool };
@@ -2,6 +2,10 @@ const express = require('express');
 const cors = require('cors');
 const { spawn } = require('child_process');
 const path = require('path');
+const { PythonWorkerPool } = require('./python_pool');
+const { SingleFlight } = require('./single_flight');
+const { BatchStore, describeBatch } = require('./batch_jobs');
+const metrics = require('./metrics');
 
 const pythonCommand = process.platform === 'win32' ? 'python' : 'python3';
 
@@ -20,160 +24,303 @@ const verifyPython = () => {
     });
 };
 
+// Procesos Python persistentes: se paga el arranque y los imports una sola vez
+const analyzerPool = new PythonWorkerPool({
+    command: pythonCommand,
+    script: path.join(__dirname, 'backend', 'scrapers', 'analyzer_worker.py'),
+    size: parseInt(process.env.PYTHON_WORKERS, 10) || 2,
+    maxJobsPerWorker: parseInt(process.env.PYTHON_WORKER_MAX_JOBS, 10) || 100
+});
+
+// Los lotes van a su propio proceso para no ocupar los de las peticiones
+// interactivas. Todos los procesos comparten el estado de llm_scheduler
+// (en .cache/), así que LLM_RPM, LLM_TPM y LLM_CONCURRENCY valen para todo
+// el servidor y las llamadas interactivas pasan delante de las de lotes
+const batchPool = new PythonWorkerPool({
+    command: pythonCommand,
+    script: path.join(__dirname, 'backend', 'scrapers', 'analyzer_worker.py'),
+    size: 1,
+    maxJobsPerWorker: parseInt(process.env.PYTHON_WORKER_MAX_JOBS, 10) || 100
+});
+
+const BATCH_MAX_JOBS = parseInt(process.env.BATCH_MAX_JOBS, 10) || 500;
+const batches = new BatchStore({
+    pool: batchPool,
+    concurrency: parseInt(process.env.BATCH_LLM_CONCURRENCY, 10) || 4,
+    timeoutMs: parseInt(process.env.BATCH_TIMEOUT_MS, 10) || 30 * 60 * 1000,
+    ttlMs: parseInt(process.env.BATCH_TTL_MS, 10) || 60 * 60 * 1000
+});
+
 const app = express();
 
 app.use(cors());
 app.use(express.json({limit: '2mb'}));
 app.use(express.static(path.join(__dirname, 'public')));
 
+// Duración de cada petición a la API, por ruta y código de respuesta
+const httpSeconds = metrics.registry.histogram(
+    'comparador_http_request_seconds', 'Duración de las peticiones a la API en segundos'
+);
+app.use('/api', (req, res, next) => {
+    const start = process.hrtime.bigint();
+    res.on('close', () => {
+        httpSeconds.observe(
+            { route: req.route ? req.baseUrl + req.route.path : 'other', status: res.statusCode },
+            Number(process.hrtime.bigint() - start) / 1e9
+        );
+    });
+    next();
+});
+
 // Health check
 app.get('/health', (_, res) => res.send('OK'));
 
+app.get('/metrics', (_, res) => {
+    res.set('Content-Type', metrics.CONTENT_TYPE);
+    res.send(metrics.registry.render());
+});
+
 // Ruta raíz
 app.get('/', (_, res) => {
     res.sendFile(path.join(__dirname, 'public', 'index.html'));
 });
 
+const ANALYSIS_TIMEOUT_MS = 90000;
+
+// Peticiones idénticas en curso comparten un único trabajo en el pool
+const flights = new SingleFlight();
+
+const normalizeText = value => String(value ?? '').trim().toLowerCase().replace(/\s+/g, ' ');
+
+// Misma normalización que product_key.canonicalize_url en Python: las
+// variantes de un enlace (campañas, host móvil, barra final) comparten trabajo
+const urlRules = require('./url_rules.json');
+const trackingParams = new Set(urlRules.tracking_params);
+
+const canonicalUrl = url => {
+    try {
+        const parsed = new URL(String(url).trim());
+        let host = parsed.hostname.toLowerCase();
+        const mobilePrefix = urlRules.mobile_prefixes.find(prefix => host.startsWith(prefix));
+        if (mobilePrefix) host = 'www.' + host.slice(mobilePrefix.length);
+
+        let pathname = parsed.pathname.replace(/\/ref=[^/]*$/, '');
+        if (pathname.length > 1) pathname = pathname.replace(/\/+$/, '');
+
+        const query = [...parsed.searchParams]
+            .filter(([key]) => {
+                const lower = key.toLowerCase();
+                return !trackingParams.has(lower) && !urlRules.tracking_prefixes.some(prefix => lower.startsWith(prefix));
+            })
+            .sort(([a, av], [b, bv]) => (a + '=' + av < b + '=' + bv ? -1 : 1));
+        const search = query.length ? '?' + new URLSearchParams(query).toString() : '';
+
+        return `https://${host}${pathname || '/'}${search}`;
+    } catch {
+        return String(url).trim();
+    }
+};
+
+const flightKey = (mode, params) => {
+    if (mode === 'compare') {
+        const urls = [...new Set(params.urls.map(canonicalUrl))].sort();
+        return JSON.stringify([mode, urls, normalizeText(params.user_context)]);
+    }
+    return JSON.stringify([mode, ...Object.keys(params).sort().map(key => normalizeText(params[key]))]);
+};
+
+// Cancelación propia de cada petición: su timeout o que el cliente se vaya.
+// Cancelar una petición no afecta a las demás que comparten el trabajo.
+const requestSignal = res => {
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+        const error = new Error('El análisis ha tardado demasiado tiempo');
+        error.code = 'ETIMEDOUT';
+        controller.abort(error);
+    }, ANALYSIS_TIMEOUT_MS);
+
+    res.on('close', () => {
+        clearTimeout(timer);
+        if (!res.writableFinished) {
+            controller.abort(new Error('El cliente cerró la conexión'));
+        }
+    });
+    return controller.signal;
+};
+
+// El trabajo compartido siempre se pide en streaming para poder servir a la
+// vez a quien espera la respuesta completa y a quien la recibe por SSE.
+// La etapa `analysis` mide lo que espera cada petición: cola, worker y,
+// si se suma a otra idéntica, lo que le quede a esa
+const runAnalysis = (mode, params, { signal, onDelta = null }) => metrics.timeStage('analysis', { mode }, () =>
+    flights.do(
+        flightKey(mode, params),
+        (sharedSignal, emit) => analyzerPool.run(mode, params, {
+            timeoutMs: ANALYSIS_TIMEOUT_MS,
+            onDelta: emit,
+            signal: sharedSignal
+        }),
+        { signal, onDelta }
+    )
+);
+
+const compareParams = ({ urls, userContext }) => ({
+    urls,
+    user_context: userContext || null
+});
+
+const recommendParams = ({ productType, minBudget, maxBudget, mainUse, specificNeeds }) => ({
+    product_type: productType,
+    min_budget: minBudget,
+    max_budget: maxBudget,
+    main_use: mainUse,
+    specific_needs: specificNeeds || ''
+});
+
+// Variante en streaming: Server-Sent Events con un evento `delta` por
+// fragmento de texto del modelo y un evento final `result` (o `error`).
+const streamAnalysis = async (req, res, mode, params, timeoutMessage) => {
+    res.set({
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+    });
+    res.flushHeaders();
+
+    const send = (event, payload) => {
+        if (!res.writableEnded) {
+            res.write(`event: ${event}\ndata: ${JSON.stringify(payload)}\n\n`);
+        }
+    };
+
+    try {
+        const result = await runAnalysis(mode, params, {
+            signal: requestSignal(res),
+            onDelta: text => send('delta', { text })
+        });
+        send('result', result);
+    } catch (error) {
+        send('error', {
+            error: error.code === 'ETIMEDOUT' ? timeoutMessage : 'Error al procesar el análisis',
+            details: error.message
+        });
+    }
+    res.end();
+};
+
 // API route
-app.post('/api/compare', (req, res) => {
+app.post('/api/compare', async (req, res) => {
     const { urls, userContext } = req.body;
-    let hasResponded = false;
 
     if (!urls || !Array.isArray(urls)) {
         return res.status(400).json({ error: 'URLs inválidas' });
     }
 
-    const pythonProcess = spawn(pythonCommand, [
-        path.join(__dirname, 'backend', 'scrapers', 'perplexity_analyzer.py'),
-        ...urls
-    ]);
-
-    // Resto del código actual del endpoint...
     console.log('📊 Analizando productos con contexto:', userContext || 'Sin contexto');
 
-    let data = '';
-    let errorOutput = '';
-
-    // Aumentar tiempo de espera a 90 segundos
-    const timeout = setTimeout(() => {
-        if (!hasResponded) {
-            hasResponded = true;
-            pythonProcess.kill();
-            res.status(504).json({
+    try {
+        const result = await runAnalysis('compare', compareParams(req.body), {
+            signal: requestSignal(res)
+        });
+        res.json(result);
+    } catch (error) {
+        if (error.code === 'ETIMEDOUT') {
+            return res.status(504).json({
                 error: 'El análisis ha tardado demasiado tiempo',
                 message: 'Por favor, inténtalo de nuevo en unos momentos'
             });
         }
-    }, 90000);
+        res.status(500).json({
+            error: 'Error al procesar el análisis',
+            message: 'Ha ocurrido un error procesando los productos',
+            details: error.message
+        });
+    }
+});
 
-    pythonProcess.stdout.on('data', chunk => {
-        data += chunk.toString();
-        console.log('📥 Recibiendo datos:', chunk.toString());
-    });
+app.post('/api/compare/stream', (req, res) => {
+    const { urls, userContext } = req.body;
 
-    pythonProcess.stderr.on('data', error => {
-        errorOutput += error.toString();
-        console.error('❌ Error de Python:', error.toString());
-    });
+    if (!urls || !Array.isArray(urls)) {
+        return res.status(400).json({ error: 'URLs inválidas' });
+    }
 
-    pythonProcess.on('close', (code) => {
-        clearTimeout(timeout);
-        console.log('📋 Código de salida Python:', code);
+    console.log('📊 Analizando productos (streaming) con contexto:', userContext || 'Sin contexto');
+    streamAnalysis(req, res, 'compare', compareParams(req.body),
+        'El análisis ha tardado demasiado tiempo');
+});
 
-        if (hasResponded) return;
+// Lote de comparativas: responde enseguida con el id y los resultados se
+// consultan después con GET /api/compare/batch/:id
+app.post('/api/compare/batch', (req, res) => {
+    const { jobs } = req.body;
 
-        try {
-            const match = data.match(/RESULT_JSON_START\n([\s\S]*?)\nRESULT_JSON_END/);
-            
-            if (!match) {
-                throw new Error('No se pudo obtener el resultado del análisis');
-            }
+    if (!Array.isArray(jobs) || jobs.length === 0) {
+        return res.status(400).json({ error: 'Lista de comparativas inválida' });
+    }
+    if (jobs.length > BATCH_MAX_JOBS) {
+        return res.status(400).json({ error: `Como máximo ${BATCH_MAX_JOBS} comparativas por lote` });
+    }
+    if (jobs.some(job => !job || !Array.isArray(job.urls) || job.urls.length === 0)) {
+        return res.status(400).json({ error: 'URLs inválidas' });
+    }
 
-            const result = JSON.parse(match[1]);
-            hasResponded = true;
-            res.json(result);
-        } catch (error) {
-            if (!hasResponded) {
-                hasResponded = true;
-                res.status(500).json({
-                    error: 'Error al procesar el análisis',
-                    message: 'Ha ocurrido un error procesando los productos',
-                    details: errorOutput || error.message
-                });
-            }
-        }
-    });
+    const batch = batches.create(jobs);
+    console.log(`📦 Lote ${batch.id} con ${jobs.length} comparativas`);
+    res.status(202)
+        .location(`/api/compare/batch/${batch.id}`)
+        .json(describeBatch(batch, { includeResults: false }));
+});
 
-    pythonProcess.on('error', (error) => {
-        clearTimeout(timeout);
-        if (!hasResponded) {
-            hasResponded = true;
-            res.status(500).json({
-                error: 'Error al ejecutar el análisis',
-                message: 'Por favor, inténtalo de nuevo',
-                details: error.message
-            });
-        }
-    });
+app.get('/api/compare/batch/:id', (req, res) => {
+    const batch = batches.get(req.params.id);
+    if (!batch) {
+        return res.status(404).json({ error: 'Lote no encontrado' });
+    }
+    res.json(describeBatch(batch, { includeResults: req.query.results !== '0' }));
+});
+
+app.get('/api/compare/batch/:id/jobs/:index', (req, res) => {
+    const batch = batches.get(req.params.id);
+    const job = batch && batch.jobs[Number(req.params.index)];
+    if (!job) {
+        return res.status(404).json({ error: 'Comparativa no encontrada' });
+    }
+    res.json(job);
 });
 
 // En server.js, después de la ruta /api/compare
-app.post('/api/recommend', (req, res) => {
-    const { productType, minBudget, maxBudget, mainUse, specificNeeds } = req.body;
-    let hasResponded = false;
-
-    console.log('🔍 Generando recomendaciones para:', productType);
-
-    const pythonProcess = spawn(pythonCommand, [
-        path.join(__dirname, 'perplexity_analyzer.py'),
-        '--mode', 'recommend',
-        '--type', productType,
-        '--min-budget', minBudget,
-        '--max-budget', maxBudget,
-        '--use', mainUse,
-        '--needs', specificNeeds || ''
-    ]);
-
-    let data = '';
-    let errorOutput = '';
-
-    const timeout = setTimeout(() => {
-        if (!hasResponded) {
-            hasResponded = true;
-            pythonProcess.kill();
-            res.status(504).json({
+app.post('/api/recommend', async (req, res) => {
+    console.log('🔍 Generando recomendaciones para:', req.body.productType);
+
+    try {
+        const result = await runAnalysis('recommend', recommendParams(req.body), {
+            signal: requestSignal(res)
+        });
+        res.json(result);
+    } catch (error) {
+        if (error.code === 'ETIMEDOUT') {
+            return res.status(504).json({
                 error: 'La recomendación ha tardado demasiado tiempo'
             });
         }
-    }, 90000);
-
-    pythonProcess.stdout.on('data', chunk => data += chunk);
-    pythonProcess.stderr.on('data', error => errorOutput += error);
-
-    pythonProcess.on('close', (code) => {
-        clearTimeout(timeout);
-        if (hasResponded) return;
-
-        try {
-            const match = data.match(/RESULT_JSON_START\n([\s\S]*?)\nRESULT_JSON_END/);
-            if (!match) throw new Error('No se pudo obtener el resultado');
-            
-            const result = JSON.parse(match[1]);
-            hasResponded = true;
-            res.json(result);
-        } catch (error) {
-            if (!hasResponded) {
-                hasResponded = true;
-                res.status(500).json({ error: 'Error al procesar la recomendación' });
-            }
-        }
-    });
+        res.status(500).json({ error: 'Error al procesar la recomendación' });
+    }
+});
+
+app.post('/api/recommend/stream', (req, res) => {
+    console.log('🔍 Generando recomendaciones (streaming) para:', req.body.productType);
+    streamAnalysis(req, res, 'recommend', recommendParams(req.body),
+        'La recomendación ha tardado demasiado tiempo');
 });
 
 // Iniciar servidor
 const port = process.env.PORT || 8080;
 verifyPython()
     .then(() => {
+        analyzerPool.start();
+        batchPool.start();
         app.listen(port, '0.0.0.0', () => {
             console.log(`🚀 Servidor iniciado en puerto ${port}`);
             console.log(`🏥 Health check disponible en: http://0.0.0.0:${port}/health`);
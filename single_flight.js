@@ -0,0 +1,77 @@
+// Agrupa peticiones idénticas en curso: la primera lanza el trabajo y las
+// que llegan mientras tanto esperan al mismo resultado (o al mismo error).
+//
+// Cada llamada puede traer su propio AbortSignal. Si una se cancela (por
+// timeout o porque el cliente se ha ido) solo deja de esperar ella; el
+// trabajo compartido se aborta únicamente cuando no queda nadie esperando.
+// Los fragmentos emitidos con `emit` se reenvían a todos los que esperan,
+// incluidos los que se unen tarde, que reciben primero lo ya emitido.
+class SingleFlight {
+    constructor() {
+        this.flights = new Map();
+    }
+
+    get size() {
+        return this.flights.size;
+    }
+
+    do(key, fn, { signal = null, onDelta = null } = {}) {
+        // Una llamada ya cancelada no crea ni se suma a ningún trabajo
+        if (signal && signal.aborted) return Promise.reject(signal.reason);
+
+        let flight = this.flights.get(key);
+
+        if (!flight) {
+            const controller = new AbortController();
+            flight = { controller, waiters: new Set(), deltas: [] };
+
+            const emit = text => {
+                flight.deltas.push(text);
+                for (const waiter of flight.waiters) {
+                    if (waiter.onDelta) waiter.onDelta(text);
+                }
+            };
+
+            this.flights.set(key, flight);
+            // Si todos se han ido antes de empezar, fn no llega a lanzarse
+            flight.promise = Promise.resolve()
+                .then(() => {
+                    if (controller.signal.aborted) throw controller.signal.reason;
+                    return fn(controller.signal, emit);
+                })
+                .finally(() => {
+                    if (this.flights.get(key) === flight) this.flights.delete(key);
+                });
+        }
+
+        return new Promise((resolve, reject) => {
+            const waiter = { onDelta };
+
+            flight.deltas.forEach(text => onDelta && onDelta(text));
+            flight.waiters.add(waiter);
+
+            const leave = () => {
+                flight.waiters.delete(waiter);
+                if (signal) signal.removeEventListener('abort', onAbort);
+            };
+
+            const onAbort = () => {
+                leave();
+                reject(signal.reason);
+                if (flight.waiters.size === 0) {
+                    if (this.flights.get(key) === flight) this.flights.delete(key);
+                    flight.controller.abort(signal.reason);
+                }
+            };
+
+            if (signal) signal.addEventListener('abort', onAbort);
+
+            flight.promise.then(
+                result => { leave(); resolve(result); },
+                error => { leave(); reject(error); }
+            );
+        });
+    }
+}
+
+module.exports = { SingleFlight };
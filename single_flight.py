@@ -0,0 +1,86 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Agrupa llamadas idénticas en curso dentro del proceso.
+
+    El primer hilo que pide una clave ejecuta la función; los que llegan
+    mientras tanto esperan y reciben el mismo resultado o la misma excepción.
+    Un hilo que deja de esperar por `timeout` no interrumpe el trabajo
+    compartido, que sigue para los demás.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Tiempo agotado esperando a otra petición idéntica: {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Versión para asyncio de SingleFlight, dentro de un mismo bucle de eventos.
+
+    La función se ejecuta en una tarea propia y todos los que piden la clave
+    esperan a esa tarea. Quien deja de esperar (cancelado o por timeout) solo
+    se retira él; la tarea se cancela cuando ya no queda nadie esperándola.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        # asyncio solo se importa aquí: los analizadores síncronos no lo necesitan
+        import asyncio
+        call = self._calls.get(key)
+        if call is None:
+            call = {'task': asyncio.ensure_future(fn(*args, **kwargs)), 'waiters': 0}
+            self._calls[key] = call
+            call['task'].add_done_callback(lambda _: self._forget(key, call))
+
+        call['waiters'] += 1
+        try:
+            return await asyncio.shield(call['task'])
+        finally:
+            call['waiters'] -= 1
+            if call['waiters'] == 0 and not call['task'].done():
+                call['task'].cancel()
+                self._forget(key, call)
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+# Instancia compartida por todos los analizadores del proceso
+flights = SingleFlight()
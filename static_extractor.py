@@ -0,0 +1,358 @@
+"""Extracción de la ficha de producto sin navegador.
+
+La mayoría de tiendas incluyen en el HTML un bloque JSON-LD de schema.org
+(Product/Offer) y etiquetas OpenGraph con nombre, precio, moneda,
+disponibilidad, imágenes y GTIN. Aquí se recorre la respuesta HTTP una sola
+vez con HTMLParser y se devuelve el mismo `product_info` que
+ProductScraper, así que solo las páginas que no traen datos suficientes
+necesitan Playwright.
+"""
+import json
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+from metrics import span, RETAILER_ERRORS
+from url_fingerprint import detect_retailer, fingerprint_url
+from price_parser import find_prices, pick_prices, parse_amount
+from feature_filter import select_features, MAX_FEATURES
+
+MIN_PRICE = 1
+
+_SCHEMA_PREFIX = re.compile(r'^https?://schema\.org/', re.IGNORECASE)
+
+# Respuestas con las que las tiendas suelen bloquear a los clientes sin navegador
+BLOCKED_STATUSES = {401, 403, 429, 503}
+
+# Páginas de verificación anti-bot y muros de consentimiento
+_WALL_MARKERS = [
+    ('captcha', re.compile(
+        r'captcha|are you a (?:human|robot)|robot check|verify you are human|no eres un robot|'
+        r'just a moment|cf-chl-|datadome|perimeterx|access denied|acceso denegado',
+        re.IGNORECASE
+    )),
+    ('consent', re.compile(r'consent-wall|cookie-wall|didomi-popup|onetrust-consent|usercentrics', re.IGNORECASE))
+]
+
+
+def parse_price_value(value):
+    """Precio de un dato estructurado (JSON-LD, meta): "1099.00", 1099, "1.099,00" """
+    price = parse_amount(value)
+    return price if price and price > MIN_PRICE else None
+
+
+def wall_reason(html):
+    """'captcha' o 'consent' si el HTML parece un muro en lugar de la ficha"""
+    for reason, pattern in _WALL_MARKERS:
+        if pattern.search(html or ''):
+            return reason
+    return None
+
+
+class ProductPageParser(HTMLParser):
+    """Una pasada por el HTML: bloques JSON-LD, <meta>, el primer <h1>,
+    elementos de precio, <li> y filas <th>/<td> de tablas de especificaciones"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld = []
+        self.meta = {}
+        self.h1 = None
+        self.prices = []
+        self.items = []
+        self.rows = []
+        # Capturas abiertas: [tag, tipo, partes, clases, anidadas]; `anidadas`
+        # cuenta las etiquetas iguales abiertas dentro que no son capturas
+        self._open = []
+        self._row = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').lower()
+
+        if tag == 'meta':
+            key = attrs.get('property') or attrs.get('name') or attrs.get('itemprop')
+            if key and attrs.get('content'):
+                self.meta.setdefault(key.lower(), attrs['content'])
+            return
+        if tag == 'script':
+            if (attrs.get('type') or '').lower() == 'application/ld+json':
+                self._open.append([tag, 'json_ld', [], None, 0])
+            return
+
+        if attrs.get('data-price'):
+            self.prices.extend(find_prices(attrs['data-price'], hint=classes, require_currency=False))
+        if tag == 'h1' and self.h1 is None:
+            self._open.append([tag, 'h1', [], None, 0])
+        elif tag == 'li':
+            self._open.append([tag, 'li', [], None, 0])
+        elif tag == 'tr':
+            self._row = []
+        elif tag in ('th', 'td') and self._row is not None:
+            self._open.append([tag, 'cell', [], None, 0])
+        elif ('price' in classes or 'pvp' in classes) and not attrs.get('data-price'):
+            # Las clases ayudan a distinguir el precio tachado (ver price_parser)
+            self._open.append([tag, 'price', [], classes, 0])
+        else:
+            # <span class="price"><span>1.299</span>,00 €</span>: el primer
+            # </span> es del <span> de dentro, no cierra la captura
+            capture = self._innermost(tag)
+            if capture is not None:
+                capture[4] += 1
+
+    def handle_data(self, data):
+        for capture in self._open:
+            capture[2].append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'tr' and self._row is not None:
+            if len(self._row) >= 2 and self._row[0] and self._row[1]:
+                self.rows.append(f"{self._row[0]}: {self._row[1]}")
+            self._row = None
+            return
+
+        capture = self._innermost(tag)
+        if capture is None:
+            return
+        if capture[4]:
+            capture[4] -= 1
+            return
+        self._open.remove(capture)
+        _, kind, parts, classes, _ = capture
+        self._close(kind, ''.join(parts), classes)
+
+    def _innermost(self, tag):
+        for capture in reversed(self._open):
+            if capture[0] == tag:
+                return capture
+        return None
+
+    def _close(self, kind, text, classes=None):
+        if kind == 'json_ld':
+            self.json_ld.append(text)
+            return
+        text = ' '.join(text.split())
+        if kind == 'h1':
+            self.h1 = text
+        elif kind == 'li':
+            self.items.append(text)
+        elif kind == 'cell' and self._row is not None:
+            self._row.append(text)
+        elif kind == 'price':
+            self.prices.extend(find_prices(text, hint=classes))
+
+
+def _types(node):
+    types = node.get('@type') or []
+    return {str(value).lower() for value in (types if isinstance(types, list) else [types])}
+
+
+def _walk(data):
+    """Todos los objetos de un bloque JSON-LD (listas, @graph, anidados)"""
+    if isinstance(data, list):
+        for item in data:
+            yield from _walk(item)
+    elif isinstance(data, dict):
+        yield data
+        for value in data.values():
+            if isinstance(value, (list, dict)):
+                yield from _walk(value)
+
+
+def find_product_node(blocks):
+    """Primer nodo Product (o ProductGroup) de los bloques JSON-LD"""
+    for block in blocks:
+        try:
+            data = json.loads(block)
+        except ValueError:
+            # Hay tiendas que dejan saltos de línea sin escapar dentro de las cadenas
+            try:
+                data = json.loads(re.sub(r'[\r\n\t]+', ' ', block))
+            except ValueError:
+                continue
+        for node in _walk(data):
+            if _types(node) & {'product', 'productgroup'}:
+                return node
+    return None
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _text(value):
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@id')
+    return ' '.join(str(value).split()) if value else None
+
+
+def _offer_prices(product):
+    """(precio actual, precio original, moneda, disponibilidad) de las ofertas"""
+    offers = product.get('offers') or []
+    offers = offers if isinstance(offers, list) else [offers]
+    current, original, currency, availability = [], [], None, None
+
+    for offer in offers:
+        if not isinstance(offer, dict):
+            continue
+        currency = currency or offer.get('priceCurrency')
+        availability = availability or offer.get('availability')
+        for key in ('price', 'lowPrice'):
+            price = parse_price_value(offer.get(key))
+            if price:
+                current.append(price)
+                break
+        specifications = offer.get('priceSpecification') or []
+        for specification in specifications if isinstance(specifications, list) else [specifications]:
+            if not isinstance(specification, dict):
+                continue
+            price = parse_price_value(specification.get('price'))
+            kind = _SCHEMA_PREFIX.sub('', str(specification.get('priceType') or '')).lower()
+            if price and kind in ('strikethroughprice', 'listprice', 'msrp'):
+                original.append(price)
+            elif price and not kind:
+                current.append(price)
+            currency = currency or specification.get('priceCurrency')
+        for nested in offer.get('offers') or []:
+            if isinstance(nested, dict):
+                price = parse_price_value(nested.get('price'))
+                if price:
+                    current.append(price)
+
+    availability = _SCHEMA_PREFIX.sub('', availability) if isinstance(availability, str) else None
+    return (min(current) if current else None, max(original) if original else None, currency, availability)
+
+
+def _images(product, meta):
+    images = []
+    candidates = product.get('image') if product else None
+    for image in candidates if isinstance(candidates, list) else [candidates]:
+        if isinstance(image, dict):
+            image = image.get('url') or image.get('contentUrl')
+        if image and image not in images:
+            images.append(image)
+    for key in ('og:image', 'twitter:image', 'product:image'):
+        if meta.get(key) and meta[key] not in images:
+            images.append(meta[key])
+    return images
+
+
+def extract_product_info(html, url, max_features=MAX_FEATURES):
+    """product_info (mismo formato que ProductScraper) a partir del HTML.
+
+    Además de las claves de ProductScraper incluye currency, availability,
+    images, brand, sku, gtin y `source`, que indica de dónde salieron el
+    nombre y el precio ('json-ld', 'opengraph' o 'html').
+    """
+    parser = ProductPageParser()
+    parser.feed(html)
+    parser.close()
+
+    product = find_product_node(parser.json_ld) or {}
+    meta = parser.meta
+    current, original, currency, availability = _offer_prices(product) if product else (None, None, None, None)
+
+    source = 'json-ld' if product.get('name') else None
+    name = _text(product.get('name'))
+    if not name and meta.get('og:title'):
+        name, source = ' '.join(meta['og:title'].split()), 'opengraph'
+    if not name and parser.h1:
+        name, source = parser.h1, 'html'
+
+    if current is None:
+        current = parse_price_value(meta.get('product:price:amount') or meta.get('og:price:amount'))
+        currency = currency or meta.get('product:price:currency') or meta.get('og:price:currency')
+    html_current, html_original = pick_prices(parser.prices, MIN_PRICE)
+    if current is None and html_current:
+        current = html_current.value
+    if original is None and html_original and current is not None and html_original.value > current:
+        original = html_original.value
+    if current is not None and (currency or html_current):
+        currency = currency or 'EUR'
+
+    # Candidatas: propiedades del JSON-LD, <li> y filas de tablas; se quedan
+    # las mejor puntuadas para la categoría del producto (ver feature_filter)
+    candidates = []
+    properties = product.get('additionalProperty') or []
+    for prop in properties if isinstance(properties, list) else [properties]:
+        if isinstance(prop, dict) and prop.get('name') and prop.get('value') is not None:
+            candidates.append(f"{prop['name']}: {_text(prop['value'])}")
+    features = select_features(candidates + parser.items + parser.rows, fingerprint_url(url)['category'], max_features)
+
+    gtin = next((product[key] for key in ('gtin13', 'gtin', 'gtin12', 'gtin14', 'gtin8', 'ean') if product.get(key)), None)
+
+    info = {
+        'success': False,
+        'url': url,
+        'name': name or '',
+        'current_price': current,
+        'original_price': original if original and current and original > current else None,
+        'features': features,
+        'error': None,
+        'currency': currency,
+        'availability': availability,
+        'images': _images(product, meta),
+        'brand': _text(product.get('brand')),
+        'sku': _text(product.get('sku') or product.get('mpn')),
+        'gtin': str(gtin) if gtin else None,
+        'source': source
+    }
+    info['success'] = bool(info['name'] and (info['current_price'] or info['features']))
+    if not info['success']:
+        info['error'] = 'La página no trae datos suficientes del producto'
+    return info
+
+
+def _failure(url, error, blocked=None):
+    return {'success': False, 'url': url, 'error': error, 'blocked': blocked}
+
+
+def _from_response(url, status, html, retailer):
+    """product_info de una respuesta; `blocked` indica si parece un bloqueo"""
+    if status != 200:
+        RETAILER_ERRORS.inc(retailer=retailer, reason=f"http_{status}")
+        return _failure(url, f"HTTP {status}", f"http_{status}" if status in BLOCKED_STATUSES else None)
+
+    info = extract_product_info(html, url)
+    info['blocked'] = None
+    if not info['success'] or not info['current_price']:
+        # Los muros solo cuentan si además falta la ficha: muchas páginas
+        # completas incluyen el script del banner de cookies
+        info['blocked'] = wall_reason(html)
+    if not info['success']:
+        RETAILER_ERRORS.inc(retailer=retailer, reason=info['blocked'] or 'static_incomplete')
+    return info
+
+
+def fetch_product_info(url, fetch_client=None):
+    """Descarga la página con el cliente HTTP compartido y extrae la ficha"""
+    retailer = detect_retailer(urlparse(url).netloc)[0]
+    if fetch_client is None:
+        from http_client import get_fetch_client
+        fetch_client = get_fetch_client()
+
+    try:
+        with span('static_extract', retailer=retailer):
+            response = fetch_client.get(url)
+            return _from_response(url, response.status_code, response.text, retailer)
+    except Exception as e:
+        RETAILER_ERRORS.inc(retailer=retailer, reason=type(e).__name__)
+        return _failure(url, str(e))
+
+
+async def fetch_product_info_async(url, fetch_client=None):
+    """Versión asíncrona de fetch_product_info (aiohttp)"""
+    retailer = detect_retailer(urlparse(url).netloc)[0]
+    if fetch_client is None:
+        from http_client import get_fetch_client
+        fetch_client = get_fetch_client()
+
+    try:
+        with span('static_extract', retailer=retailer):
+            status, html = await fetch_client.get_text_async(url)
+            return _from_response(url, status, html, retailer)
+    except Exception as e:
+        RETAILER_ERRORS.inc(retailer=retailer, reason=type(e).__name__)
+        return _failure(url, str(e))
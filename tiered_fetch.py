@@ -0,0 +1,250 @@
+"""Descarga de fichas por niveles con memoria por dominio.
+
+Nivel 'static': una petición HTTP y static_extractor (JSON-LD, OpenGraph).
+Nivel 'browser': Playwright con ProductScraper.extract_info_async.
+
+Cada URL prueba primero el nivel estático y solo sube al navegador si faltan
+campos obligatorios o la respuesta es un bloqueo (403, captcha, muro de
+cookies). Los dominios que necesitan el navegador se recuerdan en SQLite para
+no repetir la petición estática inútil, y cada cierto tiempo se vuelve a
+probar el nivel estático por si la tienda ha cambiado.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from metrics import REGISTRY
+
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Campos sin los que la extracción estática no se da por buena
+REQUIRED_FIELDS = tuple(field for field in os.getenv('FETCH_REQUIRED_FIELDS', 'name,current_price').split(',') if field)
+
+# Segundos que un dominio se queda en el navegador antes de volver a probar HTTP
+REPROBE_SECONDS = float(os.getenv('FETCH_TIER_REPROBE', 24 * 3600))
+
+# Fallos estáticos seguidos (sin bloqueo) antes de pasar el dominio al navegador;
+# uno solo puede deberse a una ficha concreta mal maquetada
+ESCALATE_AFTER = int(os.getenv('FETCH_ESCALATE_AFTER', 2))
+
+FETCH_TIERS = REGISTRY.counter(
+    'comparador_fetch_tier_total', 'Extracciones de fichas por nivel (static/browser) y resultado'
+)
+
+
+def domain_of(url):
+    return (urlparse(url).hostname or '').lower()
+
+
+def missing_fields(info, required=REQUIRED_FIELDS):
+    return [field for field in required if not (info or {}).get(field)]
+
+
+class DomainTierMemory:
+    """Nivel elegido para cada dominio, persistido en SQLite.
+
+    Igual que ProductKeyRegistry, si la base de datos no está disponible
+    se trabaja solo en memoria.
+    """
+
+    def __init__(self, path=None, reprobe_seconds=REPROBE_SECONDS, escalate_after=ESCALATE_AFTER):
+        self.path = Path(path) if path else CACHE_DIR / 'fetch_tiers.sqlite3'
+        self.reprobe_seconds = reprobe_seconds
+        self.escalate_after = escalate_after
+        self._domains = {}
+        self._lock = threading.Lock()
+        self._db = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS domain_tiers (
+                    domain TEXT PRIMARY KEY,
+                    tier TEXT NOT NULL,
+                    reason TEXT,
+                    static_failures INTEGER NOT NULL,
+                    probe_after REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+            for row in self._db.execute(
+                'SELECT domain, tier, reason, static_failures, probe_after FROM domain_tiers'
+            ):
+                self._domains[row[0]] = {
+                    'tier': row[1], 'reason': row[2], 'static_failures': row[3], 'probe_after': row[4]
+                }
+        except sqlite3.Error as e:
+            print(f"Memoria de niveles no disponible, se usará solo memoria: {str(e)}")
+            self._db = None
+
+    def get(self, domain):
+        with self._lock:
+            entry = self._domains.get(domain)
+            return dict(entry) if entry else None
+
+    def choose(self, domain, now=None):
+        """'browser' si el dominio está fijado al navegador y aún no toca volver a probar"""
+        entry = self.get(domain)
+        if entry and entry['tier'] == 'browser' and (now or time.time()) < entry['probe_after']:
+            return 'browser'
+        return 'static'
+
+    def is_blocked(self, domain, now=None):
+        """Si el dominio bloquea las peticiones HTTP sueltas (no solo le faltan datos)"""
+        entry = self.get(domain)
+        return bool(entry and self.choose(domain, now) == 'browser' and _is_block(entry['reason']))
+
+    def record(self, domain, static_ok, reason=None, browser_ok=None):
+        """Apunta el resultado de una extracción.
+
+        `static_ok` es None si no se probó el nivel estático. Un bloqueo
+        fija el navegador en el acto (salvo que el navegador tampoco haya
+        funcionado); la falta de campos, tras `escalate_after` fallos
+        seguidos y solo si el navegador sí los obtuvo.
+        """
+        if static_ok is None:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._domains.get(domain) or {
+                'tier': 'static', 'reason': None, 'static_failures': 0, 'probe_after': 0.0
+            }
+            if static_ok:
+                entry = {'tier': 'static', 'reason': None, 'static_failures': 0, 'probe_after': 0.0}
+            else:
+                entry['static_failures'] += 1
+                entry['reason'] = reason
+                escalate = (
+                    (_is_block(reason) and browser_ok is not False)
+                    or (entry['static_failures'] >= self.escalate_after and browser_ok)
+                )
+                if escalate:
+                    entry['tier'] = 'browser'
+                    entry['probe_after'] = now + self.reprobe_seconds
+            self._domains[domain] = entry
+            self._save(domain, entry, now)
+
+    def _save(self, domain, entry, now):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO domain_tiers (domain, tier, reason, static_failures, probe_after, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (domain, entry['tier'], entry['reason'], entry['static_failures'], entry['probe_after'], now)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error guardando nivel de {domain}: {str(e)}")
+
+    def snapshot(self):
+        with self._lock:
+            return {domain: dict(entry) for domain, entry in self._domains.items()}
+
+
+def _is_block(reason):
+    return bool(reason) and (reason.startswith('http_') or reason in ('captcha', 'consent'))
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_tier_memory():
+    """Memoria de niveles compartida por todo el proceso"""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = DomainTierMemory(os.getenv('FETCH_TIERS_PATH'))
+    return _memory
+
+
+class _LazyBrowserPool:
+    """BrowserPool que solo se arranca si alguna URL necesita el navegador.
+
+    Si no se puede arrancar, el error se guarda y se repite para el resto
+    del lote en lugar de relanzar Chromium por cada URL.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self._owned = False
+        self._error = None
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        async with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self.pool is None:
+                pool = None
+                try:
+                    from browser_pool import BrowserPool
+                    pool = BrowserPool()
+                    await pool.start()
+                except Exception as e:
+                    self._error = e
+                    # Lo que haya llegado a arrancar (playwright, algún navegador)
+                    if pool is not None:
+                        try:
+                            await pool.close()
+                        except Exception as close_error:
+                            print(f"Error cerrando el navegador a medio arrancar: {str(close_error)}")
+                    raise
+                self.pool, self._owned = pool, True
+        return self.pool
+
+    async def close(self):
+        if self._owned:
+            await self.pool.close()
+
+
+class TieredFetcher:
+    """Extrae fichas con el nivel más barato que funciona para cada dominio"""
+
+    def __init__(self, scraper, memory=None, required=REQUIRED_FIELDS):
+        self.scraper = scraper
+        self.memory = memory or get_tier_memory()
+        self.required = required
+
+    async def fetch(self, url, browser):
+        domain = domain_of(url)
+        static_info = None
+        if self.memory.choose(domain) == 'static':
+            static_info = await self.scraper.extract_static_async(url)
+            missing = missing_fields(static_info, self.required)
+            if static_info.get('success') and not missing:
+                self.memory.record(domain, True)
+                FETCH_TIERS.inc(tier='static', result='ok')
+                return static_info
+            reason = static_info.get('blocked') or 'missing_' + '_'.join(missing or ['data'])
+            FETCH_TIERS.inc(tier='static', result=reason)
+            print(f"Extracción estática insuficiente ({reason}), se usa el navegador: {url}")
+
+        try:
+            info = await self.scraper.extract_info_async(url, await browser.get())
+        except Exception as e:
+            # Sin Playwright (o sin poder lanzarlo) queda lo que dio el nivel estático
+            print(f"Navegador no disponible: {str(e)}")
+            info = {'success': False, 'url': url, 'error': str(e)}
+        browser_ok = bool(info.get('success')) and not missing_fields(info, self.required)
+        FETCH_TIERS.inc(tier='browser', result='ok' if browser_ok else 'incomplete')
+        if static_info is not None:
+            self.memory.record(domain, False, reason, browser_ok)
+
+        if info.get('success') or not (static_info and static_info.get('success')):
+            return info
+        return static_info
+
+    async def fetch_many(self, urls, pool=None):
+        """Extrae varias URLs en paralelo; el navegador se arranca solo si hace falta"""
+        browser = _LazyBrowserPool(pool)
+        try:
+            return await asyncio.gather(*(self.fetch(url, browser) for url in urls))
+        finally:
+            await browser.close()
@@ -0,0 +1,220 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlparse, unquote
+
+# Léxicos: se compilan una sola vez en una única expresión regular
+BRANDS = [
+    'samsung', 'lg', 'philips', 'bosch', 'siemens', 'balay', 'whirlpool', 'apple', 'hp',
+    'lenovo', 'acer', 'asus', 'msi', 'sony', 'xiaomi', 'tcl', 'hisense', 'panasonic',
+    'dell', 'huawei', 'honor', 'oppo', 'realme', 'motorola', 'nokia', 'google', 'aeg',
+    'electrolux', 'beko', 'teka', 'candy', 'hoover', 'haier', 'miele', 'indesit',
+    'cecotec', 'rowenta', 'dyson', 'logitech', 'razer', 'corsair', 'benq', 'aoc',
+    'gigabyte', 'microsoft', 'nintendo', 'pccom', 'amd', 'intel', 'nvidia', 'sharp',
+    'toshiba', 'jbl', 'bose', 'sennheiser', 'garmin', 'fitbit', 'canon', 'nikon',
+    'fujifilm', 'epson', 'brother', 'kingston', 'crucial', 'sandisk', 'wd', 'seagate'
+]
+
+CATEGORIES = {
+    'tv': ['tv', 'televisor', 'televisores', 'television', 'smart-tv', 'smarttv'],
+    'telefono': ['telefono', 'smartphone', 'movil', 'moviles', 'iphone'],
+    'portatil': ['portatil', 'portatiles', 'laptop', 'notebook', 'ultrabook', 'macbook', 'chromebook'],
+    'sobremesa': ['sobremesa', 'ordenador', 'pc'],
+    'tablet': ['tablet', 'tableta', 'ipad'],
+    'nevera': ['nevera', 'frigorifico', 'frigorificos', 'combi', 'congelador'],
+    'lavadora': ['lavadora', 'lavadoras', 'lavasecadora'],
+    'secadora': ['secadora', 'secadoras'],
+    'lavavajillas': ['lavavajillas'],
+    'monitor': ['monitor', 'monitores'],
+    'auriculares': ['auriculares', 'headphones', 'earbuds'],
+    'consola': ['consola', 'playstation', 'ps5', 'xbox', 'switch'],
+    'tarjeta_grafica': ['grafica', 'graficas']
+}
+
+FEATURES = [
+    'wifi', 'smart', 'digital', 'oled', 'qled', 'neo qled', 'mini led', 'led', 'uhd', '4k', '8k',
+    'full hd', 'fhd', 'hdr', 'hdr10', 'dolby vision', 'dolby atmos', '5g', '4g', 'nfc',
+    'bluetooth', 'inverter', 'no frost', 'gaming', 'ssd', 'hdd', 'ddr4', 'ddr5',
+    'ips', 'va', 'curvo', '144hz', '165hz', '240hz', '120hz', 'bomba de calor'
+]
+
+_CATEGORY_BY_WORD = {word: category for category, words in CATEGORIES.items() for word in words}
+
+
+def _alternatives(words):
+    # Las alternativas más largas primero para que "neo qled" gane a "qled"
+    return '|'.join(re.escape(word).replace(r'\ ', r'\s') for word in sorted(words, key=len, reverse=True))
+
+
+_NUMBER = r'\d+(?:[.,]\d+)?'
+
+TOKEN_PATTERN = re.compile(
+    r'(?<![a-z0-9])(?:'
+    rf'(?P<size>{_NUMBER})\s?(?:pulgadas|pulg|inch|"|\'\')'
+    rf'|(?P<capacity>{_NUMBER})\s?(?P<unit>tb|gb|kg|l|litros|mah|w)'
+    rf'|(?P<feature>{_alternatives(FEATURES)})'
+    rf'|(?P<brand>{_alternatives(BRANDS)})'
+    rf'|(?P<category>{_alternatives(_CATEGORY_BY_WORD)})'
+    r'|(?P<model>(?=[a-z]*\d)(?=\d*[a-z])[a-z0-9]{4,})'
+    r'|(?P<number>\d{2,3})'
+    r'|(?P<word>[a-zñáéíóúü]{3,})'
+    r')(?![a-z0-9])'
+)
+
+STOPWORDS = {
+    'con', 'para', 'por', 'del', 'las', 'los', 'una', 'uno', 'sin', 'the', 'and', 'with',
+    'color', 'negro', 'blanco', 'plata', 'gris', 'azul', 'rojo', 'html', 'product',
+    'producto', 'reacondicionado', 'nuevo', 'version', 'edicion', 'pack'
+}
+
+# Parsers de URL por tienda: devuelven (sku, slug)
+_MEDIAMARKT_SLUG = re.compile(r'^_?(?P<slug>.+?)(?:-(?P<sku>\d{5,}))?(?:\.html)?$')
+_AMAZON_SKU = re.compile(r'/(?:dp|gp/product)/(?P<sku>[A-Z0-9]{10})')
+_ELCORTEINGLES_SLUG = re.compile(r'^(?P<sku>A\d{6,}|MP_\d+(?:_\d+)?)-(?P<slug>.+)$', re.IGNORECASE)
+
+
+def _segments(path):
+    return [segment for segment in path.split('/') if segment]
+
+
+def _parse_pccomponentes(path):
+    segments = _segments(path)
+    return None, segments[-1] if segments else ''
+
+
+def _parse_mediamarkt(path):
+    segments = _segments(path)
+    match = _MEDIAMARKT_SLUG.match(segments[-1] if segments else '')
+    if not match:
+        return None, ''
+    return match.group('sku'), match.group('slug')
+
+
+def _parse_amazon(path):
+    match = _AMAZON_SKU.search(path)
+    segments = _segments(path)
+    slug = ''
+    for index, segment in enumerate(segments):
+        if segment in ('dp', 'gp'):
+            slug = segments[index - 1] if index > 0 else ''
+            break
+    return (match.group('sku') if match else None), slug
+
+
+def _parse_elcorteingles(path):
+    for segment in reversed(_segments(path)):
+        match = _ELCORTEINGLES_SLUG.match(segment)
+        if match:
+            return match.group('sku').upper(), match.group('slug')
+    return _parse_generic(path)
+
+
+def _parse_generic(path):
+    segments = _segments(path)
+    slug = segments[-1] if segments else ''
+    return None, re.sub(r'\.html?$', '', slug)
+
+
+RETAILERS = {
+    'pccomponentes.com': ('pccomponentes', _parse_pccomponentes),
+    'mediamarkt.es': ('mediamarkt', _parse_mediamarkt),
+    'amazon.es': ('amazon', _parse_amazon),
+    'elcorteingles.es': ('elcorteingles', _parse_elcorteingles),
+    'carrefour.es': ('carrefour', _parse_generic),
+    'fnac.es': ('fnac', _parse_generic)
+}
+
+
+def detect_retailer(host):
+    """Devuelve (nombre_tienda, parser) para el dominio, o un parser genérico"""
+    host = host.lower().split(':')[0]
+    for domain, retailer in RETAILERS.items():
+        if host == domain or host.endswith('.' + domain):
+            return retailer
+    return host.removeprefix('www.'), _parse_generic
+
+
+@lru_cache(maxsize=4096)
+def fingerprint_url(url):
+    """Extrae una descripción estructurada del producto a partir de su URL.
+
+    El resultado se cachea por URL y se comparte entre llamadas: no modificarlo.
+    """
+    parsed = urlparse(unquote(url))
+    retailer, parse_path = detect_retailer(parsed.netloc)
+    sku, slug = parse_path(parsed.path)
+
+    text = slug.lower().replace('-', ' ').replace('_', ' ').replace('+', ' ')
+
+    fingerprint = {
+        'retailer': retailer,
+        'sku': sku,
+        'slug': slug,
+        'brand': None,
+        'model': None,
+        'category': None,
+        'capacity': [],
+        'size': None,
+        'features': [],
+        'name': []
+    }
+    numbers = []
+
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'unit':
+            kind = 'capacity'
+        value = match.group(0)
+
+        if kind == 'size':
+            if fingerprint['size'] is None:
+                fingerprint['size'] = match.group('size').replace(',', '.') + '"'
+        elif kind == 'capacity':
+            value = value.replace(' ', '')
+            if value not in fingerprint['capacity']:
+                fingerprint['capacity'].append(value)
+        elif kind == 'feature':
+            value = ' '.join(value.split())
+            if value not in fingerprint['features']:
+                fingerprint['features'].append(value)
+        elif kind == 'brand':
+            if fingerprint['brand'] is None:
+                fingerprint['brand'] = value
+        elif kind == 'category':
+            if fingerprint['category'] is None:
+                fingerprint['category'] = _CATEGORY_BY_WORD[value]
+        elif kind == 'model':
+            if fingerprint['model'] is None:
+                fingerprint['model'] = value
+            elif value not in fingerprint['name']:
+                fingerprint['name'].append(value)
+        elif kind == 'number':
+            numbers.append(int(value))
+        elif value not in STOPWORDS and value not in fingerprint['name']:
+            fingerprint['name'].append(value)
+
+    # En TV y monitores el tamaño suele venir sin unidad ("tv-qled-55-samsung")
+    if fingerprint['size'] is None and fingerprint['category'] in ('tv', 'monitor'):
+        sizes = [number for number in numbers if 19 <= number <= 100]
+        if sizes:
+            fingerprint['size'] = f'{sizes[0]}"'
+
+    fingerprint['name'] = fingerprint['name'][:6]
+    return fingerprint
+
+
+def describe(fingerprint):
+    """Descripción compacta para el prompt del LLM"""
+    parts = [
+        fingerprint['brand'],
+        fingerprint['model'],
+        *fingerprint['name'],
+        fingerprint['category'],
+        fingerprint['size'],
+        *fingerprint['capacity'],
+        *fingerprint['features']
+    ]
+    description = ' '.join(part for part in parts if part)
+    if not description and fingerprint['sku']:
+        # URLs sin texto (p. ej. amazon.es/dp/ASIN): al menos tienda y referencia
+        description = f"{fingerprint['retailer']} {fingerprint['sku']}"
+    return description